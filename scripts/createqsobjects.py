@@ -1,11 +1,27 @@
 #!/usr/bin/python3
 # Amazon Security Lake Quicksight Asset Deployment Tool
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import threading
+import copy
+import time
 import os
 import sys
 import shutil
 import json
 
+import qstool
+
+# bundles sanitized at the same time
+BUNDLE_WORKERS = 4
+
+# every template merged into one bundle, deployed as a whole
+MERGED_BUNDLE = 'merged-bundle.json'
+
+# targets deployed at the same time, and api calls in flight across all of them
+TARGET_WORKERS = 4
+TARGET_CALLS = 32
 
 INPUTS_DIR = str((Path(os.path.abspath(__file__))).parent.parent).replace('\\', '/') + '/cdk-lakeformation-permissions/source/cdk.json'
 with open(INPUTS_DIR) as file:
@@ -15,13 +31,18 @@ aws_region = parameters['context']['region']
 aws_sl_region = parameters['context']['slregion']
 aws_account_id = parameters['context']['AWSAccountID']
 aws_principal_id = parameters['context']['QuickSightUserARN']
-    
-def main(aws_region, aws_account_id, aws_principal_id):
+
+def main(aws_region, aws_account_id, aws_principal_id, bundles=BUNDLE_WORKERS, ingest=False, incremental=False, prune=False, policy=None):
 
     """
-    # The main function in this script will take a users input
-    # '-i /path/to/some/file/file.parquet' and search for parquet
-    # if the schema is valid OCSF
+    # The main function in this script sanitizes every asset template
+    # into the staging directory, merges them into a single bundle so the
+    # datasets and datasources they share are deployed once, and deploys
+    # it with qstool, removing any previous deployment first. With ingest
+    # the SPICE datasets are loaded before it returns, with incremental
+    # the time-based datasets refresh incrementally, with prune the merged
+    # datasets keep only the columns the analyses and dashboards use, with
+    # policy each dataset is imported into SPICE or queried directly by it.
     """
 
     # Store the absolute path of this script in path variable
@@ -29,24 +50,131 @@ def main(aws_region, aws_account_id, aws_principal_id):
 
     # Set relative path values for script runtime
     TEMPLATES_DIR = BASE_DIR + '/asset-templates/'
-    SCRIPTS_DIR = BASE_DIR + '/scripts/'
     STAGING_DIR = BASE_DIR + '/qs-lake-staging/'
-    
+
     # Recursive search for all files with .json extension in input directory path
-    pathlist = Path(TEMPLATES_DIR).glob('*.json')
-    files = os.listdir(TEMPLATES_DIR)
-    
-    # Fetching all the files to directory
-    for file_name in files:
-       shutil.copy(TEMPLATES_DIR+file_name, STAGING_DIR+file_name)
-       os.system(f"python3 {SCRIPTS_DIR}qstool.py --verbose --assets {STAGING_DIR+file_name} sanitize all --principal {aws_principal_id}  --region {aws_region} --slregion {aws_sl_region} --account {aws_account_id}")
-       os.system(f"python3 {SCRIPTS_DIR}qstool.py --verbose --assets {STAGING_DIR+file_name} delete all --confirm -i")
-       
-    for file_name in files:
-       shutil.copy(TEMPLATES_DIR+file_name, STAGING_DIR+file_name)
-       os.system(f"python3 {SCRIPTS_DIR}qstool.py --verbose --assets {STAGING_DIR+file_name} sanitize all --principal {aws_principal_id}  --region {aws_region} --slregion {aws_sl_region} --account {aws_account_id}")
-       os.system(f"python3 {SCRIPTS_DIR}qstool.py --verbose --assets {STAGING_DIR+file_name} create all -i")
-       
+    files = sorted(p.name for p in Path(TEMPLATES_DIR).glob('*.json'))
+
+    # one pooled client and gateway for every run, so the rate limits
+    # and throttling backoff apply to all calls made by this process
+    connection = qstool.Connection()
+
+    # sanitize a fresh copy of the template
+    def Sanitize(file_name):
+        try:
+            shutil.copy(TEMPLATES_DIR+file_name, STAGING_DIR+file_name)
+        except OSError as e:
+            print(f"{file_name}: !! {e}")
+            return 255
+        return qstool.main(['--verbose', '--assets', STAGING_DIR+file_name, 'sanitize', 'all', '--principal', str(aws_principal_id), '--region', str(aws_region), '--slregion', str(aws_sl_region), '--account', str(aws_account_id)] + (['--incremental'] if incremental else []) + (['--mode-policy', policy] if policy else []), connection, label=file_name)
+
+    # the merged bundle is removed and created again as a whole, templates
+    # defining a shared asset differently fail the merge and the deploy
+    statuses = {}
+    try:
+        with ThreadPoolExecutor(max_workers=bundles) as pool:
+            for file_name, status in zip(files, pool.map(Sanitize, files)):
+                statuses[('sanitize', file_name)] = status
+
+        if not any(statuses.values()):
+            merged = STAGING_DIR + MERGED_BUNDLE
+            phases = [('merge', ['merge', 'all'] + [STAGING_DIR+f for f in files])]
+            if prune: phases.append(('prune', ['prune', 'all']))
+            phases += [('delete', ['delete', 'all', '--confirm', '-i']), ('create', ['create', 'all', '-i'] + (['--ingest'] if ingest else []))]
+            for phase, action in phases:
+                statuses[(phase, MERGED_BUNDLE)] = qstool.main(['--verbose', '--assets', merged] + action, connection, label=MERGED_BUNDLE)
+                if statuses[(phase, MERGED_BUNDLE)]: break
+    finally:
+        connection.metrics.write(qstool.DEF_METRICS)
+        connection.close()
+
+    for (phase, file_name), status in statuses.items():
+        print(f"{phase} {file_name}: {'ok' if not status else f'failed ({status})'}")
+    return 1 if any(statuses.values()) else 0
+
+def fanout(targets, parallel=TARGET_WORKERS, calls=TARGET_CALLS, workers=qstool.DEF_WORKERS, ingest=False, incremental=False, prune=False, policy=None):
+
+    """
+    # The fanout function deploys the merged asset templates to every
+    # target account and region, [{ account, region, slregion, role,
+    # principal }], sanitizing a copy of the bundle for each in memory.
+    # Up to parallel targets are deployed at once with up to workers
+    # api calls each, and no more than calls in flight across all.
+    """
+
+    BASE_DIR = str((Path(os.path.abspath(__file__))).parent.parent).replace('\\', '/')
+    TEMPLATES_DIR = BASE_DIR + '/asset-templates/'
+    STAGING_DIR = BASE_DIR + '/qs-lake-staging/'
+    files = sorted(p.name for p in Path(TEMPLATES_DIR).glob('*.json'))
+
+    # the templates are merged once, every target sanitizes its own copy
+    # and templates defining a shared asset differently fail every target
+    templates = qstool.Bundle()
+    if qstool.main(['merge', 'all'] + [TEMPLATES_DIR+f for f in files], label=MERGED_BUNDLE, bundle=templates):
+        print(f"merge {MERGED_BUNDLE}: failed")
+        return 1
+
+    # sessions are pooled by role and region, calls are capped across every target
+    # including the role assumptions, whose metrics are kept apart from the targets'
+    limit = threading.BoundedSemaphore(calls)
+    sessions = qstool.Sessions(limit=limit)
+
+    def Deploy(target):
+        label = f"{target['account']}/{target['region']}"
+        name = f"{target['account']}-{target['region']}"
+        statuses = {}
+        started = time.perf_counter()
+        connection = None
+        try:
+            connection = qstool.Connection(sessions.get(target['region'], target.get('role')), workers=workers, limit=limit)
+            bundle = qstool.Bundle(copy.deepcopy(templates.assets))
+            common = ['--verbose', '--account', str(target['account']), '--workers', str(workers), '--state', STAGING_DIR + f"state-{name}.json"]
+            phases = [('sanitize', ['sanitize', 'all', '--principal', str(target['principal']), '--region', str(target['region']), '--slregion', str(target.get('slregion') or target['region'])] + (['--incremental'] if incremental else []) + (['--mode-policy', policy] if policy else []))]
+            if prune: phases.append(('prune', ['prune', 'all']))
+            phases += [('delete', ['delete', 'all', '--confirm', '-i']), ('create', ['create', 'all', '-i'] + (['--ingest'] if ingest else []))]
+            for phase, action in phases:
+                statuses[phase] = qstool.main(action + common, connection, label=label, bundle=bundle)
+                if statuses[phase]: break
+        except Exception as e:
+            print(f"{label}: !! {e}")
+            statuses['connect'] = 255
+        finally:
+            if connection:
+                connection.metrics.write(STAGING_DIR + f"metrics-{name}.json")
+                connection.close()
+        return statuses, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        results = list(pool.map(Deploy, targets))
+    if sessions.metrics.apis:
+        sessions.metrics.write(STAGING_DIR + "metrics-sts.json")
+
+    failed = 0
+    for target, (statuses, seconds) in zip(targets, results):
+        ok = not any(statuses.values())
+        if not ok: failed += 1
+        phases = ', '.join(f"{phase} {'ok' if not status else f'failed ({status})'}" for phase, status in statuses.items())
+        print(f"{target['account']}/{target['region']}: {'ok' if ok else 'failed'} in {seconds:.1f}s - {phases}")
+    print(f"deployed {len(targets) - failed} of {len(targets)} targets")
+    return 1 if failed else 0
+
 if __name__ == '__main__':
 
-    main(aws_region, aws_account_id, aws_principal_id)
+    cliparser = argparse.ArgumentParser(description="Amazon Security Lake Quicksight Asset Deployment")
+    cliparser.add_argument('--bundles', type=int, default=BUNDLE_WORKERS, help=f"Asset bundles sanitized concurrently ({BUNDLE_WORKERS})")
+    cliparser.add_argument('--ingest', action='store_true', help="Ingest the SPICE datasets once deployed, failing if any ingestion fails")
+    cliparser.add_argument('--incremental', action='store_true', help="Refresh the time-based SPICE datasets incrementally every hour, fully once a week")
+    cliparser.add_argument('--prune', action='store_true', help="Drop the dataset columns no analysis or dashboard uses before deploying")
+    cliparser.add_argument('--mode-policy', help="JSON policy file choosing SPICE or DIRECT_QUERY for each dataset")
+    cliparser.add_argument('--targets', help="JSON list of target accounts to deploy to instead, each { account, region, slregion, role, principal }")
+    cliparser.add_argument('--parallel', type=int, default=TARGET_WORKERS, help=f"Targets deployed at the same time ({TARGET_WORKERS})")
+    cliparser.add_argument('--calls', type=int, default=TARGET_CALLS, help=f"API calls in flight across all targets ({TARGET_CALLS})")
+    cliparser.add_argument('--workers', type=int, default=qstool.DEF_WORKERS, help=f"API calls in flight for each target ({qstool.DEF_WORKERS})")
+    cliargs = cliparser.parse_args()
+
+    if cliargs.targets:
+        with open(cliargs.targets) as file:
+            targets = json.load(file)
+        sys.exit(fanout(targets, max(cliargs.parallel, 1), max(cliargs.calls, 1), max(cliargs.workers, 1), cliargs.ingest, cliargs.incremental, cliargs.prune, cliargs.mode_policy))
+
+    sys.exit(main(aws_region, aws_account_id, aws_principal_id, max(cliargs.bundles, 1), cliargs.ingest, cliargs.incremental, cliargs.prune, cliargs.mode_policy))
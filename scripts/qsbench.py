@@ -0,0 +1,497 @@
+#!/usr/bin/python3
+#
+# Amazon Quicksight Asset Bundling and Deployment Tool - benchmarks
+#
+# Measures qstool.py on large synthetic bundles generated from the
+# asset templates, each run in its own process so wall time and peak
+# memory are those of a real invocation.
+#
+#   sanitize - single-pass sanitize vs the previous full-text regex
+#              pipeline, outputs must be byte-identical
+#   api      - list, describe, sanitize, create, update and delete of a
+#              synthetic account, against a local stand-in for Amazon
+#              Quicksight with per-call latency and throttling
+#   bundle   - size on disk and load time of plain json, packed and
+#              indexed bundles, and reading or adding a single asset,
+#              all must load to the same assets
+#
+
+import os
+import re
+import sys
+import json
+import datetime
+import time
+import shutil
+import resource
+import threading
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+BASE_DIR = Path(os.path.abspath(__file__)).parent.parent
+TEMPLATES_DIR = BASE_DIR / 'asset-templates'
+QSTOOL = BASE_DIR / 'scripts' / 'qstool.py'
+
+DEF_COPIES = '10,50,200'
+DEF_REPEAT = 3
+
+# options used for every sanitize run
+SANITIZE_OPTS = ['--account', '210987654321', '--region', 'eu-west-1', '--slregion', 'eu-west-1']
+
+DEF_SIZES = '50,200'
+DEF_LATENCY = 50
+DEF_LIMIT = 0
+DEF_PROCESSING = 1.0
+
+# account and region of the synthetic account
+FAKE_ACCOUNT = '123456789012'
+FAKE_REGION = 'us-east-1'
+FAKE_GROUPS = 5
+FAKE_UPDATED = datetime.datetime(2023, 4, 20, tzinfo=datetime.timezone.utc)
+
+# the sanitize action as it was before the single-pass rewrite
+# kept here as the reference the new pass is compared against, bundles
+# are benchmarked without groups or --principal so no permissions are built
+def LegacySanitize(path, account, region, slregion):
+    import boto3
+    boto3.client('quicksight')
+
+    def Sanitize(dirty, slregion):
+        dirty = re.sub(r'(?i)("(arn:aws:quicksight):([^:]*):([^aws:]*):([^"]+))"', '"\\2:<aws-region>:<aws-account>:\\5"', dirty)
+        if region: dirty = re.sub( r'(?i)<aws-region>', f'{region}', dirty)
+        if account: dirty = re.sub( r'(?i)<aws-account>', f'{account}', dirty)
+        if not slregion: slregion = region
+        if slregion: slregion = re.sub(r'-', '_', slregion)
+        dirty = re.sub( r'(?i)(amazon_security_lake_glue_db_)([^_]+_[^_]+_\d+)', f'\\1<aws-security-lake-region>', dirty)
+        dirty = re.sub( r'(?i)(amazon_security_lake_table_)(<aws-security-lake-region>)(_.+)', f'\\1<aws-security-lake-region>\\3', dirty)
+        if slregion:
+            dirty = re.sub( r'(?i)<aws-security-lake-region>', f'{slregion}', dirty, count=0)
+        return dirty
+
+    with open(path, 'r') as file:
+        dirty = file.read()
+    sanitized = Sanitize(dirty, slregion)
+    with open(path, 'w') as file:
+        file.write(sanitized)
+
+    with open(path, 'r') as file:
+        assets = json.loads(file.read())
+
+    strip = {
+        'dashboards': ['ResponseMetadata', 'ResourceStatus', 'RequestId', 'Status', 'Permissions'],
+        'analyses': ['ResponseMetadata', 'ResourceStatus', 'RequestId', 'Status', 'Permissions'],
+        'datasets': ['CreatedTime', 'LastModifiedTime', 'Status', 'Permissions'],
+        'datasources': ['CreatedTime', 'LastModifiedTime', 'Status', 'Permissions']
+    }
+    for t in strip:
+        for i in assets[t]:
+            for o in strip[t]:
+                if o in assets[t][i]: del assets[t][i][o]
+
+    with open(path, 'w') as file:
+        file.write(json.dumps(assets, indent=4))
+
+###
+## Stand-in for Amazon Quicksight - a synthetic account of size assets
+###
+
+# a synthetic account with size datasources, datasets, analyses and
+# dashboards, each dashboard and analysis reading its own dataset
+# every call waits latency seconds, calls beyond limit per second to
+# an api are throttled, and analyses, dashboards and datasources take
+# processing seconds to finish creating, updating or deleting
+class FakeQuickSight:
+    def __init__(self, size, latency, limit, processing):
+        self.size = size
+        self.latency = latency
+        self.limit = limit
+        self.processing = processing
+        self.calls = 0
+        self.throttles = 0
+        self.window = {}
+        self.changes = {}
+        self.lock = threading.Lock()
+
+        # response bodies are parsed again on every call, like a real client
+        executive = json.loads((TEMPLATES_DIR / 'executive-config.json').read_text().replace('<aws-region>', FAKE_REGION).replace('<aws-account>', FAKE_ACCOUNT).replace('<aws-security-lake-region>', 'us_east_1'))
+        analyses = json.loads((TEMPLATES_DIR / 'assets-config.json').read_text().replace('<aws-region>', FAKE_REGION).replace('<aws-account>', FAKE_ACCOUNT).replace('<aws-security-lake-region>', 'us_east_1'))
+        self.bodies = {
+            'dashboards': json.dumps(executive['dashboards']['SecurityExecutiveDashboard']),
+            'analyses': json.dumps(analyses['analyses']['SecurityLakeExecutiveAnalysis']),
+            'datasets': json.dumps(executive['datasets']['vpc-flow-dataset']),
+            'datasources': json.dumps(executive['datasources']['vpc-flow-datasource'])
+        }
+        self.schedule = executive['datasets']['vpc-flow-dataset']['RefreshSchedules'][0]
+
+    def Arn(self, kind, i):
+        return f"arn:aws:quicksight:{FAKE_REGION}:{FAKE_ACCOUNT}:{kind}/{i}"
+
+    def Ids(self, prefix):
+        return [f"{prefix}-{k:05d}" for k in range(self.size)]
+
+    def Body(self, t):
+        return json.loads(self.bodies[t])
+
+    # a page of items, MaxResults at a time
+    def Page(self, key, items, kw):
+        start = int(kw.get('NextToken', 0))
+        page = { key: items[start:start + kw.get('MaxResults', 100)] }
+        if start + kw.get('MaxResults', 100) < len(items): page['NextToken'] = str(start + kw.get('MaxResults', 100))
+        return page
+
+    def Error(self, code, op):
+        from botocore.exceptions import ClientError
+        return ClientError({ 'Error': { 'Code': code, 'Message': code } }, op)
+
+    # processing status of an analysis, dashboard or datasource
+    def Status(self, kind, i, op):
+        action, started = self.changes.get((kind, i), ('create', 0))
+        done = time.monotonic() - started >= self.processing
+        if action in ['delete']:
+            if done: raise self.Error('ResourceNotFoundException', op)
+            return 'DELETION_IN_PROGRESS'
+        prefix = 'UPDATE' if action in ['update'] else 'CREATION'
+        return f"{prefix}_SUCCESSFUL" if done else f"{prefix}_IN_PROGRESS"
+
+    def Change(self, kind, i, action):
+        with self.lock:
+            self.changes[(kind, i)] = (action, time.monotonic())
+        return { 'Status': 200, 'Arn': self.Arn(kind, i), 'RequestId': 'fake' }
+
+    def __getattr__(self, op):
+        handler = getattr(self, 'api_' + op)
+        def call(**kw):
+            with self.lock:
+                self.calls += 1
+                now = time.monotonic()
+                window = [t for t in self.window.get(op, []) if now - t < 1.0]
+                throttled = self.limit and len(window) >= self.limit
+                if throttled: self.throttles += 1
+                else: window.append(now)
+                self.window[op] = window
+            time.sleep(self.latency)
+            if throttled: raise self.Error('ThrottlingException', op)
+            return handler(**kw)
+        return call
+
+    def close(self):
+        pass
+
+    # list apis
+    def api_list_themes(self, **kw):
+        return self.Page('ThemeSummaryList', [], kw)
+
+    def api_list_namespaces(self, **kw):
+        return self.Page('Namespaces', [{ 'Name': 'default', 'Arn': self.Arn('namespace', 'default') }], kw)
+
+    def api_list_templates(self, **kw):
+        return self.Page('TemplateSummaryList', [], kw)
+
+    def api_list_dashboards(self, **kw):
+        return self.Page('DashboardSummaryList', [{ 'Arn': self.Arn('dashboard', i), 'DashboardId': i, 'Name': i, 'LastUpdatedTime': FAKE_UPDATED } for i in self.Ids('db')], kw)
+
+    def api_list_dashboard_versions(self, **kw):
+        return self.Page('DashboardVersionSummaryList', [{ 'Arn': self.Arn('dashboard', f"{kw['DashboardId']}/version/{v}"), 'VersionNumber': v, 'Status': 'CREATION_SUCCESSFUL', 'CreatedTime': FAKE_UPDATED } for v in range(1, 4)], kw)
+
+    def api_list_analyses(self, **kw):
+        return self.Page('AnalysisSummaryList', [{ 'Arn': self.Arn('analysis', i), 'AnalysisId': i, 'Name': i, 'LastUpdatedTime': FAKE_UPDATED } for i in self.Ids('an')], kw)
+
+    def api_list_data_sets(self, **kw):
+        return self.Page('DataSetSummaries', [{ 'Arn': self.Arn('dataset', i), 'DataSetId': i, 'Name': i, 'ImportMode': 'SPICE', 'LastUpdatedTime': FAKE_UPDATED } for i in self.Ids('ds')], kw)
+
+    def api_list_ingestions(self, **kw):
+        return self.Page('Ingestions', [{ 'Arn': self.Arn('dataset', f"{kw['DataSetId']}/ingestion/{n}"), 'IngestionId': str(n), 'IngestionStatus': 'COMPLETED', 'CreatedTime': FAKE_UPDATED } for n in range(5)], kw)
+
+    def api_list_refresh_schedules(self, **kw):
+        return { 'RefreshSchedules': [self.schedule] }
+
+    def api_list_data_sources(self, **kw):
+        return self.Page('DataSources', [{ 'Arn': self.Arn('datasource', i), 'DataSourceId': i, 'Name': i, 'Type': 'ATHENA', 'LastUpdatedTime': FAKE_UPDATED } for i in self.Ids('src')], kw)
+
+    def api_list_groups(self, **kw):
+        return self.Page('GroupList', [{ 'Arn': self.Arn('group/default', f"grp-{g}"), 'GroupName': f"grp-{g}", 'PrincipalId': f"grp-{g}" } for g in range(FAKE_GROUPS)], kw)
+
+    # describe apis
+    def Permissions(self, i, groups=True):
+        perms = [{ 'Principal': self.Arn('user/default', 'admin'), 'Actions': ['quicksight:DescribeDashboard'] }]
+        if groups: perms.append({ 'Principal': self.Arn('group/default', f"grp-{int(i.split('-')[-1]) % FAKE_GROUPS}"), 'Actions': ['quicksight:DescribeDashboard'] })
+        return { 'Permissions': perms }
+
+    def api_describe_dashboard_definition(self, **kw):
+        i = kw['DashboardId']
+        asset = self.Body('dashboards')
+        asset['DashboardId'], asset['Name'] = i, i
+        asset['Definition']['DataSetIdentifierDeclarations'] = [{ 'Identifier': 'vpc-flow-dataset', 'DataSetArn': self.Arn('dataset', 'ds-' + i.split('-')[-1]) }]
+        asset.pop('Permissions', None)
+        return asset
+
+    def api_describe_dashboard_permissions(self, **kw):
+        return self.Permissions(kw['DashboardId'])
+
+    def api_describe_analysis_definition(self, **kw):
+        i = kw['AnalysisId']
+        asset = self.Body('analyses')
+        asset['AnalysisId'], asset['Name'] = i, i
+        asset['Definition']['DataSetIdentifierDeclarations'] = [{ 'Identifier': 'vpc-flow-dataset', 'DataSetArn': self.Arn('dataset', 'ds-' + i.split('-')[-1]) }]
+        return asset
+
+    def api_describe_analysis_permissions(self, **kw):
+        return self.Permissions(kw['AnalysisId'])
+
+    def api_describe_data_set(self, **kw):
+        i = kw['DataSetId']
+        asset = self.Body('datasets')
+        asset['DataSetId'], asset['Name'], asset['Arn'] = i, i, self.Arn('dataset', i)
+        for t in asset['PhysicalTableMap'].values():
+            t['CustomSql']['DataSourceArn'] = self.Arn('datasource', 'src-' + i.split('-')[-1])
+        for k in ['RefreshSchedules', 'Permissions']: asset.pop(k, None)
+        return { 'DataSet': asset }
+
+    def api_describe_data_set_permissions(self, **kw):
+        return self.Permissions(kw['DataSetId'], groups=False)
+
+    def api_describe_refresh_schedule(self, **kw):
+        return { 'RefreshSchedule': dict(self.schedule) }
+
+    def api_describe_data_source(self, **kw):
+        i = kw['DataSourceId']
+        asset = self.Body('datasources')
+        asset['DataSourceId'], asset['Name'], asset['Arn'] = i, i, self.Arn('datasource', i)
+        asset.pop('Permissions', None)
+        asset['Status'] = self.Status('datasource', i, 'describe_data_source')
+        return { 'DataSource': asset }
+
+    def api_describe_data_source_permissions(self, **kw):
+        return self.Permissions(kw['DataSourceId'], groups=False)
+
+    def api_describe_group(self, **kw):
+        return { 'Group': { 'Arn': self.Arn('group/default', kw['GroupName']), 'GroupName': kw['GroupName'], 'PrincipalId': kw['GroupName'] } }
+
+    def api_describe_analysis(self, **kw):
+        return { 'Analysis': { 'AnalysisId': kw['AnalysisId'], 'Status': self.Status('analysis', kw['AnalysisId'], 'describe_analysis') } }
+
+    def api_describe_dashboard(self, **kw):
+        return { 'Dashboard': { 'DashboardId': kw['DashboardId'], 'Version': { 'Status': self.Status('dashboard', kw['DashboardId'], 'describe_dashboard') } } }
+
+    # create, update and delete apis
+    def api_create_data_source(self, **kw): return self.Change('datasource', kw['DataSourceId'], 'create')
+    def api_update_data_source(self, **kw): return self.Change('datasource', kw['DataSourceId'], 'update')
+    def api_delete_data_source(self, **kw): return self.Change('datasource', kw['DataSourceId'], 'delete')
+    def api_create_data_set(self, **kw): return self.Change('dataset', kw['DataSetId'], 'create')
+    def api_update_data_set(self, **kw): return self.Change('dataset', kw['DataSetId'], 'update')
+    def api_delete_data_set(self, **kw): return self.Change('dataset', kw['DataSetId'], 'delete')
+    def api_create_refresh_schedule(self, **kw): return self.Change('dataset', f"{kw['DataSetId']}/schedule/{kw['Schedule']['ScheduleId']}", 'create')
+    def api_update_refresh_schedule(self, **kw): return self.Change('dataset', f"{kw['DataSetId']}/schedule/{kw['Schedule']['ScheduleId']}", 'update')
+    def api_create_analysis(self, **kw): return self.Change('analysis', kw['AnalysisId'], 'create')
+    def api_update_analysis(self, **kw): return self.Change('analysis', kw['AnalysisId'], 'update')
+    def api_delete_analysis(self, **kw): return self.Change('analysis', kw['AnalysisId'], 'delete')
+    def api_create_dashboard(self, **kw): return self.Change('dashboard', kw['DashboardId'], 'create')
+    def api_update_dashboard(self, **kw): return self.Change('dashboard', kw['DashboardId'], 'update')
+    def api_delete_dashboard(self, **kw): return self.Change('dashboard', kw['DashboardId'], 'delete')
+    def api_create_group(self, **kw): return self.Change('group/default', kw['GroupName'], 'create')
+    def api_delete_group(self, **kw): return self.Change('group/default', kw['GroupName'], 'delete')
+
+    # sts
+    def api_get_caller_identity(self, **kw):
+        return { 'Account': FAKE_ACCOUNT }
+
+# boto3 session handing out the stand-in for every client
+class FakeSession:
+    def __init__(self, fake):
+        self.fake = fake
+
+    def client(self, name, config=None):
+        return self.fake
+
+# runs qstool in this process against the stand-in, prints wall seconds,
+# calls, throttles, peak rss in MB and the exit status as a json line
+def RunFake(spec):
+    import qstool
+    fake = FakeQuickSight(spec['size'], spec['latency'], spec['limit'], spec['processing'])
+    opts = { k: spec[k] for k in ['workers', 'rate'] if spec.get(k) is not None }
+    connection = qstool.Connection(session=FakeSession(fake), **opts)
+    start = time.perf_counter()
+    status = qstool.main(spec['argv'], connection)
+    elapsed = time.perf_counter() - start
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    peak = usage.ru_maxrss / (1024 * 1024) if sys.platform == 'darwin' else usage.ru_maxrss / 1024
+    print(json.dumps({ 'seconds': elapsed, 'calls': fake.calls, 'throttles': fake.throttles, 'peak': peak, 'status': status }))
+
+# builds a synthetic exported bundle from every template, with each asset
+# repeated copies times under new ids, and concrete account and region
+def SyntheticBundle(copies, groups=True):
+    bundle = { 'namespaces': {}, 'dashboards': {}, 'analyses': {}, 'templates': {}, 'datasets': {}, 'datasources': {}, 'groups': {} }
+    for path in sorted(TEMPLATES_DIR.glob('*.json')):
+        text = path.read_text()
+        text = text.replace('<aws-region>', 'us-east-1').replace('<aws-account>', '123456789012').replace('<aws-security-lake-region>', 'us_east_1')
+        template = json.loads(text)
+        for t in bundle:
+            if t in ['groups'] and not groups: continue
+            for i in template.get(t, {}):
+                for c in range(copies):
+                    bundle[t][f"{i}-{c:04d}"] = json.loads(json.dumps(template[t][i]))
+    return bundle
+
+# runs a command in a child process, returns wall seconds and peak rss in MB
+def Measure(cmd):
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - start
+    if os.waitstatus_to_exitcode(status) != 0:
+        sys.exit(f"!! benchmark command failed: {' '.join(map(str, cmd))}")
+    peak = usage.ru_maxrss / (1024 * 1024) if sys.platform == 'darwin' else usage.ru_maxrss / 1024
+    return elapsed, peak
+
+# compare the legacy and single-pass sanitize on bundles of increasing size
+def BenchSanitize(cliargs):
+    print(f"{'copies':>8} {'size MB':>8} {'legacy s':>9} {'new s':>9} {'speedup':>8} {'legacy MB':>10} {'new MB':>9} {'identical':>10}")
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        for copies in [int(c) for c in cliargs.copies.split(',')]:
+            source = os.path.join(tmp, 'source.json')
+            with open(source, 'w') as file:
+                file.write(json.dumps(SyntheticBundle(copies, groups=False), indent=4))
+            size = os.path.getsize(source) / (1024 * 1024)
+
+            legacy, new = [], []
+            for _ in range(cliargs.repeat):
+                shutil.copy(source, os.path.join(tmp, 'legacy.json'))
+                shutil.copy(source, os.path.join(tmp, 'new.json'))
+                legacy.append(Measure([sys.executable, __file__, '_legacy', os.path.join(tmp, 'legacy.json')]))
+                new.append(Measure([sys.executable, QSTOOL, 'sanitize', 'all', '--assets', os.path.join(tmp, 'new.json')] + SANITIZE_OPTS))
+
+            with open(os.path.join(tmp, 'legacy.json'), 'rb') as a, open(os.path.join(tmp, 'new.json'), 'rb') as b:
+                identical = a.read() == b.read()
+            failed = failed or not identical
+
+            lt, lm = min(t for t, _ in legacy), max(m for _, m in legacy)
+            nt, nm = min(t for t, _ in new), max(m for _, m in new)
+            print(f"{copies:>8} {size:>8.1f} {lt:>9.2f} {nt:>9.2f} {lt / nt:>7.1f}x {lm:>10.1f} {nm:>9.1f} {str(identical):>10}")
+
+    if failed:
+        sys.exit("!! sanitize output differs from the legacy pipeline")
+
+# plain json, packed and indexed bundles of increasing size, written and read
+# by qstool, as a whole and for one asset read or added
+def BenchBundle(cliargs):
+    sys.path.insert(0, str(QSTOOL.parent))
+    import qstool
+    print(f"{'copies':>8} {'json MB':>8} {'packed MB':>10} {'indexed MB':>11} {'json s':>8} {'packed s':>9} {'indexed s':>10} {'read one s':>11} {'lazy one s':>11} {'add one s':>10} {'append s':>9} {'identical':>10}")
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        for copies in [int(c) for c in cliargs.copies.split(',')]:
+            bundle = SyntheticBundle(copies)
+            plain, packed, indexed = [os.path.join(tmp, 'bundle' + s) for s in ['.json', qstool.PACK_SUFFIX, qstool.INDEX_SUFFIX]]
+            for path in [plain, packed, indexed]: qstool.WriteBundle(path, bundle)
+            dashboard = next(iter(bundle['dashboards']))
+
+            times = { plain: [], packed: [], indexed: [] }
+            one = { 'read': [], 'lazy': [], 'add': [], 'append': [] }
+            identical = True
+            for n in range(cliargs.repeat):
+                for path in times:
+                    start = time.perf_counter()
+                    loaded = qstool.ReadBundle(path)
+                    times[path].append(time.perf_counter() - start)
+                    identical = identical and loaded == bundle
+                    del loaded
+
+            for n in range(cliargs.repeat):
+                # one dashboard read, then one added, from the whole json and lazily from the index
+                start = time.perf_counter()
+                identical = identical and qstool.ReadBundle(plain)['dashboards'][dashboard] == bundle['dashboards'][dashboard]
+                one['read'].append(time.perf_counter() - start)
+                start = time.perf_counter()
+                identical = identical and qstool.ReadBundle(indexed, lazy=True)['dashboards'][dashboard] == bundle['dashboards'][dashboard]
+                one['lazy'].append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                assets = qstool.ReadBundle(plain)
+                assets['dashboards'][f"added-{n}"] = bundle['dashboards'][dashboard]
+                qstool.WriteBundle(plain, assets)
+                one['add'].append(time.perf_counter() - start)
+                del assets
+                start = time.perf_counter()
+                assets = qstool.ReadBundle(indexed, lazy=True)
+                assets['dashboards'][f"added-{n}"] = bundle['dashboards'][dashboard]
+                qstool.WriteBundle(indexed, assets)
+                one['append'].append(time.perf_counter() - start)
+                bundle['dashboards'][f"added-{n}"] = bundle['dashboards'][dashboard]
+            identical = identical and qstool.ReadBundle(indexed) == qstool.ReadBundle(plain) == bundle
+            failed = failed or not identical
+
+            js, ps, xs = [os.path.getsize(p) / (1024 * 1024) for p in [plain, packed, indexed]]
+            print(f"{copies:>8} {js:>8.2f} {ps:>10.2f} {xs:>11.2f} {min(times[plain]):>8.2f} {min(times[packed]):>9.2f} {min(times[indexed]):>10.2f} {min(one['read']):>11.3f} {min(one['lazy']):>11.3f} {min(one['add']):>10.3f} {min(one['append']):>9.3f} {str(identical):>10}")
+
+    if failed:
+        sys.exit("!! packed or indexed bundle does not load to the same assets")
+
+# every step of an export and deployment of synthetic accounts of each size,
+# each step is run in its own process against the stand-in
+def BenchApi(cliargs):
+    print(f"{'size':>6} {'step':<12} {'wall s':>8} {'calls':>7} {'calls/s':>8} {'throttled':>9} {'peak MB':>8} {'status':>6}")
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in [int(c) for c in cliargs.sizes.split(',')]:
+            files = ['--catalog', os.path.join(tmp, 'catalog.json'), '--assets', os.path.join(tmp, 'bundle.json'), '--state', os.path.join(tmp, 'state.json'), '--output', os.path.join(tmp, 'output.json')]
+            for f in ['catalog.json', 'bundle.json', 'state.json', 'output.json']:
+                if os.path.exists(os.path.join(tmp, f)): os.remove(os.path.join(tmp, f))
+            dashboards = [f"db-{k:05d}" for k in range(size)]
+            steps = [
+                ('list', ['list', 'all', '--account', FAKE_ACCOUNT]),
+                ('list cached', ['list', 'all', '--account', FAKE_ACCOUNT, '--cached']),
+                ('describe', ['describe', 'dashboard'] + dashboards + ['--account', FAKE_ACCOUNT]),
+                ('sanitize', ['sanitize', 'all', '--account', FAKE_ACCOUNT, '--region', FAKE_REGION, '--principal', f"arn:aws:quicksight:{FAKE_REGION}:{FAKE_ACCOUNT}:user/default/admin"]),
+                ('create', ['create', 'all']),
+                ('update', ['update', 'all', '--force']),
+                ('delete', ['delete', 'all', '--confirm'])
+            ]
+            for name, argv in steps:
+                spec = { 'size': size, 'latency': cliargs.latency / 1000.0, 'limit': cliargs.limit, 'processing': cliargs.processing, 'workers': cliargs.workers, 'rate': cliargs.rate, 'argv': argv + files }
+                proc = subprocess.run([sys.executable, __file__, '_fake', json.dumps(spec)], stdout=subprocess.PIPE, text=True)
+                lines = proc.stdout.strip().splitlines()
+                if proc.returncode != 0 or not lines:
+                    sys.exit(f"!! benchmark step {name} failed")
+                r = json.loads(lines[-1])
+                failed = failed or r['status'] != 0
+                print(f"{size:>6} {name:<12} {r['seconds']:>8.2f} {r['calls']:>7} {r['calls'] / r['seconds']:>8.1f} {r['throttles']:>9} {r['peak']:>8.1f} {r['status']:>6}")
+
+    if failed:
+        sys.exit("!! a benchmark step did not finish successfully")
+
+
+if __name__ == '__main__':
+    # child process for the legacy pipeline, called by BenchSanitize
+    if len(sys.argv) == 3 and sys.argv[1] == '_legacy':
+        opts = dict(zip(SANITIZE_OPTS[::2], SANITIZE_OPTS[1::2]))
+        LegacySanitize(sys.argv[2], opts['--account'], opts['--region'], opts['--slregion'])
+        sys.exit(0)
+
+    # child process for a qstool run against the stand-in, called by BenchApi
+    if len(sys.argv) == 3 and sys.argv[1] == '_fake':
+        RunFake(json.loads(sys.argv[2]))
+        sys.exit(0)
+
+    cliparser = argparse.ArgumentParser(description="Amazon Quicksight Asset Deployment Tool benchmarks")
+    cliparser.add_argument('bench', choices=['sanitize', 'api', 'bundle'], help="Benchmark to run")
+    cliparser.add_argument('--copies', default=DEF_COPIES, help=f"Comma separated copies of each template asset per bundle ({DEF_COPIES})")
+    cliparser.add_argument('--repeat', type=int, default=DEF_REPEAT, help=f"Runs per measurement, the fastest is reported ({DEF_REPEAT})")
+    cliparser.add_argument('--sizes', default=DEF_SIZES, help=f"Comma separated datasets, analyses and dashboards per synthetic account ({DEF_SIZES})")
+    cliparser.add_argument('--latency', type=float, default=DEF_LATENCY, help=f"Milliseconds each api call takes ({DEF_LATENCY})")
+    cliparser.add_argument('--limit', type=int, default=DEF_LIMIT, help=f"Calls per second to each api before throttling, 0 for none ({DEF_LIMIT})")
+    cliparser.add_argument('--processing', type=float, default=DEF_PROCESSING, help=f"Seconds assets take to finish creating, updating or deleting ({DEF_PROCESSING})")
+    cliparser.add_argument('-w', '--workers', type=int, help="qstool --workers for the api benchmark")
+    cliparser.add_argument('--rate', type=float, help="qstool --rate for the api benchmark")
+    cliargs = cliparser.parse_args()
+
+    if cliargs.bench in ['sanitize']:
+        BenchSanitize(cliargs)
+
+    if cliargs.bench in ['api']:
+        BenchApi(cliargs)
+
+    if cliargs.bench in ['bundle']:
+        BenchBundle(cliargs)
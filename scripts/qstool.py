@@ -9,6 +9,13 @@
 # Recently Done:
 # - Basic group support for permissions across all asset types
 #
+# Library use:
+#   import qstool
+#   connection = qstool.Connection()
+#   status = qstool.main(['--assets', 'bundle.json', 'create', 'all'], connection)
+#   bundle = qstool.Bundle(assets)   # held in memory in place of the --assets file
+#   status = qstool.main(['sanitize', 'all', '--account', '111122223333'], connection, bundle=bundle)
+#
 # Todo - Remaining
 # - Support for more than Athena and CustomSql - just need to test .. no use cases
 # - Promote/demote analysis to/from dashboard
@@ -22,79 +29,392 @@ from json import JSONEncoder
 import datetime
 import argparse
 import boto3
+from botocore.config import Config
+from botocore.credentials import CredentialProvider, CredentialResolver, RefreshableCredentials
+from botocore.session import get_session
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from collections.abc import MutableMapping
+import threading
+import contextlib
+import hashlib
+import gzip
+import math
+import sys
+import random
+import time
+import os
 import re
 
 # some default for testing
 DEF_ASSETS = 'assets.json'
 DEF_CATALOG = 'catalog.json'
-DEF_OUTPUT = 'output.json'
-
-# parse command line directives and options
+DEF_OUTPUT = 'output.ndjson'
+DEF_STATE = 'state.json'
+DEF_WORKERS = 8
+DEF_RATE = 10.0
+DEF_RETRIES = 8
+DEF_TIMEOUT = 900
+DEF_METRICS = 'metrics.json'
+DEF_INGESTIONS = 2
+DEF_WINDOW = '00:00-06:00'
+DEF_LOOKBACK = 1
+DEF_DAYS = 7
+
+# largest page size accepted by the quicksight list apis
+MAX_RESULTS = 100
+
+# actions working only on files, without a connection
+OFFLINE_ACTIONS = ['sanitize', 'merge', 'plan', 'stagger', 'lint', 'prune', 'capacity']
+
+# severities of lint findings, most severe first
+LINT_SEVERITIES = ['error', 'warning', 'info']
+
+# asset bundles written with this suffix are packed, any packed file is read as one
+PACK_SUFFIX = '.qsz'
+
+# asset bundles written with this suffix are indexed, any indexed file is read as one
+INDEX_SUFFIX = '.qsi'
+
+# command line directives and options, parsed by main() for each run
 cliparser = argparse.ArgumentParser( description="Amazon Quicksight Asset Deployment Tool")
-cliparser.add_argument('action', choices=['list', 'describe', 'sanitize', 'create','update','delete'], help="Action to execute")
+cliparser.add_argument('action', choices=['list', 'describe', 'sanitize', 'merge', 'plan', 'stagger', 'lint', 'prune', 'capacity', 'create','update','delete'], help="Action to execute")
 cliparser.add_argument('type', choices=['all','dashboard','analysis','dataset','datasource','group'], help="Type of asset")
-cliparser.add_argument('ids', nargs='*', help="Asset IDs")
+cliparser.add_argument('ids', nargs='*', help="Asset IDs, or asset bundle files to merge")
 cliparser.add_argument('-v', '--verbose', action='store_true', help="Enable verbose orchestration output")
 cliparser.add_argument('-f', '--nofollow', action='store_true', help="Do NOT follow any dependency objects")
 cliparser.add_argument('-C', '--confirm', action='store_true', help="Confirmation for destructive actions")
 cliparser.add_argument('-p', '--preopen', action='store_true', help="Preopen assets file for merging additional assets")
 cliparser.add_argument('-i', '--ignore', action='store_true', help="Ignore errors when assets already exist or do not exist")
+cliparser.add_argument('-c', '--cached', action='store_true', help="Reuse the previous catalog, retrieving versions, ingestions and schedules only for new or changed assets")
+cliparser.add_argument('--since', nargs='?', const='', help="Re-export only assets changed since this ISO time, or since the assets file was last written")
+cliparser.add_argument('-F', '--force', action='store_true', help="Update all assets, even those unchanged since the last deployment")
 cliparser.add_argument('--account', help="Amazon account ID")           # used for api calls and sanitize
 cliparser.add_argument('--region', help="Amazon account region")        # used for sanitize
 cliparser.add_argument('--slregion', help="Amazon Security Lake region")     # used for Amazon Security Lake
 cliparser.add_argument('--asl', help="(deprecated) Amazon Security Lake region")     # used for Amazon Security Lake
-cliparser.add_argument('--assets', default=DEF_ASSETS, help=f"Asset definitions file for export/deploy ({DEF_ASSETS})")
+cliparser.add_argument('--assets', default=DEF_ASSETS, help=f"Asset definitions file for export/deploy, packed when named *{PACK_SUFFIX}, indexed when named *{INDEX_SUFFIX} ({DEF_ASSETS})")
 cliparser.add_argument('--catalog', default=DEF_CATALOG, help=f"Filename to write API output/results for list/delete ({DEF_CATALOG})")
-cliparser.add_argument('--output', default=DEF_OUTPUT, help=f"Filename to write API output/results for list/delete ({DEF_OUTPUT})")
+cliparser.add_argument('--output', default=DEF_OUTPUT, help=f"Filename to stream create/update/delete events to, one JSON object per line ({DEF_OUTPUT})")
+cliparser.add_argument('--metrics', default=DEF_METRICS, help=f"Filename to write per-api call metrics to at exit ({DEF_METRICS})")
+cliparser.add_argument('--prometheus', help="Filename to write per-api call metrics to in the Prometheus text format, for the node exporter textfile collector")
+cliparser.add_argument('--state', default=DEF_STATE, help=f"Filename to track deployed asset content per account for incremental update/plan ({DEF_STATE})")
 cliparser.add_argument('--principal', default='', help="Principal to apply permissions to assets")
 cliparser.add_argument('--prefix', default='', help="Prefix string to front Names and Ids")
 cliparser.add_argument('--suffix', default='', help="Suffix string to trail Names and Ids")
-args = cliparser.parse_args()
-
-# for collecting debug and API results
-results = []
-
-# instrumentation
-def debug(x, y = 0):
-    if args.verbose or y == 255:
-        print(x)
-    results.append(x)
-    if y == 0: return
-    print("!! access the help menu with -h or --help")
-    #cliparser.print_help()
-    exit(255)
-
-# holding space for collection of assets
-assets = {
-    "namespaces": {},
-    "dashboards": {},
-    "analyses": {},
-    "templates": {},
-    "datasets": {},
-    "datasources": {},
-    "groups": {}
-}
-
-# sanitize prefix/suffix - spaces/tabs/slashes to -
-args.prefix = re.sub(r'([\s\t/]+)', '-', args.prefix)
-args.suffix = re.sub(r'([\s\t/]+)', '-', args.suffix)
-
-if args.prefix or args.suffix:
-    debug('!! --prefix and --suffix are only partially implemented and are not ready for use yet', 255)
-
-# attempt to get the account id if not supplied - not needed for sanitize
-if not args.account and args.action not in ['sanitize']:
-    debug("getting account info via sts.get_caller_identity")
-    try:
-        sts = boto3.client('sts')
-        args.account = sts.get_caller_identity()['Account']
-        sts.close()
-    except Exception as e:
-        debug("!! cannot call sts:get_caller_identity", 255)
+cliparser.add_argument('-w', '--workers', type=int, default=DEF_WORKERS, help=f"Maximum concurrent API calls ({DEF_WORKERS})")
+cliparser.add_argument('--rate', type=float, default=DEF_RATE, help=f"Maximum calls per second to each API, lowered when throttled ({DEF_RATE})")
+cliparser.add_argument('--retries', type=int, default=DEF_RETRIES, help=f"Retries for throttled API calls, server errors and timeouts ({DEF_RETRIES})")
+cliparser.add_argument('--timeout', type=int, default=DEF_TIMEOUT, help=f"Seconds to wait for each asset to finish creating, updating or deleting ({DEF_TIMEOUT})")
+cliparser.add_argument('--ingest', action='store_true', help="After create or update, ingest every SPICE dataset deployed and wait for its ingestion to finish")
+cliparser.add_argument('--days', type=int, help=f"Days of Security Lake partitions the sanitized datasets read, kept as they are by default and {DEF_DAYS} where missing")
+cliparser.add_argument('--accounts', help="Comma separated account ids the sanitized Security Lake queries read partitions of")
+cliparser.add_argument('--regions', help="Comma separated regions the sanitized Security Lake queries read partitions of")
+cliparser.add_argument('--mode-policy', help="JSON policy file choosing SPICE or DIRECT_QUERY for each dataset when sanitizing, by its volume, refresh cost and views")
+cliparser.add_argument('--incremental', action='store_true', help="Sanitize time-based SPICE datasets to refresh incrementally every hour, with a weekly full refresh")
+cliparser.add_argument('--lookback', type=int, default=DEF_LOOKBACK, help=f"Days of data an incremental refresh reloads, by the Date column ({DEF_LOOKBACK})")
+cliparser.add_argument('--window', default=DEF_WINDOW, help=f"Time of day window, HH:MM-HH:MM in each schedule's timezone, that stagger fits dataset refreshes into ({DEF_WINDOW})")
+cliparser.add_argument('--fail-on', default='error', choices=LINT_SEVERITIES + ['never'], help="Lowest lint finding severity that fails the run (error)")
+cliparser.add_argument('--spice-budget', type=float, help="SPICE capacity in GB the account may use, create and update refuse to deploy a bundle projected to exceed it")
+cliparser.add_argument('--spice-warn', action='store_true', help="Only warn when the projected SPICE use exceeds --spice-budget")
+cliparser.add_argument('--ingestions', type=int, default=DEF_INGESTIONS, help=f"Maximum concurrent SPICE ingestions for --ingest ({DEF_INGESTIONS})")
+
+###
+## API metrics - calls, latency and bytes per api and outcome
+###
 
-# open up client connection to Amazon Quicksight
-debug("opening Amazon Quicksight connection")
-qs = boto3.client('quicksight')
+# upper bounds in seconds of the api latency histogram buckets
+METRIC_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+# outcome of a single api call
+def CallOutcome(e):
+    if e is None: return 'success'
+    code = e.response.get('Error', {}).get('Code') if isinstance(e, ClientError) else None
+    if code in THROTTLE_CODES: return 'throttled'
+    if code in TRANSIENT_CODES or isinstance(e, (ConnectionError, HTTPClientError)): return 'transient'
+    if isinstance(e, ClientError) and e.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0) >= 500: return 'transient'
+    if code in ['ResourceNotFoundException']: return 'not_found'
+    return 'error'
+
+# counts every attempt of every api call by outcome, with a latency histogram
+# and the bytes sent and received, shared by the gateways of a connection
+class Metrics:
+    def __init__(self):
+        self.started = time.time()
+        self.apis = {}
+        self.lock = threading.Lock()
+
+    def api(self, service, op):
+        key = (service, op)
+        if key not in self.apis:
+            self.apis[key] = { 'outcomes': {}, 'retries': 0, 'seconds': 0.0, 'max': 0.0, 'buckets': [0] * (len(METRIC_BUCKETS) + 1), 'sent': 0, 'received': 0 }
+        return self.apis[key]
+
+    def record(self, service, op, outcome, seconds, sent, received):
+        with self.lock:
+            a = self.api(service, op)
+            a['outcomes'][outcome] = a['outcomes'].get(outcome, 0) + 1
+            a['seconds'] += seconds
+            a['max'] = max(a['max'], seconds)
+            a['buckets'][next((b for b, le in enumerate(METRIC_BUCKETS) if seconds <= le), len(METRIC_BUCKETS))] += 1
+            a['sent'] += sent
+            a['received'] += received
+
+    def retried(self, service, op):
+        with self.lock:
+            self.api(service, op)['retries'] += 1
+
+    # summary by api, histogram buckets are cumulative as in Prometheus
+    def summary(self):
+        with self.lock:
+            apis = {}
+            for (service, op), a in sorted(self.apis.items()):
+                calls = sum(a['outcomes'].values())
+                cumulative = [sum(a['buckets'][:b + 1]) for b in range(len(METRIC_BUCKETS))]
+                apis[f"{service}.{op}"] = {
+                    'service': service,
+                    'operation': op,
+                    'calls': calls,
+                    'outcomes': dict(sorted(a['outcomes'].items())),
+                    'retries': a['retries'],
+                    'latency': {
+                        'sum': round(a['seconds'], 6),
+                        'mean': round(a['seconds'] / calls, 6) if calls else 0,
+                        'max': round(a['max'], 6),
+                        'buckets': { str(le): c for le, c in zip(METRIC_BUCKETS, cumulative) }
+                    },
+                    'sent_bytes': a['sent'],
+                    'received_bytes': a['received']
+                }
+            return { 'started': datetime.datetime.fromtimestamp(self.started, datetime.timezone.utc).isoformat(), 'seconds': round(time.time() - self.started, 3), 'apis': apis }
+
+    # metrics in the Prometheus text exposition format
+    def prometheus(self):
+        summary = self.summary()
+        lines = [
+            '# HELP qstool_api_calls_total API call attempts by outcome',
+            '# TYPE qstool_api_calls_total counter'
+        ]
+        for a in summary['apis'].values():
+            for outcome, n in a['outcomes'].items():
+                lines.append(f'qstool_api_calls_total{{service="{a["service"]}",operation="{a["operation"]}",outcome="{outcome}"}} {n}')
+        for name, key, desc in [('retries_total', 'retries', 'API calls retried after throttling'), ('sent_bytes_total', 'sent_bytes', 'API request bytes sent'), ('received_bytes_total', 'received_bytes', 'API response bytes received')]:
+            lines += [f'# HELP qstool_api_{name} {desc}', f'# TYPE qstool_api_{name} counter']
+            for a in summary['apis'].values():
+                lines.append(f'qstool_api_{name}{{service="{a["service"]}",operation="{a["operation"]}"}} {a[key]}')
+        lines += ['# HELP qstool_api_latency_seconds API call attempt latency', '# TYPE qstool_api_latency_seconds histogram']
+        for a in summary['apis'].values():
+            labels = f'service="{a["service"]}",operation="{a["operation"]}"'
+            for le, n in a['latency']['buckets'].items():
+                lines.append(f'qstool_api_latency_seconds_bucket{{{labels},le="{le}"}} {n}')
+            lines.append(f'qstool_api_latency_seconds_bucket{{{labels},le="+Inf"}} {a["calls"]}')
+            lines.append(f'qstool_api_latency_seconds_sum{{{labels}}} {a["latency"]["sum"]}')
+            lines.append(f'qstool_api_latency_seconds_count{{{labels}}} {a["calls"]}')
+        lines += ['# HELP qstool_run_seconds Seconds since the metrics started', '# TYPE qstool_run_seconds gauge', f'qstool_run_seconds {summary["seconds"]}']
+        return '\n'.join(lines) + '\n'
+
+    # write the json summary, and the Prometheus text file if given
+    # files are replaced only once fully written, as collectors may read them at any time
+    def write(self, path, prometheus=None):
+        outputs = { path: json.dumps(self.summary(), indent=4) }
+        if prometheus: outputs[prometheus] = self.prometheus()
+        for f, text in outputs.items():
+            with open(f + '.tmp', 'w') as file:
+                file.write(text)
+            os.replace(f + '.tmp', f)
+
+# size in bytes of an api response, as sent when known
+def ResponseSize(result):
+    headers = result.get('ResponseMetadata', {}).get('HTTPHeaders', {}) if isinstance(result, dict) else {}
+    if 'content-length' in headers: return int(headers['content-length'])
+    return len(json.dumps(result, default=str))
+
+###
+## API call gateway - rate limiting and throttling retries
+###
+
+# error codes returned when an api is being called too quickly
+THROTTLE_CODES = ['ThrottlingException', 'LimitExceededException', 'TooManyRequestsException', 'Throttling']
+
+# error codes of server side failures, retried like throttling along with
+# dropped connections and timeouts, without lowering the rate of the api
+TRANSIENT_CODES = ['InternalFailure', 'InternalFailureException', 'InternalServerException', 'ServiceUnavailable', 'ServiceUnavailableException']
+
+# backoff bounds in seconds for throttled and transient retries
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 20.0
+
+# token bucket for a single api
+# the rate halves on every throttle and climbs back slowly on success
+class TokenBucket:
+    def __init__(self, rate):
+        self.max = rate
+        self.rate = rate
+        self.tokens = 1.0
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    # blocks until a call may be made
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(max(self.rate, 1.0), self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                delay = (1.0 - self.tokens) / self.rate
+            time.sleep(delay)
+
+    def throttled(self):
+        with self.lock:
+            self.rate = max(self.rate / 2, 0.1)
+
+    def succeeded(self):
+        with self.lock:
+            self.rate = min(self.rate + 0.1 * self.max, self.max)
+
+# wraps a boto3 client so every api call is paced by a per-api token
+# bucket and throttled calls are retried with jittered exponential backoff
+# counts calls, throttles and retries per api for reporting
+# a limit, a semaphore, caps the calls in flight across every gateway sharing it
+class Gateway:
+    def __init__(self, client, rate=DEF_RATE, retries=DEF_RETRIES, metrics=None, service='quicksight', limit=None):
+        self.client = client
+        self.limit = limit or contextlib.nullcontext()
+        self.rate = rate
+        self.retries = retries
+        self.metrics = metrics or Metrics()
+        self.service = service
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def __getattr__(self, op):
+        method = getattr(self.client, op)
+        def call(**kwargs):
+            return self.call(op, method, **kwargs)
+        return call
+
+    def bucket(self, op):
+        with self.lock:
+            if op not in self.buckets:
+                self.buckets[op] = TokenBucket(self.rate)
+            return self.buckets[op]
+
+    def call(self, op, method, **kwargs):
+        bucket = self.bucket(op)
+        sent = len(json.dumps(kwargs, default=str))
+        attempt = 0
+        while True:
+            bucket.acquire()
+            start = time.perf_counter()
+            try:
+                with self.limit:
+                    result = method(**kwargs)
+                self.metrics.record(self.service, op, 'success', time.perf_counter() - start, sent, ResponseSize(result))
+                bucket.succeeded()
+                return result
+            except Exception as e:
+                outcome = CallOutcome(e)
+                self.metrics.record(self.service, op, outcome, time.perf_counter() - start, sent, 0)
+                if outcome not in ['throttled', 'transient']: raise
+                if outcome in ['throttled']: bucket.throttled()
+                if attempt >= self.retries: raise
+            time.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)))
+            attempt += 1
+            self.metrics.retried(self.service, op)
+
+    def close(self):
+        self.client.close()
+
+# shared connection for runs in the same process - one pooled quicksight
+# client behind one gateway, and the caller identity looked up once
+class Connection:
+    def __init__(self, session=None, workers=DEF_WORKERS, rate=DEF_RATE, retries=DEF_RETRIES, limit=None):
+        self.session = session or boto3.session.Session()
+        self.rate = rate
+        self.retries = retries
+        self.limit = limit
+        self.metrics = Metrics()
+        self.lock = threading.Lock()
+        self.caller = None
+
+        # the connection pool is sized for the listers running alongside the workers,
+        # retries are left to the gateway so throttling is seen and paced per api,
+        # and server errors, timeouts and dropped connections are retried by it
+        client = self.session.client('quicksight', config=Config(max_pool_connections=workers + 8, retries={ 'total_max_attempts': 1 }))
+        self.qs = Gateway(client, rate=rate, retries=retries, metrics=self.metrics, limit=limit)
+
+    # account id of the session credentials via sts.get_caller_identity
+    def account(self):
+        with self.lock:
+            if not self.caller:
+                sts = Gateway(self.session.client('sts'), rate=self.rate, retries=self.retries, metrics=self.metrics, service='sts', limit=self.limit)
+                self.caller = sts.get_caller_identity()['Account']
+                sts.close()
+            return self.caller
+
+    def close(self):
+        self.qs.close()
+
+# credentials of an assumed role, refreshed by botocore before they expire
+# the assume role calls go through the gateway of the sts client given
+class AssumedRole(CredentialProvider):
+    METHOD = 'sts-assume-role'
+    CANONICAL_NAME = 'qstool-assume-role'
+
+    def __init__(self, sts, role):
+        super().__init__()
+        self.sts = sts
+        self.role = role
+
+    def refresh(self):
+        c = self.sts.assume_role(RoleArn=self.role, RoleSessionName='qstool')['Credentials']
+        return { 'access_key': c['AccessKeyId'], 'secret_key': c['SecretAccessKey'], 'token': c['SessionToken'], 'expiry_time': c['Expiration'].isoformat() }
+
+    def load(self):
+        return RefreshableCredentials.create_from_metadata(metadata=self.refresh(), refresh_using=self.refresh, method=self.METHOD)
+
+# boto3 sessions shared by the runs of a process, one per role and region
+# each is set up once, runs asking for one being set up wait on it and share it
+# sts calls are paced, retried, counted in metrics and capped by limit like any other
+class Sessions:
+    def __init__(self, base=None, rate=DEF_RATE, retries=DEF_RETRIES, metrics=None, limit=None):
+        self.base = base or boto3.session.Session()
+        self.rate = rate
+        self.retries = retries
+        self.metrics = metrics or Metrics()
+        self.limit = limit
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get(self, region, role=None):
+        with self.lock:
+            f = self.sessions.get((role, region))
+            owner = f is None
+            if owner:
+                f = self.sessions[(role, region)] = Future()
+        if owner:
+            try:
+                f.set_result(self.assume(role, region) if role else boto3.session.Session(profile_name=self.base.profile_name, region_name=region))
+            except BaseException as e:
+                f.set_exception(e)
+        return f.result()
+
+    # the role is assumed up front, so a role that cannot be assumed fails here
+    def assume(self, role, region):
+        sts = Gateway(self.base.client('sts', region_name=region), rate=self.rate, retries=self.retries, metrics=self.metrics, service='sts', limit=self.limit)
+        session = get_session()
+        session.register_component('credential_provider', CredentialResolver([AssumedRole(sts, role)]))
+        session.set_config_variable('region', region)
+        session.get_credentials()
+        return boto3.session.Session(botocore_session=session)
+
+# an asset bundle held in memory, runs given one read and write it in place of the --assets file
+class Bundle:
+    def __init__(self, assets=None):
+        self.assets = assets if assets is not None else {}
 
 ###
 ## Helper functions
@@ -107,780 +427,2716 @@ class DateTimeEncoder(JSONEncoder):
             return obj.isoformat()
 
 
-# encapsulte some string objects with prefix and/or suffix
-def Encapsulate(s):
-    if len(args.prefix): s = '-'.join([args.prefix, s])
-    if len(args.suffix): s = '-'.join([s, args.suffix])
-    return s
-
-# builds a basic permission statement for each qs asset type
-# these are all QuickSight default permissions for an admin role
-# please edit this or edit the bundle to alter futher
-def BuildPermissionStatement(type, mode='rw', principal=args.principal):
-
-    # quicksite asset permissions for sanitization
-    def_permissions = {
-        'ro': {
-            'dashboards': [
-                'quicksight:DescribeDashboard',
-                'quicksight:ListDashboardVersions',
-                'quicksight:QueryDashboard'
-            ],
-            'analyses': [
-                'quicksight:DescribeAnalysisPermissions',
-                'quicksight:QueryAnalysis',
-                'quicksight:DescribeAnalysis'
-            ],
-            'datasets': [
-                'quicksight:DescribeDataSet',
-                'quicksight:DescribeDataSetPermissions',
-                'quicksight:PassDataSet',
-                'quicksight:DescribeIngestion',
-                'quicksight:ListIngestions'
-            ],
-            'datasources': [
-                'quicksight:DescribeDataSource',
-                'quicksight:DescribeDataSourcePermissions',
-                'quicksight:PassDataSource'
-            ]
-        },
-        'rw': {
-            'dashboards': [
-                'quicksight:DescribeDashboard',
-                'quicksight:ListDashboardVersions',
-                'quicksight:UpdateDashboardPermissions',
-                'quicksight:QueryDashboard',
-                'quicksight:UpdateDashboard',
-                'quicksight:DeleteDashboard',
-                'quicksight:DescribeDashboardPermissions',
-                'quicksight:UpdateDashboardPublishedVersion'
-            ],
-            'analyses': [
-                'quicksight:RestoreAnalysis',
-                'quicksight:UpdateAnalysisPermissions',
-                'quicksight:DeleteAnalysis',
-                'quicksight:DescribeAnalysisPermissions',
-                'quicksight:QueryAnalysis',
-                'quicksight:DescribeAnalysis',
-                'quicksight:UpdateAnalysis'
-            ],
-            'datasets': [
-                'quicksight:UpdateDataSetPermissions',
-                'quicksight:DescribeDataSet',
-                'quicksight:DescribeDataSetPermissions',
-                'quicksight:PassDataSet',
-                'quicksight:DescribeIngestion',
-                'quicksight:ListIngestions',
-                'quicksight:UpdateDataSet',
-                'quicksight:DeleteDataSet',
-                'quicksight:CreateIngestion',
-                'quicksight:CancelIngestion'
-            ],
-            'datasources': [
-                'quicksight:UpdateDataSourcePermissions',
-                'quicksight:DescribeDataSource',
-                'quicksight:DescribeDataSourcePermissions',
-                'quicksight:PassDataSource',
-                'quicksight:UpdateDataSource',
-                'quicksight:DeleteDataSource'
-            ]
-        }
-    }
-
-    if not mode: mode = 'rw'
-    return {
-        'Principal': f"{principal}",
-        'Actions': def_permissions[mode][type]
-    }
-
-# build permissions for asset
-def BuildPermissions(type):
-    perms = []
-    if args.principal: perms.append(BuildPermissionStatement(type))
-    if 'groups' in assets:
-        for i in assets['groups']:
-            perm = BuildPermissionStatement(type, mode='ro', principal=assets['groups'][i]['Arn'])
-            if perm: perms.append(perm)
-    return perms
-
-
-###
-## list APIs to retrieve asset catalogs
-###
-
-# get a catalog of themes
-def list_themes():
-    debug("listing themes")
-    opts = { 'MaxResults': 10 }
-    while True:
-        o = qs.list_themes(AwsAccountId=args.account, **opts)
-        for i in o['ThemeSummaryList']:
-            if 'themes' not in assets: assets['themes'] = {}
-            assets['themes'][i['Arn']] = i
-        if 'NextToken' not in o: break
-        opts['NextToken'] = o['NextToken']
-
-
-# get a catalog of namespaces
-def list_namespaces():
-    debug("listing namespaces")
-    opts = { 'MaxResults': 10 }
-    while True:
-        o = qs.list_namespaces(AwsAccountId=args.account, **opts)
-        for i in o['Namespaces']:
-            assets['namespaces'][i['Arn']] = i
-        if 'NextToken' not in o: break
-        opts['NextToken'] = o['NextToken']
-
-# get a catalog of templates
-def list_templates():
-    debug("listing templates")
-    opts = { 'MaxResults': 10 }
-    while True:
-        o = qs.list_templates(AwsAccountId=args.account, **opts)
-        for i in o['TemplateSummaryList']:
-
-            debug(f"retrieving versions for template {i['TemplateId']}")
-            sopts = { 'MaxResults': 10, 'TemplateId': i['TemplateId'] }
-            while True:
-                so = qs.list_template_versions(AwsAccountId=args.account, **sopts)
-                for si in so['TemplateVersionSummaryList']:
-                    debug(f"retrieved a version for a template {si['Arn']}")
-                    if 'Versions' not in i: i['Versions'] = {}
-                    i['Versions'][si['Arn']] = si
-                if 'NextToken' not in so: break
-                sopts['NextToken'] = so['NextToken']
-
-            assets['templates'][i['Arn']] = i
-
-        if 'NextToken' not in o: break
-        opts['NextToken'] = o['NextToken']
-
-# get a catalog of dashboards
-def list_dashboards():
-    debug("listing dashboards")
-    opts = { 'MaxResults': 10 }
-    while True:
-        o = qs.list_dashboards(AwsAccountId=args.account, **opts)
-        for i in o['DashboardSummaryList']:
-
-            debug(f"retrieving versions for dashboard {i['DashboardId']}")
-            sopts = { 'MaxResults': 10, 'DashboardId': i['DashboardId'] }
-            while True:
-                so = qs.list_dashboard_versions(AwsAccountId=args.account, **sopts)
-                for si in so['DashboardVersionSummaryList']:
-                    debug(f"retrieved a version for a dashboard {si['Arn']}")
-                    if 'Versions' not in i: i['Versions'] = {}
-                    i['Versions'][si['Arn']] = si
-                if 'NextToken' not in so: break
-                sopts['NextToken'] = so['NextToken']
-
-            assets['dashboards'][i['Arn']] = i
-            dashboards.append(i['DashboardId'])
-        if 'NextToken' not in o: break
-        opts['NextToken'] = o['NextToken']
-
-# get a catalog of analyses
-def list_analyses():
-    debug("listing analyses")
-    opts = { 'MaxResults': 10 }
-    while True:
-        o = qs.list_analyses(AwsAccountId=args.account, **opts)
-        for i in o['AnalysisSummaryList']:
-            assets['analyses'][i['Arn']] = i
-        if 'NextToken' not in o: break
-        opts['NextToken'] = o['NextToken']
-
-# get a catalog of datasets
-def list_datasets():
-    debug("listing datasets")
-    opts = { 'MaxResults': 10 }
-    while True:
-        o = qs.list_data_sets(AwsAccountId=args.account, **opts)
-        for i in o['DataSetSummaries']:
-
-            debug(f"retrieving ingestions for dataset {i['DataSetId']}")
-            sopts = { 'MaxResults': 10, 'DataSetId': i['DataSetId'] }
-            while True:
-                so = qs.list_ingestions(AwsAccountId=args.account, **sopts)
-                for si in so['Ingestions']:
-                    debug(f"retrieved a ingestions for a dataset {si['Arn']}")
-                    if 'Ingestions' not in i: i['Ingestions'] = {}
-                    i['Ingestions'][si['Arn']] = si
-                if 'NextToken' not in so: break
-                sopts['NextToken'] = so['NextToken']
+# streams events as compact json lines, each flushed as it happens, so the
+# log can be followed during a run and nothing is held in memory
+class EventLog:
+    def __init__(self, path, label=None):
+        self.file = open(path, 'a')
+        self.label = label
 
-            debug(f"retrieving refresh schedules for dataset {i['DataSetId']}")
-            sopts = { 'MaxResults': 10, 'DataSetId': i['DataSetId'] }
-            so = qs.list_refresh_schedules(AwsAccountId=args.account, DataSetId=i['DataSetId'])
-            if 'RefreshSchedules' in so: i['RefreshSchedules'] = so['RefreshSchedules']
+    def write(self, event, **fields):
+        record = { 'time': datetime.datetime.now(datetime.timezone.utc).isoformat(), 'event': event }
+        if self.label: record['run'] = self.label
+        record.update(fields)
+        line = json.dumps(record, cls=DateTimeEncoder, separators=(',', ':')) + '\n'
+        with OUTPUT_LOCK:
+            self.file.write(line)
+            self.file.flush()
 
-            assets['datasets'][i['Arn']] = i
-        if 'NextToken' not in o: break
-        opts['NextToken'] = o['NextToken']
-
-# get a catalog of datasources
-def list_datasources():
-    debug("retrieving datasource catalog")
-
-    opts = { 'MaxResults': 10 }
-    while True:
-        o = qs.list_data_sources(AwsAccountId=args.account, **opts)
-        for i in o['DataSources']:
-            assets['datasources'][i['Arn']] = i
-        if 'NextToken' not in o: break
-        opts['NextToken'] = o['NextToken']
+    def close(self):
+        self.file.close()
 
+###
+## Packed bundles - content addressed, compressed, deduplicated fragments
+###
 
-# get a catalog of groups
-# bug - should cycle through above and already retreived namespace catalog
-def list_groups():
-    debug("retrieving group catalog")
+PACK_FORMAT = 'qstool-pack/1'
+PACK_MAGIC = b'\x1f\x8b'
+
+# subtrees at least this long in compact json are stored once as a fragment
+PACK_FRAGMENT = 256
+
+# a subtree replaced by its fragment, which cannot occur inside a json string
+PACK_REF = '$ref'
+PACK_REFERENCE = re.compile(r'\{"\$ref":"([0-9a-f]+)"\}')
+
+# keys of the asset data that could be taken for a reference are stored with
+# one more $, and restored when the header says the bundle has any
+PACK_ESCAPED = re.compile(r'\$+ref')
+
+# a key as stored in a pack, noting in escaped when it had to be changed
+def PackKey(k, escaped):
+    if not isinstance(k, str) or not PACK_ESCAPED.fullmatch(k): return k
+    escaped.append(k)
+    return '$' + k
+
+# restores the escaped keys of an object read from a pack
+def UnpackKeys(obj):
+    if not any(PACK_ESCAPED.fullmatch(k) for k in obj): return obj
+    return { k[1:] if PACK_ESCAPED.fullmatch(k) else k: v for k, v in obj.items() }
+
+# compact json of a subtree and the content address of it
+def PackText(node):
+    text = json.dumps(node, cls=DateTimeEncoder, separators=(',', ':'))
+    return text, hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+# replace every large subtree, deepest first, with a reference to a fragment
+# holding it, so identical visuals, filters and fields are stored once
+def PackTree(obj, fragments, escaped, force=False):
+    if isinstance(obj, dict):
+        node = { PackKey(k, escaped): PackTree(v, fragments, escaped) for k, v in obj.items() }
+    elif isinstance(obj, list):
+        node = [PackTree(v, fragments, escaped) for v in obj]
+    else:
+        return obj
+    text, ref = PackText(node)
+    if len(text) < PACK_FRAGMENT and not force: return node
+    fragments[ref] = text
+    return { PACK_REF: ref }
+
+# a gzip stream of lines: the format, the root with every asset a fragment,
+# then each fragment as its address and compact json
+def PackBundle(assets):
+    fragments = {}
+    escaped = []
+    root = { PackKey(t, escaped): { PackKey(i, escaped): PackTree(a, fragments, escaped, True) for i, a in v.items() } if isinstance(v, dict) else PackTree(v, fragments, escaped) for t, v in assets.items() }
+    header = { 'format': PACK_FORMAT, 'fragments': len(fragments) }
+    if escaped: header['escaped'] = True
+    lines = [json.dumps(header), PackText(root)[0]]
+    lines += [f"{ref} {text}" for ref, text in fragments.items()]
+    return gzip.compress(('\n'.join(lines) + '\n').encode('utf-8'), mtime=0)
+
+# the json text with every reference replaced by the fragment it addresses,
+# each fragment expanded once however often it is referenced
+def UnpackText(text, fragments, expanded):
+    def Expand(m):
+        ref = m[1]
+        if ref not in expanded:
+            if ref not in fragments: raise ValueError(f"packed bundle is missing fragment {ref}")
+            expanded[ref] = UnpackText(fragments[ref], fragments, expanded)
+        return expanded[ref]
+    return PACK_REFERENCE.sub(Expand, text)
+
+# the assets of a packed bundle, expanded as text and parsed once
+def UnpackBundle(data):
+    lines = gzip.decompress(data).decode('utf-8').split('\n')
+    header = json.loads(lines[0])
+    if header.get('format') != PACK_FORMAT:
+        raise ValueError(f"unsupported packed bundle format {header.get('format')}")
+    fragments = dict(line.split(' ', 1) for line in lines[2:] if line)
+    return json.loads(UnpackText(lines[1], fragments, {}), object_hook=UnpackKeys if header.get('escaped') else None)
 
-    opts = { 'MaxResults': 10, 'Namespace':'default' }
-    while True:
-        o = qs.list_groups(AwsAccountId=args.account, **opts)
-        for i in o['GroupList']:
-            assets['groups'][i['Arn']] = i
-        if 'NextToken' not in o: break
-        opts['NextToken'] = o['NextToken']
+###
+## Indexed bundles - one asset per line, found through a sidecar index
+###
 
+INDEX_FORMAT = 'qstool-index/1'
+INDEX_MAGIC = b'{"format":"qstool-index/'
+INDEX_SIDECAR = '.idx'
+
+# appends leave superseded lines behind, the file is written again once
+# they take up more than this share of it
+INDEX_GARBAGE = 0.5
+
+# a header line with the asset types, then a line per asset of its type and
+# id followed by its compact json, the sidecar holds the offset and length of
+# each asset's json by type and id, and the size of the file it describes
+class IndexedBundle:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.index = self.LoadIndex()
+
+    # the sidecar index, rebuilt by scanning the file when missing or stale
+    def LoadIndex(self):
+        size = os.path.getsize(self.path)
+        try:
+            with open(self.path + INDEX_SIDECAR, 'r') as file:
+                index = json.loads(file.read())
+            if index.get('format') == INDEX_FORMAT and index.get('size') == size: return index
+        except (OSError, ValueError):
+            pass
+        return self.ScanIndex(size)
+
+    # only the type and id of each line are decoded, later lines replace earlier ones
+    def ScanIndex(self, size):
+        index = { 'format': INDEX_FORMAT, 'size': size, 'garbage': 0, 'assets': {} }
+        decoder = json.JSONDecoder()
+        offset = 0
+        with open(self.path, 'rb') as file:
+            for n, line in enumerate(file):
+                if n == 0:
+                    index['assets'] = { t: {} for t in json.loads(line)['types'] }
+                else:
+                    (t, i), end = decoder.raw_decode(line.decode('ascii'))
+                    found = index['assets'].setdefault(t, {})
+                    if i in found: index['garbage'] += found[i][1]
+                    text = line[end + 1:].rstrip(b'\n')
+                    if text == b'null':
+                        found.pop(i, None)
+                    else:
+                        found[i] = [offset + end + 1, len(text)]
+                offset += len(line)
+        SaveIndex(self.path, index)
+        return index
+
+    # parse one asset from its place in the file
+    def Read(self, t, i):
+        offset, length = self.index['assets'][t][i]
+        with open(self.path, 'rb') as file:
+            file.seek(offset)
+            return json.loads(file.read(length))
+
+    # every asset, parsed from a single read of the file
+    def Load(self):
+        with open(self.path, 'rb') as file:
+            data = file.read()
+        return { t: { i: json.loads(data[o:o + n]) for i, (o, n) in ids.items() } for t, ids in self.index['assets'].items() }
+
+    # the assets, each parsed when first used
+    def View(self):
+        return LazyAssets(self)
+
+    # append the assets set or removed in a view and record the order of its
+    # ids, the file is written again once superseded lines outweigh the rest
+    def Flush(self, view):
+        with self.lock:
+            lines = []
+            offset = self.index['size']
+            for t, ids in view.types.items():
+                found = self.index['assets'].setdefault(t, {})
+                for i in ids.changed:
+                    text = json.dumps(ids.loaded[i] if i in ids.loaded else None, cls=DateTimeEncoder, separators=(',', ':'))
+                    key = json.dumps([t, i])
+                    if i in found: self.index['garbage'] += found[i][1]
+                    lines.append(f"{key} {text}\n")
+                    if i in ids.loaded: found[i] = [offset + len(key) + 1, len(text)]
+                    else: found.pop(i, None)
+                    offset += len(lines[-1])
+                self.index['assets'][t] = { i: found[i] for i in ids.order if i in found }
+                ids.changed.clear()
+
+            if self.index['garbage'] > offset * INDEX_GARBAGE:
+                assets = { t: dict(ids.items()) for t, ids in view.items() }
+                self.index = WriteIndexed(self.path, assets)
+                return
+
+            with open(self.path, 'ab') as file:
+                file.write(''.join(lines).encode('ascii'))
+            self.index['size'] = offset
+            SaveIndex(self.path, self.index)
+
+# the asset types of an indexed bundle
+class LazyAssets(MutableMapping):
+    def __init__(self, bundle):
+        self.bundle = bundle
+        self.types = { t: LazyType(bundle, t, list(ids)) for t, ids in bundle.index['assets'].items() }
+
+    def __getitem__(self, t):
+        return self.types[t]
+
+    def __setitem__(self, t, ids):
+        self.types[t] = LazyType(self.bundle, t, list(self.types[t].order) if t in self.types else [])
+        self.types[t].changed.update(self.types[t].order)
+        self.types[t].order = []
+        for i, obj in ids.items(): self.types[t][i] = obj
+
+    def __delitem__(self, t):
+        self[t] = {}
+
+    def __iter__(self):
+        return iter(self.types)
+
+    def __len__(self):
+        return len(self.types)
+
+# the assets of one type of an indexed bundle, each parsed when first used,
+# those set or removed are kept until flushed
+class LazyType(MutableMapping):
+    def __init__(self, bundle, t, order):
+        self.bundle = bundle
+        self.t = t
+        self.order = order
+        self.loaded = {}
+        self.changed = set()
+        self.lock = threading.Lock()
+
+    def __getitem__(self, i):
+        with self.lock:
+            if i not in self.loaded:
+                if i not in self.bundle.index['assets'].get(self.t, {}) or i in self.changed: raise KeyError(i)
+                self.loaded[i] = self.bundle.Read(self.t, i)
+            return self.loaded[i]
+
+    def __setitem__(self, i, obj):
+        with self.lock:
+            if i not in self: self.order.append(i)
+            self.loaded[i] = obj
+            self.changed.add(i)
+
+    def __delitem__(self, i):
+        with self.lock:
+            if i not in self.order: raise KeyError(i)
+            self.order.remove(i)
+            self.loaded.pop(i, None)
+            self.changed.add(i)
+
+    def __contains__(self, i):
+        return i in self.order
+
+    def __iter__(self):
+        return iter(list(self.order))
+
+    def __len__(self):
+        return len(self.order)
+
+    # put the ids in the given order without parsing the assets
+    def Reorder(self, ids):
+        with self.lock:
+            self.order = [i for i in ids if i in self.order] + [i for i in self.order if i not in ids]
+
+# write a whole indexed bundle and its sidecar, returns the index
+def WriteIndexed(path, assets):
+    index = { 'format': INDEX_FORMAT, 'size': 0, 'garbage': 0, 'assets': {} }
+    with open(path, 'wb') as file:
+        header = json.dumps({ 'format': INDEX_FORMAT, 'types': list(assets) }, separators=(',', ':')) + '\n'
+        file.write(header.encode('ascii'))
+        offset = len(header)
+        for t, ids in assets.items():
+            index['assets'][t] = {}
+            for i, obj in ids.items():
+                key = json.dumps([t, i])
+                text = json.dumps(obj, cls=DateTimeEncoder, separators=(',', ':'))
+                file.write(f"{key} {text}\n".encode('ascii'))
+                index['assets'][t][i] = [offset + len(key) + 1, len(text)]
+                offset += len(key) + len(text) + 2
+    index['size'] = offset
+    SaveIndex(path, index)
+    return index
+
+# replace the sidecar index of a bundle
+def SaveIndex(path, index):
+    with open(path + INDEX_SIDECAR + '.tmp', 'w') as file:
+        file.write(json.dumps(index, separators=(',', ':')))
+    os.replace(path + INDEX_SIDECAR + '.tmp', path + INDEX_SIDECAR)
+
+# the assets as plain dicts, parsing any not yet used
+def PlainAssets(assets):
+    if isinstance(assets, LazyAssets): return { t: dict(ids.items()) for t, ids in assets.items() }
+    return assets
+
+# read an asset bundle file, packed, indexed or plain json, with lazy the
+# assets of an indexed file are parsed only when used
+def ReadBundle(path, lazy=False):
+    with open(path, 'rb') as file:
+        head = file.read(len(INDEX_MAGIC))
+    if head.startswith(INDEX_MAGIC):
+        bundle = IndexedBundle(path)
+        return bundle.View() if lazy else bundle.Load()
+    with open(path, 'rb') as file:
+        data = file.read()
+    if data[:2] == PACK_MAGIC: return UnpackBundle(data)
+    return json.loads(data)
+
+# write an asset bundle file, packed or indexed when named with their suffix,
+# the changes to a lazily read indexed bundle are appended to it
+def WriteBundle(path, assets):
+    if isinstance(assets, LazyAssets) and assets.bundle.path == path:
+        assets.bundle.Flush(assets)
+        return
+    assets = PlainAssets(assets)
+    if path.endswith(INDEX_SUFFIX):
+        WriteIndexed(path, assets)
+        return
+    if path.endswith(PACK_SUFFIX):
+        with open(path, 'wb') as file:
+            file.write(PackBundle(assets))
+        return
+    with open(path, 'w') as file:
+        json.dump(assets, file, cls=DateTimeEncoder, indent=4)
 
 ###
-## describe APIs to retrieve asset descriptions
+## Sanitize rules - compiled once, applied to every key and string of a bundle
 ###
 
-# describe a dashboard
-def describe_dashboard(i):
-    try:
-        debug(f"retrieving dashboard definition {i}")
-        asset = qs.describe_dashboard_definition(AwsAccountId=args.account, DashboardId=i)
-        perms = qs.describe_dashboard_permissions(AwsAccountId=args.account, DashboardId=i)
-        asset['Permissions'] = perms['Permissions']
-        asset['Name'] = Encapsulate(asset['Name'])
-        asset['DashboardId'] = Encapsulate(asset['DashboardId'])
+# quicksight arns are rewritten to the region and account placeholders
+SANITIZE_ARN = re.compile(r'(?i)(arn:aws:quicksight):([^:]*):([^aws:]*):([^"]+)')
+SANITIZE_REGION = re.compile(r'(?i)<aws-region>')
+SANITIZE_ACCOUNT = re.compile(r'(?i)<aws-account>')
+
+# correct region for Amazon Security Lake
+# amazon_security_lake_glue_db_us_east_1
+# amazon_security_lake_table_us_east_1_vpc_flow
+# (table names are only rewritten once they carry the placeholder)
+SANITIZE_SLDB = re.compile(r'(?i)(amazon_security_lake_glue_db_)([^_]+_[^_]+_\d+)')
+SANITIZE_SLREGION = re.compile(r'(?i)<aws-security-lake-region>')
+
+# strings matching none of these are left as they are
+SANITIZE_ANY = re.compile(r'(?i)arn:aws:quicksight:|<aws-|amazon_security_lake_glue_db_')
+
+# sanitizes every key and string of a parsed bundle in a single walk
+# values are replaced in place, a dict is only rebuilt if a key changes
+def SanitizeTree(node, sanitize):
+    if isinstance(node, str):
+        return sanitize(node)
+    if isinstance(node, list):
+        for k, v in enumerate(node):
+            node[k] = SanitizeTree(v, sanitize)
+    elif isinstance(node, dict):
+        for k, v in node.items():
+            node[k] = SanitizeTree(v, sanitize)
+        if any(sanitize(k) != k for k in node):
+            node = { sanitize(k): v for k, v in node.items() }
+    return node
 
-        for perm in perms['Permissions']:
-            rm = re.match(r'(?i)(arn:aws:quicksight:[^:]*:[^:]*:(group)/default/(.+))', perm['Principal'])
-            if rm and rm.group(2) in ['group']:
-                group = describe_group(rm.group(3))
 
-        assets["dashboards"][asset["DashboardId"]] = asset
+###
+## Deployment scheduling - dependency graph of a bundle
+###
 
-    except Exception as e:
-        err = 0 if args.ignore else 255
-        debug(f"!! dashboard {e}", err)
+# asset collections in the order they are deployed when created
+DEPLOY_ORDER = ['groups', 'datasources', 'datasets', 'analyses', 'dashboards']
+
+# asset collection of each type given on the command line
+TYPE_PLURALS = { 'dashboard': 'dashboards', 'analysis': 'analyses', 'dataset': 'datasets', 'datasource': 'datasources', 'group': 'groups' }
+
+# ids of the datasources a dataset reads from
+def DataSourceRefs(obj):
+    refs = []
+    for t in obj.get('PhysicalTableMap', {}).values():
+        if 'CustomSql' in t and 'DataSourceArn' in t['CustomSql']:
+            refs.append(t['CustomSql']['DataSourceArn'].split('/')[-1])
+    return refs
+
+# ids of the datasets an analysis or dashboard reads from
+def DataSetRefs(obj):
+    refs = []
+    for d in obj.get('Definition', {}).get('DataSetIdentifierDeclarations', []):
+        refs.append(d['DataSetArn'].split('/')[-1])
+    return refs
+
+# names of the groups granted permissions on an asset
+def GroupRefs(obj):
+    refs = []
+    for perm in obj.get('Permissions', []):
+        rm = re.match(r'(?i)arn:aws:quicksight:[^:]*:[^:]*:group/default/(.+)', perm['Principal'])
+        if rm: refs.append(rm.group(1))
+    return refs
 
-    return asset
+###
+## Partition pruning - Security Lake queries read only the partitions they need
+###
 
-# describe an analysis
-def describe_analysis(i):
-    try:
-        debug(f"retrieving analysis definition {i}")
-        asset = qs.describe_analysis_definition(AwsAccountId=args.account, AnalysisId=i)
-        perms = qs.describe_analysis_permissions(AwsAccountId=args.account, AnalysisId=i)
-        asset['Permissions'] = perms['Permissions']
-        asset['Name'] = Encapsulate(asset['Name'])
-        asset['AnalysisId'] = Encapsulate(asset['AnalysisId'])
-
-        for perm in perms['Permissions']:
-            rm = re.match(r'(?i)(arn:aws:quicksight:[^:]*:[^:]*:group/default/(.+))', perm['Principal'])
-            if rm and rm.group(2) in ['TestGroup']:
-                group = describe_group(rm.group(2))
-
-        assets["analyses"][asset["AnalysisId"]] = asset
-    except Exception as e:
-        err = 0 if args.ignore else 255
-        debug(f"!! analysis {e}", err)
-    return asset
+# a Security Lake table read by a query, with its alias
+PARTITION_TABLE = re.compile(r'(?i)("amazon_security_lake_table_[^"]+"|\bamazon_security_lake_table_\w+)(\s+(?:as\s+)?(?!(?:where|group|order|limit|union|intersect|except|join|inner|left|right|full|cross|natural|having)\b)\w+)?')
+
+# the partition predicate of a Security Lake table, the eventDay window in days
+# and the account and region allow-lists added to it
+PARTITION_PREDICATE = re.compile(r"(?i)eventDay\s*>=\s*cast\(\s*date_format\(\s*current_timestamp\s*-\s*INTERVAL\s*'(\d+)'\s*day\s*,\s*'%Y%m%d%H'\s*\)\s*as\s+varchar\s*\)((?:\s+and\s+(?:accountid|region)\s+IN\s*\([^)]*\))*)")
+PARTITION_LIST = re.compile(r'(?i)\s+and\s+(accountid|region)\s+IN\s*\([^)]*\)')
+
+# what may follow a table without a where clause for one to be added after it
+PARTITION_NEXT = re.compile(r'(?i)\s*(\)|;|$|group\b|order\b|limit\b|union\b|intersect\b|except\b)')
+
+# what ends the condition of a where clause, and an or that may split it
+PARTITION_CONDITION = re.compile(r'''(?i)[()'";]|\b(or|group|order|limit|having|window|union|intersect|except)\b''')
+
+# end of the where condition starting at start, and whether it has an OR
+# outside parentheses, which binds looser than a predicate added with AND
+def WhereCondition(sql, start):
+    depth = 0
+    quote = None
+    ors = False
+    for m in PARTITION_CONDITION.finditer(sql, start):
+        c = m.group(0)
+        if quote:
+            if c == quote: quote = None
+        elif c in '\'"': quote = c
+        elif c == '(': depth += 1
+        elif c == ')':
+            if depth == 0: return m.start(), ors
+            depth -= 1
+        elif depth == 0:
+            if c == ';' or m.group(1).lower() != 'or': return m.start(), ors
+            ors = True
+    return len(sql), ors
+
+# allow-list of a partition column
+def PartitionList(column, values):
+    return f" and {column} IN (" + ', '.join(f"'{v}'" for v in values) + ")" if values else ''
+
+# partition predicate reading the last days of the given accounts and regions
+def PartitionPredicate(days, accounts=None, regions=None):
+    return f"eventDay >= cast(date_format(current_timestamp - INTERVAL '{days}' day, '%Y%m%d%H') as varchar)" + PartitionList('accountid', accounts) + PartitionList('region', regions)
+
+# each Security Lake table read by a query, with its partition predicate or None
+def PartitionScopes(sql):
+    refs = list(PARTITION_TABLE.finditer(sql))
+    for k, m in enumerate(refs):
+        end = refs[k + 1].start() if k + 1 < len(refs) else len(sql)
+        yield m, PARTITION_PREDICATE.search(sql, m.end(), end)
+
+# rewrites the partition predicate of every Security Lake table read by a query
+# existing predicates are only rewritten for the options given, missing ones are
+# added with DEF_DAYS by default, the selected columns are left as they are
+# returns the query and the number of tables a predicate could not be added for
+def PrunePartitions(sql, days=None, accounts=None, regions=None):
+    out = []
+    last = 0
+    skipped = 0
+    for m, p in PartitionScopes(sql):
+        if p:
+            if days or accounts or regions:
+                kept = { c.group(1).lower(): c.group(0) for c in PARTITION_LIST.finditer(p.group(2)) }
+                predicate = PartitionPredicate(days or int(p.group(1)))
+                predicate += PartitionList('accountid', accounts) if accounts else kept.get('accountid', '')
+                predicate += PartitionList('region', regions) if regions else kept.get('region', '')
+                out += [sql[last:p.start()], predicate]
+                last = p.end()
+            continue
+        predicate = PartitionPredicate(days or DEF_DAYS, accounts, regions)
+        w = re.compile(r'(?i)\s*where\b\s*').match(sql, m.end())
+        if w:
+            end, ors = WhereCondition(sql, w.end())
+            condition = sql[w.end():end].rstrip()
+            if ors:
+                out += [sql[last:w.end()], f"{predicate} and ({condition})"]
+                last = w.end() + len(condition)
+            else:
+                out += [sql[last:w.end()], predicate + ' and ']
+                last = w.end()
+        elif PARTITION_NEXT.match(sql, m.end()):
+            out += [sql[last:m.end()], f" WHERE {predicate}"]
+            last = m.end()
+        else:
+            skipped += 1
+    out.append(sql[last:])
+    return ''.join(out), skipped
 
-# describe a dataset
-def describe_dataset(i):
-    debug(f"retrieving datasets, permissions, and refresh schedule(s) {i}")
-    try:
-        asset = qs.describe_data_set(AwsAccountId=args.account, DataSetId=i)['DataSet']
-        perms = qs.describe_data_set_permissions(AwsAccountId=args.account, DataSetId=i)
-        if 'Permissions' in asset: asset['Permissions'] = perms['Permissions']
-
-        for perm in perms['Permissions']:
-            rm = re.match(r'(?i)(arn:aws:quicksight:[^:]*:[^:]*:group/default/(.+))', perm['Principal'])
-            if rm and rm.group(2) in ['TestGroup']:
-                group = describe_group(rm.group(2))
-
-        ar = []
-        schedules = qs.list_refresh_schedules(AwsAccountId=args.account, DataSetId=i)
-        for schedule in schedules['RefreshSchedules']:
-            if 'ScheduleId' not in schedule: next
-            rs = qs.describe_refresh_schedule(AwsAccountId=args.account, DataSetId=i, ScheduleId=schedule['ScheduleId'])
-            if 'RefreshSchedule' in rs: ar.append(rs['RefreshSchedule'])
-        if len(ar): asset['RefreshSchedules'] = ar
-
-        asset['Name'] = Encapsulate(asset['Name'])
-        asset['DataSetId'] = Encapsulate(asset['DataSetId'])
-
-        assets["datasets"][i] = asset
-    except Exception as e:
-        err = 0 if args.ignore else 255
-        debug(f"!! dataset {e}", err)
+###
+## CustomSql lint - scan cost risks found offline in the queries of a bundle
+###
 
-    return asset
+LINT_SELECT_ALL = re.compile(r'(?i)\bselect\s+(?:distinct\s+)?\*\s*(,?)[^;]*?\bfrom\s+("?[\w<>-]+"?\s*\.\s*)?("?[\w<>-]+"?)')
+LINT_DISTINCT = re.compile(r'(?i)\bselect\s+distinct\b')
+LINT_ORDER = re.compile(r'(?i)\border\s+by\b')
+LINT_LIMIT = re.compile(r'(?i)\blimit\s+\d+')
+
+# findings of a single CustomSql, [(severity, message)]
+# output holds the columns the dataset keeps, None when it is not known
+def LintSql(sql, columns, output=None):
+    findings = []
+    for m, p in PartitionScopes(sql):
+        if not p and not re.search(r'(?i)\beventday\b', sql[m.end():]):
+            table = m.group(1).strip('"')
+            findings.append(('error', f"{table} is read without an eventDay partition predicate, scanning every partition"))
+    for m in LINT_SELECT_ALL.finditer(sql):
+        table = m.group(3).strip('"')
+        if PARTITION_TABLE.match(m.group(3)):
+            findings.append(('warning', f"SELECT * reads every column of {table}"))
+        else:
+            findings.append(('info', f"SELECT * from {table}, the columns read depend on it"))
+    if not LINT_LIMIT.search(sql):
+        if LINT_DISTINCT.search(sql): findings.append(('warning', "SELECT DISTINCT without a LIMIT deduplicates the whole result"))
+        if LINT_ORDER.search(sql): findings.append(('warning', "ORDER BY without a LIMIT sorts the whole result, which the dataset does not keep"))
+    if output is not None:
+        unused = [c['Name'] for c in columns if c['Name'] not in output]
+        if unused: findings.append(('warning', f"{len(unused)} column(s) selected but not in the dataset output: {', '.join(unused)}"))
+    return findings
+
+# columns a dataset keeps, its OutputColumns or else the projected columns, along
+# with the columns renamed or calculated from, None when neither is known
+def DatasetOutput(obj):
+    kept = set(c['Name'] for c in obj.get('OutputColumns', []))
+    used = set()
+    for table in obj.get('LogicalTableMap', {}).values():
+        for op in table.get('DataTransforms', []):
+            if 'ProjectOperation' in op and 'OutputColumns' not in obj: kept.update(op['ProjectOperation']['ProjectedColumns'])
+            if 'RenameColumnOperation' in op: used.add(op['RenameColumnOperation']['ColumnName'])
+            for c in op.get('CreateColumnsOperation', {}).get('Columns', []):
+                used.update(re.findall(r'\{([^}]+)\}', c.get('Expression', '')))
+    return kept | used if kept else None
 
-# describe a datasource
-def describe_datasource(i):
-    debug(f"retrieving datasource and permissions {i}")
-    try:
-        asset = qs.describe_data_source(AwsAccountId=args.account, DataSourceId=i)['DataSource']
-        perms = qs.describe_data_source_permissions(AwsAccountId=args.account, DataSourceId=i)
-        asset['Permissions'] = perms['Permissions']
-        asset['Name'] = Encapsulate(asset['Name'])
-        asset['DataSourceId'] = Encapsulate(asset['DataSourceId'])
-
-        for perm in perms['Permissions']:
-            rm = re.match(r'(?i)(arn:aws:quicksight:[^:]*:[^:]*:group/default/(.+))', perm['Principal'])
-            if rm and rm.group(2) in ['TestGroup']:
-                group = describe_group(rm.group(2))
-
-        assets["datasources"][i] = asset
-    except Exception as e:
-        err = 0 if args.ignore else 255
-        debug(f"!! datasource {e}", err)
-    return asset
+###
+## Column pruning - datasets keep only the columns their analyses and dashboards use
+###
 
+# splits sql at the commas outside of parentheses, brackets and quotes
+def SplitTopLevel(sql):
+    parts = []
+    depth = 0
+    quote = None
+    last = 0
+    for k, c in enumerate(sql):
+        if quote:
+            if c == quote: quote = None
+        elif c in '\'"': quote = c
+        elif c in '([': depth += 1
+        elif c in ')]': depth -= 1
+        elif c == ',' and depth == 0:
+            parts.append(sql[last:k])
+            last = k + 1
+    parts.append(sql[last:])
+    return parts
+
+# span of the select list of the outermost select of a query, None unless
+# there is exactly one, as a union or intersect cannot be pruned one side at a time
+def SelectSpan(sql):
+    depth = 0
+    quote = None
+    found = []
+    for m in re.finditer(r'''(?i)[()'"]|\b(select|from|union|intersect|except)\b''', sql):
+        c = m.group(0)
+        if quote:
+            if c == quote: quote = None
+        elif c in '\'"': quote = c
+        elif c == '(': depth += 1
+        elif c == ')': depth -= 1
+        elif depth == 0: found.append((m.group(1).lower(), m))
+    keywords = [k for k, _ in found]
+    if keywords.count('select') != 1 or any(k in keywords for k in ['union', 'intersect', 'except']): return None
+    k = keywords.index('select')
+    if k + 1 >= len(found) or keywords[k + 1] != 'from': return None
+    select = found[k][1].end()
+    distinct = re.match(r'(?i)\s+(distinct|all)\b', sql[select:])
+    return (select + distinct.end() if distinct else select), found[k + 1][1].start()
+
+# output column name of a select item, None when it cannot be told
+def SelectName(item):
+    m = re.search(r'(?is)\bas\s+"?(\w+)"?\s*$', item)
+    if m: return m.group(1)
+    m = re.fullmatch(r'\s*"?([\w.]+)"?\s*', item)
+    if m: return m.group(1).split('.')[-1]
+    return None
+
+# removes the select items of the outermost select whose output is not kept,
+# names are compared without case as athena lowercases them, items without a
+# known name are kept, returns the query and the names removed, or None when
+# its select list cannot be pruned
+def PruneSelect(sql, keep):
+    span = SelectSpan(sql)
+    if not span: return None
+    body = sql[span[0]:span[1]]
+    items = SplitTopLevel(body.rstrip())
+    if any(i.strip() == '*' or i.strip().endswith('.*') for i in items): return None
+    keep = set(k.lower() for k in keep)
+    names = [SelectName(i) for i in items]
+    kept = [i for i, n in zip(items, names) if n is None or n.lower() in keep]
+    if not kept: return None
+    removed = set(n.lower() for n in names if n is not None and n.lower() not in keep)
+    return sql[:span[0]] + ','.join(kept) + body[len(body.rstrip()):] + sql[span[1]:], removed
+
+# columns of the datasets in a bundle used by its analyses and dashboards,
+# { dataset id: set of names }, names are matched against calculated field
+# expressions as words so any column they might read is kept
+# datasets used by an asset without a definition are left out, as unknown
+def UsedColumns(bundle):
+    used = {}
+    unknown = set()
+
+    def Walk(node, ids, found):
+        if isinstance(node, dict):
+            if 'DataSetIdentifier' in node and 'ColumnName' in node:
+                found.setdefault(ids.get(node['DataSetIdentifier']), set()).add(node['ColumnName'])
+            if 'DataSetIdentifier' in node and 'Expression' in node:
+                found.setdefault(ids.get(node['DataSetIdentifier']), set()).add(('expression', node['Expression']))
+            for v in node.values(): Walk(v, ids, found)
+        elif isinstance(node, list):
+            for v in node: Walk(v, ids, found)
+
+    for t in ['analyses', 'dashboards']:
+        for obj in bundle.get(t, {}).values():
+            if 'Definition' not in obj:
+                unknown.update(re.findall(r'dataset/([\w-]+)', json.dumps(obj)))
+                continue
+            ids = { d['Identifier']: d['DataSetArn'].split('/')[-1] for d in obj['Definition'].get('DataSetIdentifierDeclarations', []) }
+            found = {}
+            Walk(obj['Definition'], ids, found)
+            for i in ids.values():
+                used.setdefault(i, set()).update(found.get(i, set()))
+    return { i: c for i, c in used.items() if i not in unknown }
+
+# whether a column name is used as a word in any of the expressions
+def InExpressions(name, expressions):
+    pattern = re.compile(r'(?<![\w.])' + re.escape(name) + r'(?!\w)')
+    return any(pattern.search(e) for e in expressions)
+
+# trims a dataset to the used columns, along with those its own transforms,
+# filters, folders and refresh properties need, every CustomSql must be prunable
+# returns the columns dropped, None when the dataset cannot be pruned
+def PruneColumns(obj, used):
+    expressions = [u[1] for u in used if isinstance(u, tuple)]
+    keep = set(u for u in used if not isinstance(u, tuple))
+    tables = obj.get('PhysicalTableMap', {}).values()
+    if not tables or any('SqlQuery' not in t.get('CustomSql', {}) for t in tables): return None
+    columns = [c['Name'] for t in tables for c in t['CustomSql'].get('Columns', [])]
+
+    # the dataset's own transforms read columns too
+    renames = {}
+    for table in obj.get('LogicalTableMap', {}).values():
+        if 'JoinProperties' in table or 'JoinInstruction' in table.get('Source', {}): return None
+        for op in table.get('DataTransforms', []):
+            if 'RenameColumnOperation' in op:
+                renames[op['RenameColumnOperation']['NewColumnName']] = op['RenameColumnOperation']['ColumnName']
+            if 'FilterOperation' in op:
+                expressions.append(op['FilterOperation']['ConditionExpression'])
+            for c in op.get('CreateColumnsOperation', {}).get('Columns', []):
+                if c['ColumnName'] in keep or InExpressions(c['ColumnName'], expressions): expressions.append(c['Expression'])
+    window = obj.get('DataSetRefreshProperties', {}).get('RefreshConfiguration', {}).get('IncrementalRefresh', {}).get('LookbackWindow', {})
+    if window: keep.add(window['ColumnName'])
+    for rule in obj.get('RowLevelPermissionTagConfiguration', {}).get('TagRules', []): keep.add(rule['ColumnName'])
+    for group in obj.get('ColumnGroups', []):
+        for g in group.values(): keep.update(g.get('Columns', []))
+    keep |= set(renames.get(k) for k in list(keep) if k in renames)
+    keep |= set(c for c in columns if InExpressions(c, expressions))
+
+    if all(c in keep for c in columns): return []
+    pruned = {}
+    for k, t in obj['PhysicalTableMap'].items():
+        pruned[k] = PruneSelect(t['CustomSql']['SqlQuery'], keep)
+        if pruned[k] is None: return None
+
+    # only columns whose select item was removed are dropped
+    removed = set().union(*[r for _, r in pruned.values()])
+    dropped = [c for c in columns if c.lower() in removed]
+    gone = set(dropped) | set(n for n, c in renames.items() if c in dropped)
+    for k, t in obj['PhysicalTableMap'].items():
+        t['CustomSql']['SqlQuery'] = pruned[k][0]
+        t['CustomSql']['Columns'] = [c for c in t['CustomSql'].get('Columns', []) if c['Name'] not in gone]
+    for table in obj.get('LogicalTableMap', {}).values():
+        transforms = []
+        for op in table.get('DataTransforms', []):
+            if 'ProjectOperation' in op:
+                op['ProjectOperation']['ProjectedColumns'] = [c for c in op['ProjectOperation']['ProjectedColumns'] if c not in gone]
+            for name in ['TagColumnOperation', 'UntagColumnOperation', 'CastColumnTypeOperation', 'RenameColumnOperation']:
+                if name in op and op[name]['ColumnName'] in gone: break
+            else:
+                transforms.append(op)
+        table['DataTransforms'] = transforms
+    if 'OutputColumns' in obj:
+        obj['OutputColumns'] = [c for c in obj['OutputColumns'] if c['Name'] not in gone]
+    for folder in list(obj.get('FieldFolders', {})):
+        obj['FieldFolders'][folder]['columns'] = [c for c in obj['FieldFolders'][folder].get('columns', []) if c not in gone]
+        if not obj['FieldFolders'][folder]['columns']: del obj['FieldFolders'][folder]
+    for rule in obj.get('ColumnLevelPermissionRules', []):
+        rule['ColumnNames'] = [c for c in rule.get('ColumnNames', []) if c not in gone]
+    return dropped
 
-# describe a datasource
-def describe_group(i):
-    debug(f"retrieving group {i}")
-    try:
-        asset = qs.describe_group(AwsAccountId=args.account, GroupName=i, Namespace='default')['Group']
-        asset['GroupName'] = Encapsulate(asset['GroupName'])
-        asset['PrincipalId'] = Encapsulate(asset['PrincipalId'])
+###
+## SPICE capacity - current use from the catalog and projected use of a bundle
+###
 
-        assets["groups"][i] = asset
-    except Exception as e:
-        err = 0 if args.ignore else 255
-        debug(f"!! group {e}", err)
-    return asset
+# ingestions that load a whole dataset, their size is the dataset's size in SPICE
+FULL_INGESTIONS = ['INITIAL_INGESTION', 'EDIT', 'FULL_REFRESH']
+
+# SPICE bytes of a catalog dataset, from its latest completed full ingestion, None if not known
+def CatalogSpice(entry):
+    if entry.get('ImportMode') not in [None, 'SPICE']: return 0
+    done = [g for g in entry.get('Ingestions', {}).values() if g.get('IngestionStatus') == 'COMPLETED' and g.get('RequestType', 'FULL_REFRESH') in FULL_INGESTIONS and g.get('IngestionSizeInBytes') is not None]
+    if not done: return entry.get('ConsumedSpiceCapacityInBytes')
+    return max(done, key=lambda g: str(g.get('CreatedTime', '')))['IngestionSizeInBytes']
+
+# projected SPICE use of the account once a bundle is deployed
+# bundle datasets are estimated by their current size in the account, or by the
+# size exported with them from another account, the other datasets keep theirs
+# returns [(id, import mode, current bytes, estimated bytes, estimated from)],
+# the bytes of the other datasets, and the projected total
+def SpiceProjection(bundle, current):
+    rows = []
+    datasets = bundle.get('datasets', {})
+    for i, obj in datasets.items():
+        if obj.get('ImportMode') != 'SPICE':
+            rows.append((i, obj.get('ImportMode'), current.get(i), 0, 'not in SPICE'))
+        elif current.get(i) is not None:
+            rows.append((i, 'SPICE', current[i], current[i], 'catalog'))
+        elif obj.get('ConsumedSpiceCapacityInBytes'):
+            rows.append((i, 'SPICE', None, obj['ConsumedSpiceCapacityInBytes'], 'bundle'))
+        else:
+            rows.append((i, 'SPICE', None, None, 'unknown'))
+    others = sum(b or 0 for i, b in current.items() if i not in datasets)
+    return rows, others, others + sum(r[3] or 0 for r in rows)
+
+# builds the dependency graph of the assets in a bundle
+# maps each (type, id) to the set of (type, id) it needs deployed first,
+# references to assets outside of the bundle are left to the account
+def BuildDependencies(bundle):
+    graph = {}
+    for t in DEPLOY_ORDER:
+        for i in bundle.get(t, {}):
+            graph[(t, i)] = set()
+
+    for (t, i), deps in graph.items():
+        obj = bundle[t][i]
+        refs = [('groups', g) for g in GroupRefs(obj)]
+        if t in ['datasets']:
+            refs += [('datasources', d) for d in DataSourceRefs(obj)]
+        if t in ['analyses', 'dashboards']:
+            refs += [('datasets', d) for d in DataSetRefs(obj)]
+        for r in refs:
+            if r in graph and r != (t, i): deps.add(r)
+
+    return graph
 
+###
+## Deployment state - content hashes of what was deployed to each account
+###
+
+# runs in the same process share the state and output files
+STATE_LOCK = threading.Lock()
+OUTPUT_LOCK = threading.Lock()
+
+# fields that change with every export or deployment, not with content
+VOLATILE_KEYS = ['ResponseMetadata', 'RequestId', 'Status', 'ResourceStatus', 'Arn', 'CreatedTime', 'LastUpdatedTime', 'LastModifiedTime', 'ConsumedSpiceCapacityInBytes', 'OutputColumns']
+
+# canonical content hash of a sanitized asset definition
+def AssetHash(obj):
+    content = { k: v for k, v in obj.items() if k not in VOLATILE_KEYS }
+    canonical = json.dumps(content, cls=DateTimeEncoder, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+# content hashes of every deployable asset in a bundle
+def BundleHashes(bundle):
+    return { (t, i): AssetHash(bundle[t][i]) for t in DEPLOY_ORDER for i in bundle.get(t, {}) }
+
+# every node that depends on any of the given nodes, directly or not
+def Downstream(graph, nodes):
+    found = set(nodes)
+    grew = True
+    while grew:
+        grew = False
+        for n, deps in graph.items():
+            if n not in found and deps & found:
+                found.add(n)
+                grew = True
+    return found
+
+# compare a bundle with the deployed state of the account
+# returns the nodes that are new, changed, and affected by a changed dependency
+def PlanChanges(graph, hashes, deployed):
+    new = [n for n in graph if n[1] not in deployed.get(n[0], {})]
+    changed = [n for n in graph if n[1] in deployed.get(n[0], {}) and deployed[n[0]][n[1]] != hashes[n]]
+    downstream = Downstream(graph, new + changed) - set(new + changed)
+    affected = [n for n in graph if n in downstream]
+    return new, changed, affected
 
 ###
-## create/update/delete APIs to provosion assets
+## Bundle merging - shared assets are deployed once
 ###
 
-# create/deploy a dashboard
-def deploy_dashboard(obj):
-    if not args.nofollow:
-        for d in obj['Definition']['DataSetIdentifierDeclarations']:
-            ds = d['DataSetArn'].split('/')[-1]
-            result = deploy_dataset(assets['datasets'][ds])
-            d['DataSetArn'] = result['Arn']
+# combines two permission lists of an asset, actions are merged per principal
+def MergePermissions(a, b):
+    merged = { p['Principal']: list(p['Actions']) for p in a }
+    for p in b:
+        actions = merged.setdefault(p['Principal'], [])
+        actions += [x for x in p['Actions'] if x not in actions]
+    return [{ 'Principal': k, 'Actions': v } for k, v in merged.items()]
+
+# merges named bundles, [(name, bundle)], into one holding every asset once by id
+# permissions are combined, any other difference between definitions of an asset
+# is a conflict and the first definition is kept
+# returns the merged bundle, the bundles each asset came from, and the conflicts
+def MergeBundles(bundles):
+    merged = {}
+    sources = {}
+    conflicts = []
+    for name, bundle in bundles:
+        for t, objs in bundle.items():
+            into = merged.setdefault(t, {})
+            for i, obj in objs.items():
+                if i not in into:
+                    into[i] = obj
+                    sources[(t, i)] = [name]
+                    continue
+                sources[(t, i)].append(name)
+                kept = into[i]
+                if AssetHash({ k: v for k, v in kept.items() if k != 'Permissions' }) != AssetHash({ k: v for k, v in obj.items() if k != 'Permissions' }):
+                    conflicts.append(((t, i), sources[(t, i)][0], name))
+                if 'Permissions' in kept or 'Permissions' in obj:
+                    kept['Permissions'] = MergePermissions(kept.get('Permissions', []), obj.get('Permissions', []))
+    return merged, sources, conflicts
 
-    debug(f"{args.action} dashboard {obj['DashboardId']}")
-    for i in ['ResponseMetadata','Status','ResourceStatus','RequestId']:
-        if i in obj: del obj[i]
-    obj['Name'] = Encapsulate(obj['Name'])
-    obj['DashboardId'] = Encapsulate(obj['DashboardId'])
-    result = None
-    try:
-        if args.action in ['delete']:
-            result = qs.delete_dashboard(AwsAccountId=args.account, DashboardId=obj['DashboardId'])
-        elif args.action in ['create']:
-            result = qs.create_dashboard( AwsAccountId=args.account, **obj)
-        elif args.action in ['update']:
-            for i in ['Permissions']:
-                if i in obj: del obj[i]
-            result = qs.update_dashboard( AwsAccountId=args.account, **obj)
-        results.append(json.dumps(result, cls=DateTimeEncoder, indent=4))
-    except Exception as e:
-        err = 0 if args.ignore else 255
-        debug(f"!! dashboard {e}", err)
-    return result
-
-# create/deploy an analysis
-def deploy_analysis(obj):
-    if not args.nofollow:
-        for d in obj['Definition']['DataSetIdentifierDeclarations']:
-            ds = d['DataSetArn'].split('/')[-1]
-            result = deploy_dataset(assets['datasets'][ds])
-            d['DataSetArn'] = result['Arn']
-
-    debug(f"{args.action} analysis {obj['AnalysisId']}")
-    for i in ['ResponseMetadata','Status','ResourceStatus','RequestId']:
-        if i in obj: del obj[i]
-    obj['Name'] = Encapsulate(obj['Name'])
-    obj['AnalysisId'] = Encapsulate(obj['AnalysisId'])
-    result = None
-    try:
-        if args.action in ['delete']:
-            result = qs.delete_analysis(AwsAccountId=args.account, AnalysisId=obj['AnalysisId'])
-        elif args.action in ['create']:
-            result = qs.create_analysis( AwsAccountId=args.account, **obj)
-        elif args.action in ['update']:
-            for i in ['Permissions']:
-                if i in obj: del obj[i]
-            result = qs.update_analysis( AwsAccountId=args.account, **obj)
-        results.append(json.dumps(result, cls=DateTimeEncoder, indent=4))
-    except Exception as e:
-        err = 0 if args.ignore else 255
-        debug(f"!! analysis {e}", err)
-    return result
-
-# create/deploy a dataset
-def deploy_dataset(obj):
-    if not args.nofollow:
-        for d in obj['PhysicalTableMap']:
-            ds = obj['PhysicalTableMap'][d]['CustomSql']['DataSourceArn'].split('/')[-1]
-            result = deploy_datasource(assets['datasources'][ds])
-            obj['PhysicalTableMap'][d]['CustomSql']['DataSourceArn'] = result['Arn']
-
-    debug(f"{args.action} dataset {obj['DataSetId']}")
-    for i in ['CreatedTime','LastUpdatedTime','Status','Arn','ConsumedSpiceCapacityInBytes','OutputColumns']:
-        if i in obj: del obj[i]
-    obj['Name'] = Encapsulate(obj['Name'])
-    obj['DataSetId'] = Encapsulate(obj['DataSetId'])
-    result = None
-    schedules = []
 
-    try:
-        if args.action in ['delete']:
-            result = qs.delete_data_set(AwsAccountId=args.account, DataSetId=obj['DataSetId'])
-        elif args.action in ['create']:
-            if 'RefreshSchedules' in obj:
-                schedules = obj['RefreshSchedules']
-                del obj['RefreshSchedules']
-            result = qs.create_data_set( AwsAccountId=args.account, **obj)
-            for s in schedules:
-                futuretime = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=5)
-                s['StartAfterDateTime'] = futuretime.astimezone(datetime.timezone.utc).replace(microsecond=0).isoformat()
-                result = qs.create_refresh_schedule(AwsAccountId=args.account, DataSetId=obj['DataSetId'], Schedule=s)
-        elif args.action in ['update']:
-            for i in ['Permissions']:
-                if i in obj: del obj[i]
-            if 'RefreshSchedules' in obj:
-                schedules = obj['RefreshSchedules']
-                del obj['RefreshSchedules']
-            result = qs.update_data_set( AwsAccountId=args.account, **obj)
-            for s in schedules:
-                futuretime = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=5)
-                s['StartAfterDateTime'] = futuretime.astimezone(datetime.timezone.utc).replace(microsecond=0).isoformat()
-                result = qs.update_refresh_schedule(AwsAccountId=args.account, DataSetId=obj['DataSetId'], Schedule=s)
-        results.append(json.dumps(result, cls=DateTimeEncoder, indent=4))
+###
+## Refresh schedule staggering - dataset refreshes run one after another
+###
 
-    except Exception as e:
-        err = 0 if args.ignore else 255
-        debug(f"!! dataset {e}", err)
-    return result
-
-# create/deploy a datasource
-def deploy_datasource(obj):
-    debug(f"{args.action} datasource {obj['DataSourceId']}")
-    for i in ['CreatedTime','LastUpdatedTime','Status', 'Arn']:
-        if i in obj: del obj[i]
-    obj['Name'] = Encapsulate(obj['Name'])
-    obj['DataSourceId'] = Encapsulate(obj['DataSourceId'])
-    result = None
-    try:
-        if args.action in ['delete']:
-            result = qs.delete_data_source(AwsAccountId=args.account, DataSourceId=obj['DataSourceId'])
-        elif args.action in ['create']:
-            result = qs.create_data_source( AwsAccountId=args.account, **obj)
-        elif args.action in ['update']:
-            for i in ['Permissions', 'Type']:
-                if i in obj: del obj[i]
-            result = qs.update_data_source( AwsAccountId=args.account, **obj)
-        results.append(json.dumps(result, cls=DateTimeEncoder, indent=4))
-    except Exception as e:
-        err = 0 if args.ignore else 255
-        debug(f"!! datasource {e}", err)
-    return result
-
-
-# create/deploy a group
-def deploy_group(obj):
-    debug(f"{args.action} group {obj['GroupName']}")
-    for i in ['CreatedTime','LastUpdatedTime','Status', 'Arn']:
-        if i in obj: del obj[i]
-    obj['GroupName'] = Encapsulate(obj['GroupName'])
-    obj['PrincipalId'] = Encapsulate(obj['PrincipalId'])
-    obj['Namespace'] = 'default'
-    result = None
-    try:
-        if args.action in ['delete']:
-            result = qs.delete_group(AwsAccountId=args.account, GroupName=obj['GroupName'], Namespace='default')
-        elif args.action in ['create']:
-            result = qs.create_group(AwsAccountId=args.account, GroupName=obj['GroupName'], Namespace='default')
-        elif args.action in ['update']:
-            for i in ['Permissions']:
-                if i in obj: del obj[i]
-            result = qs.delete_group(AwsAccountId=args.account, GroupName=obj['GroupName'], Namespace='default')
-        results.append(json.dumps(result, cls=DateTimeEncoder, indent=4))
-    except Exception as e:
-        err = 0 if args.ignore else 255
-        debug(f"!! group {e}", err)
-    return result
+# ingestion time assumed for a refresh without completed ingestions in the catalog
+DEF_REFRESH_SECONDS = 600
+
+# share of past ingestions that must fit the time allowed for a refresh
+STAGGER_PERCENTILE = 0.9
+
+# minutes since midnight of a HH:MM time of day
+def DayMinutes(s):
+    h, m = s.split(':')
+    return int(h) * 60 + int(m)
+
+# minutes to allow for a refresh, the STAGGER_PERCENTILE of the completed past
+# ingestions of the same refresh type, or of any type, None without any
+def RefreshMinutes(ingestions, refresh):
+    done = [g for g in ingestions if g.get('IngestionStatus') == 'COMPLETED' and g.get('IngestionTimeInSeconds') is not None]
+    same = [g for g in done if g.get('RequestType') == refresh]
+    seconds = sorted(g['IngestionTimeInSeconds'] for g in (same or done))
+    if not seconds: return None
+    return max(1, math.ceil(seconds[min(len(seconds) - 1, int(len(seconds) * STAGGER_PERCENTILE))] / 60))
+
+# lays refreshes, [(key, minutes)], out one after another from the start of a
+# HH:MM-HH:MM window, shortest first so most dashboards are current soonest
+# returns the start time of each, { key: HH:MM }, and the minutes left in the window
+def StaggerRefreshes(refreshes, window):
+    start, end = [DayMinutes(t) for t in window.split('-')]
+    length = (end - start) % (24 * 60) or 24 * 60
+    times = {}
+    at = 0
+    for key, minutes in sorted(refreshes, key=lambda r: r[1]):
+        times[key] = '%02d:%02d' % divmod((start + at) % (24 * 60), 60)
+        at += minutes
+    return times, length - at
+
+# incremental refreshes reload the rows whose Date, derived from the
+# event time in milliseconds, is within the lookback window
+INCREMENTAL_COLUMN = 'Date'
+INCREMENTAL_TIME = re.compile(r'(?i)from_unixtime\(\s*time\s*/\s*1000\s*\)\s+as\s+timestamp\s*\)\s+as\s+"?date"?\b')
+
+# time-based datasets refresh incrementally this often, and fully once a week on this day
+INCREMENTAL_INTERVAL = 'HOURLY'
+FULL_REFRESH_DAY = 'SUNDAY'
+
+# whether every table of a SPICE dataset has a Date column derived from the event time
+def TimeBased(obj):
+    tables = [t.get('CustomSql', {}) for t in obj.get('PhysicalTableMap', {}).values()]
+    return obj.get('ImportMode') == 'SPICE' and len(tables) > 0 and all(
+        INCREMENTAL_TIME.search(t.get('SqlQuery', '')) and { 'Name': INCREMENTAL_COLUMN, 'Type': 'DATETIME' } in t.get('Columns', [])
+        for t in tables)
+
+# configures a time-based dataset for incremental refresh of the last lookback days
+# its daily full refreshes become weekly, each with an hourly incremental refresh
+# returns whether the dataset was configured, sanitizing it again changes nothing
+def IncrementalRefresh(obj, lookback):
+    if not TimeBased(obj): return False
+    obj['DataSetRefreshProperties'] = { 'RefreshConfiguration': { 'IncrementalRefresh': { 'LookbackWindow': { 'ColumnName': INCREMENTAL_COLUMN, 'Size': lookback, 'SizeUnit': 'DAY' } } } }
+    schedules = []
+    for sched in obj.get('RefreshSchedules', []):
+        if sched.get('RefreshType') == 'INCREMENTAL_REFRESH': continue
+        schedules.append(sched)
+        frequency = sched.get('ScheduleFrequency', {})
+        if frequency.get('Interval') == 'DAILY':
+            frequency['Interval'] = 'WEEKLY'
+            frequency['RefreshOnDay'] = { 'DayOfWeek': FULL_REFRESH_DAY }
+        incremental = { 'Interval': INCREMENTAL_INTERVAL }
+        if 'Timezone' in frequency: incremental['Timezone'] = frequency['Timezone']
+        schedules.append({ 'ScheduleId': f"{sched['ScheduleId']}-incremental", 'ScheduleFrequency': incremental, 'RefreshType': 'INCREMENTAL_REFRESH' })
+    obj['RefreshSchedules'] = schedules
+    return True
 
 
 ###
-## Perform requested action directives
+## Import mode policy - SPICE or DIRECT_QUERY by volume, refresh cost and views
 ###
 
+# policy used for anything the --mode-policy file leaves out
+# max_spice_gb, max_rows - datasets larger than this are queried directly
+# max_refresh_minutes - datasets refreshing longer than this a day are queried directly
+# min_views_per_refresh - datasets viewed less than this between refreshes are queried directly
+# workgroups - athena workgroup of the datasources of each mode, left as they are if not given
+# datasets - { id: { gb, rows, refresh_minutes, views_per_day } }, gb and refresh_minutes
+#   default to the size exported with the dataset and its past ingestions in the catalog
+MODE_POLICY = { 'max_spice_gb': 500, 'max_rows': 1000000000, 'max_refresh_minutes': 240, 'min_views_per_refresh': 1, 'workgroups': {}, 'datasets': {} }
+
+# refreshes a day of each schedule interval
+REFRESHES_PER_DAY = { 'MINUTE15': 96, 'MINUTE30': 48, 'HOURLY': 24, 'DAILY': 1, 'WEEKLY': 1 / 7, 'MONTHLY': 1 / 30 }
+
+# schedule given to a dataset moved into SPICE without one
+DEFAULT_SCHEDULE = { 'ScheduleFrequency': { 'Interval': 'DAILY', 'Timezone': 'UTC', 'TimeOfTheDay': '23:59' }, 'RefreshType': 'FULL_REFRESH' }
+
+# import mode for a dataset with the given stats and refresh schedules
+# returns the mode, None to keep the current one, and the reason
+def ImportModeFor(stats, schedules, policy):
+    if stats.get('gb') is not None and stats['gb'] > policy['max_spice_gb']:
+        return 'DIRECT_QUERY', f"{stats['gb']:g} GB is over the SPICE limit of {policy['max_spice_gb']:g} GB"
+    if stats.get('rows') is not None and stats['rows'] > policy['max_rows']:
+        return 'DIRECT_QUERY', f"{stats['rows']} rows is over the SPICE limit of {policy['max_rows']} rows"
+    refreshes = sum(REFRESHES_PER_DAY.get(s.get('ScheduleFrequency', {}).get('Interval'), 1) for s in schedules) or 1
+    if stats.get('refresh_minutes') is not None and stats['refresh_minutes'] * refreshes > policy['max_refresh_minutes']:
+        return 'DIRECT_QUERY', f"refreshing takes {stats['refresh_minutes'] * refreshes:.0f} minutes a day, over {policy['max_refresh_minutes']:g}"
+    if stats.get('views_per_day') is None:
+        return None, "no views per day in the policy"
+    if stats['views_per_day'] / refreshes < policy['min_views_per_refresh']:
+        return 'DIRECT_QUERY', f"viewed {stats['views_per_day'] / refreshes:.2g} times per refresh, under {policy['min_views_per_refresh']:g}"
+    return 'SPICE', f"viewed {stats['views_per_day'] / refreshes:.2g} times per refresh"
+
+# sets the import mode of a dataset with the refresh schedules it needs, a
+# dataset queried directly is not refreshed, one moved into SPICE is refreshed daily
+def SetImportMode(obj, mode):
+    obj['ImportMode'] = mode
+    if mode in ['DIRECT_QUERY']:
+        obj.pop('RefreshSchedules', None)
+        obj.pop('DataSetRefreshProperties', None)
+    elif not obj.get('RefreshSchedules'):
+        obj['RefreshSchedules'] = [dict(DEFAULT_SCHEDULE, ScheduleId=f"{obj['DataSetId']}-daily")]
+
+
 ###
-## Enumerate assets and write catalog to a file
+## Waiter - track assets until Amazon Quicksight finishes processing them
 ###
 
-if args.action in ['list']:
-    if not len(args.type):
-        args.type = "all"
-
-    # used for lookups for retrieving dashboard versions            
-    dashboards = []
-
-    # retrieve a catalog of namespaces
-    if args.type in ['theme', 'all']:
-        list_themes()
-
-    # retrieve a catalog of namespaces
-    if args.type in ['namespace', 'all']:
-        list_namespaces()
+# asset types whose create, update and delete finish asynchronously
+WAIT_TYPES = ['analyses', 'dashboards', 'datasources']
+
+# polling interval bounds in seconds, backing off while nothing is ready
+WAIT_INTERVAL = 1.0
+WAIT_MAX_INTERVAL = 10.0
+
+# whether a tracked asset finished as intended
+def WaitSucceeded(w):
+    return w['status'] == 'DELETED' or w['status'].endswith('_SUCCESSFUL')
+
+# ingestion statuses while SPICE is still loading a dataset
+INGESTION_RUNNING = ['INITIALIZED', 'QUEUED', 'RUNNING']
+
+# tracks every asset deployed in a run until it is ready, failed or gone
+# a single poller describes all pending assets in batches on its own pool
+# and callers block only on the assets they need
+class Waiter:
+    def __init__(self, run):
+        self.run = run
+        self.cond = threading.Condition()
+        self.pending = {}
+        self.finished = {}
+        self.interval = WAIT_INTERVAL
+        self.poller = None
+
+    # start tracking an asset after its create, update or delete call returned
+    def track(self, n, action):
+        if n[0] not in WAIT_TYPES: return
+        with self.cond:
+            self.finished.pop(n, None)
+            self.pending[n] = { 'action': action, 'started': time.monotonic() }
+            self.interval = WAIT_INTERVAL
+            if not self.poller:
+                self.poller = threading.Thread(target=self.poll, daemon=True)
+                self.poller.start()
+            self.cond.notify_all()
+
+    # block until the given assets are no longer pending, returns their outcome
+    def wait(self, nodes):
+        with self.cond:
+            while any(n in self.pending for n in nodes):
+                self.cond.wait()
+            return { n: self.finished[n] for n in nodes if n in self.finished }
+
+    # block until nothing is pending, returns every outcome of the run
+    def wait_all(self):
+        with self.cond:
+            while self.pending:
+                self.cond.wait()
+            return dict(self.finished)
+
+    # status of a pending asset, None while it cannot be determined
+    def status(self, n, action):
+        try:
+            return self.run.AssetStatus(n)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ResourceNotFoundException' and action in ['delete']:
+                return 'DELETED'
+        except Exception as e:
+            self.run.debug(f"!! waiting on {n[0]} {n[1]} {e}")
+        return None
+
+    def poll(self):
+        with ThreadPoolExecutor(max_workers=self.run.args.workers) as ex:
+            while True:
+                with self.cond:
+                    if not self.pending:
+                        self.poller = None
+                        return
+                    batch = dict(self.pending)
+
+                statuses = list(ex.map(lambda n: self.status(n, batch[n]['action']), batch))
+
+                with self.cond:
+                    now = time.monotonic()
+                    for n, status in zip(batch, statuses):
+                        w = batch[n]
+                        if self.pending.get(n) is not w: continue
+                        if w['action'] in ['delete']:
+                            done = status in ['DELETED']
+                        else:
+                            done = status is not None and status.endswith(('_SUCCESSFUL', '_FAILED'))
+                        if not done and now - w['started'] > self.run.args.timeout:
+                            status, done = 'TIMEOUT', True
+                        if done:
+                            del self.pending[n]
+                            self.finished[n] = { 'action': w['action'], 'status': status, 'seconds': now - w['started'] }
+                    self.cond.notify_all()
+
+                    # new assets reset the interval while waiting
+                    interval = self.interval
+                    self.interval = min(self.interval * 1.5, WAIT_MAX_INTERVAL)
+                    self.cond.wait(interval)
 
-    # retrieve a catalog of templates
-    if args.type in ['template', 'all']:
-        list_templates()
+###
+## A single run of the tool - its options, connection, assets and results
+###
 
-    # retrieve a catalog of dashboards
-    if args.type in ['dashboard', 'all']:
-        list_dashboards()
+class Run:
+    def __init__(self, args, connection=None, label=None, bundle=None):
+        self.args = args
+        self.connection = connection
+        self.owned = connection is None
+        self.label = label
+
+        # bundle held in memory in place of the --assets file, if any
+        self.bundle = bundle
+
+        # event log of create, update and delete runs, opened by execute
+        self.log = None
+
+        # holding space for collection of assets
+        self.assets = {
+            "namespaces": {},
+            "dashboards": {},
+            "analyses": {},
+            "templates": {},
+            "datasets": {},
+            "datasources": {},
+            "groups": {}
+        }
 
-    # retrieve a catalog of analyses
-    if args.type in ['analysis', 'all']:
-        list_analyses()
-            
-    # retrieve a catalog of datasets
-    if args.type in ['dataset', 'all']:
-        list_datasets()
+        # used for lookups for retrieving dashboard versions
+        self.dashboards = []
+
+        # previous catalog for list --cached, and last update times for describe --since
+        self.cache = {}
+        self.reused = 0
+        self.since = None
+        self.updated = {}
+
+        # assets described in this run, { (type, id): future }
+        self.described = {}
+
+        # dependencies deployed in this run, { (type, id): future of the deploy result }
+        self.deployed = {}
+
+        # content hashes of the dependencies deployed successfully, { (type, id): hash }
+        self.followed = {}
+
+        # SPICE datasets created or updated in this run, [(id, time deployed)]
+        self.ingest = []
+        self.hits = 0
+        self.memolock = threading.Lock()
+
+        # bounded pool for per-asset api calls, opened by the actions that use it
+        self.pool = None
+        self.waiter = Waiter(self)
+
+    # stream an event to the log, when the run keeps one
+    def event(self, event, **fields):
+        if self.log: self.log.write(event, **fields)
+
+    # the gateway to Amazon Quicksight
+    @property
+    def qs(self):
+        return self.connection.qs
+
+    # instrumentation
+    def debug(self, x, y = 0):
+        if self.args.verbose or y == 255:
+            print(f"{self.label}: {x}" if self.label else x)
+        self.event('message', message=x)
+        if y == 0: return
+        print("!! access the help menu with -h or --help")
+        #cliparser.print_help()
+        sys.exit(255)
+
+    ###
+    ## Helper functions
+    ###
+
+    # encapsulte some string objects with prefix and/or suffix
+    def Encapsulate(self, s):
+        if len(self.args.prefix): s = '-'.join([self.args.prefix, s])
+        if len(self.args.suffix): s = '-'.join([s, self.args.suffix])
+        return s
+
+    # builds a basic permission statement for each qs asset type
+    # these are all QuickSight default permissions for an admin role
+    # please edit this or edit the bundle to alter futher
+    def BuildPermissionStatement(self, type, mode='rw', principal=None):
+
+        # quicksite asset permissions for sanitization
+        def_permissions = {
+            'ro': {
+                'dashboards': [
+                    'quicksight:DescribeDashboard',
+                    'quicksight:ListDashboardVersions',
+                    'quicksight:QueryDashboard'
+                ],
+                'analyses': [
+                    'quicksight:DescribeAnalysisPermissions',
+                    'quicksight:QueryAnalysis',
+                    'quicksight:DescribeAnalysis'
+                ],
+                'datasets': [
+                    'quicksight:DescribeDataSet',
+                    'quicksight:DescribeDataSetPermissions',
+                    'quicksight:PassDataSet',
+                    'quicksight:DescribeIngestion',
+                    'quicksight:ListIngestions'
+                ],
+                'datasources': [
+                    'quicksight:DescribeDataSource',
+                    'quicksight:DescribeDataSourcePermissions',
+                    'quicksight:PassDataSource'
+                ]
+            },
+            'rw': {
+                'dashboards': [
+                    'quicksight:DescribeDashboard',
+                    'quicksight:ListDashboardVersions',
+                    'quicksight:UpdateDashboardPermissions',
+                    'quicksight:QueryDashboard',
+                    'quicksight:UpdateDashboard',
+                    'quicksight:DeleteDashboard',
+                    'quicksight:DescribeDashboardPermissions',
+                    'quicksight:UpdateDashboardPublishedVersion'
+                ],
+                'analyses': [
+                    'quicksight:RestoreAnalysis',
+                    'quicksight:UpdateAnalysisPermissions',
+                    'quicksight:DeleteAnalysis',
+                    'quicksight:DescribeAnalysisPermissions',
+                    'quicksight:QueryAnalysis',
+                    'quicksight:DescribeAnalysis',
+                    'quicksight:UpdateAnalysis'
+                ],
+                'datasets': [
+                    'quicksight:UpdateDataSetPermissions',
+                    'quicksight:DescribeDataSet',
+                    'quicksight:DescribeDataSetPermissions',
+                    'quicksight:PassDataSet',
+                    'quicksight:DescribeIngestion',
+                    'quicksight:ListIngestions',
+                    'quicksight:UpdateDataSet',
+                    'quicksight:DeleteDataSet',
+                    'quicksight:CreateIngestion',
+                    'quicksight:CancelIngestion'
+                ],
+                'datasources': [
+                    'quicksight:UpdateDataSourcePermissions',
+                    'quicksight:DescribeDataSource',
+                    'quicksight:DescribeDataSourcePermissions',
+                    'quicksight:PassDataSource',
+                    'quicksight:UpdateDataSource',
+                    'quicksight:DeleteDataSource'
+                ]
+            }
+        }
 
-    # retrieve a catalog of datasources
-    if args.type in ['datasource', 'all']:
-        list_datasources()
+        if not mode: mode = 'rw'
+        if principal is None: principal = self.args.principal
+        return {
+            'Principal': f"{principal}",
+            'Actions': def_permissions[mode][type]
+        }
 
-    # retrieve a catalog of groups
-    if args.type in ['group', 'all']:
-        list_groups()
-
-    debug(f"exporting catalog of assets {args.catalog}")
-    with open(args.catalog, 'w') as file:
-        file.write(json.dumps(assets, cls=DateTimeEncoder, indent=4))
+    # build permissions for asset
+    def BuildPermissions(self, type):
+        perms = []
+        if self.args.principal: perms.append(self.BuildPermissionStatement(type))
+        if 'groups' in self.assets:
+            for i in self.assets['groups']:
+                perm = self.BuildPermissionStatement(type, mode='ro', principal=self.assets['groups'][i]['Arn'])
+                if perm: perms.append(perm)
+        return perms
+
+
+    # builds the string sanitizer for the current options
+    # results are memoized, bundles repeat the same names and arns throughout
+    def Sanitizer(self):
+        if self.args.asl and not self.args.slregion: self.args.slregion = self.args.asl
+        if not self.args.slregion: self.args.slregion = self.args.region # default to single region if not --slregion
+        if self.args.slregion: self.args.slregion = re.sub(r'-', '_', self.args.slregion) # sanity check
+        memo = {}
+
+        def Sanitize(dirty):
+            if dirty in memo: return memo[dirty]
+            clean = dirty
+            if SANITIZE_ANY.search(clean):
+                # sanitize arn regex - updates to current account
+                # (either --account or sts:get-caller-identity)
+                m = SANITIZE_ARN.fullmatch(clean)
+                if m: clean = f"{m.group(1)}:<aws-region>:<aws-account>:{m.group(4)}"
+                if self.args.region: clean = SANITIZE_REGION.sub(self.args.region, clean)
+                if self.args.account: clean = SANITIZE_ACCOUNT.sub(self.args.account, clean)
+                clean = SANITIZE_SLDB.sub('\\1<aws-security-lake-region>', clean)
+                if self.args.slregion: clean = SANITIZE_SLREGION.sub(self.args.slregion, clean)
+            memo[dirty] = clean
+            return clean # more clean
+
+        return Sanitize
+
+    # choose each dataset's import mode by the --mode-policy file, before any
+    # other refresh option, setting the athena workgroup of its datasources to match
+    def ApplyModePolicy(self):
+        self.debug(f"reading import mode policy {self.args.mode_policy}")
+        with open(self.args.mode_policy, 'r') as file:
+            policy = dict(MODE_POLICY, **json.loads(file.read()))
+
+        ingestions = {}
+        if os.path.exists(self.args.catalog):
+            with open(self.args.catalog, 'r') as file:
+                catalog = json.loads(file.read())
+            ingestions = { d['DataSetId']: list(d.get('Ingestions', {}).values()) for d in catalog.get('datasets', {}).values() }
+
+        modes = {}
+        for i, obj in self.assets['datasets'].items():
+            stats = dict(policy['datasets'].get(i, {}))
+            if 'gb' not in stats and obj.get('ConsumedSpiceCapacityInBytes'): stats['gb'] = obj['ConsumedSpiceCapacityInBytes'] / 1024 ** 3
+            if 'refresh_minutes' not in stats: stats['refresh_minutes'] = RefreshMinutes(ingestions.get(i, []), 'FULL_REFRESH')
+            mode, reason = ImportModeFor(stats, obj.get('RefreshSchedules', []), policy)
+            mode = mode or obj.get('ImportMode')
+            self.debug(f"dataset {i} {mode}, {reason}")
+            SetImportMode(obj, mode)
+            for ds in DataSourceRefs(obj):
+                modes.setdefault(ds, set()).add(mode)
+
+        for ds, used in modes.items():
+            workgroup = policy['workgroups'].get(next(iter(used)))
+            if ds not in self.assets['datasources'] or not workgroup: continue
+            if len(used) > 1:
+                self.debug(f"!! datasource {ds} is used in both import modes, keeping its workgroup")
+                continue
+            athena = self.assets['datasources'][ds].get('DataSourceParameters', {}).get('AthenaParameters')
+            if athena is not None: athena['WorkGroup'] = workgroup
+
+    # read the asset bundle, a copy of it when held in memory
+    def ReadAssets(self, lazy=False):
+        if self.bundle is not None:
+            return json.loads(json.dumps(self.bundle.assets, cls=DateTimeEncoder))
+        return ReadBundle(self.args.assets, lazy)
+
+    # write the asset bundle, plain json is streamed rather than built in memory
+    def WriteAssets(self):
+        if self.bundle is not None:
+            self.bundle.assets = self.assets
+            return
+        WriteBundle(self.args.assets, self.assets)
+
+    # report the per-api call counts and latency
+    def ReportCalls(self, metrics):
+        for name, a in metrics.summary()['apis'].items():
+            self.debug(f"api {name}: {a['calls']} calls, {a['outcomes'].get('throttled', 0)} throttled, {a['retries']} retries, {a['latency']['mean'] * 1000:.0f}ms mean, {a['latency']['max'] * 1000:.0f}ms max")
+
+
+    ###
+    ## list APIs to retrieve asset catalogs
+    ###
+
+    # the previous catalog entry of an asset, with the details listed for it,
+    # while its summary including LastUpdatedTime and Arn is unchanged
+    def CachedSummary(self, t, i, details):
+        cached = self.cache.get(t, {}).get(i['Arn'])
+        if not cached: return None
+        summary = { k: v for k, v in cached.items() if k not in details }
+        if json.dumps(i, cls=DateTimeEncoder, sort_keys=True) != json.dumps(summary, sort_keys=True): return None
+        self.reused += 1
+        return cached
+
+    # get a catalog of themes
+    def list_themes(self):
+        self.debug("listing themes")
+        opts = { 'MaxResults': MAX_RESULTS }
+        while True:
+            o = self.qs.list_themes(AwsAccountId=self.args.account, **opts)
+            for i in o['ThemeSummaryList']:
+                if 'themes' not in self.assets: self.assets['themes'] = {}
+                self.assets['themes'][i['Arn']] = i
+            if 'NextToken' not in o: break
+            opts['NextToken'] = o['NextToken']
+
+
+    # get a catalog of namespaces
+    def list_namespaces(self):
+        self.debug("listing namespaces")
+        opts = { 'MaxResults': MAX_RESULTS }
+        while True:
+            o = self.qs.list_namespaces(AwsAccountId=self.args.account, **opts)
+            for i in o['Namespaces']:
+                self.assets['namespaces'][i['Arn']] = i
+            if 'NextToken' not in o: break
+            opts['NextToken'] = o['NextToken']
+
+    # retrieve the versions of a template
+    def list_template_versions(self, i):
+        self.debug(f"retrieving versions for template {i['TemplateId']}")
+        sopts = { 'MaxResults': MAX_RESULTS, 'TemplateId': i['TemplateId'] }
+        while True:
+            so = self.qs.list_template_versions(AwsAccountId=self.args.account, **sopts)
+            for si in so['TemplateVersionSummaryList']:
+                self.debug(f"retrieved a version for a template {si['Arn']}")
+                if 'Versions' not in i: i['Versions'] = {}
+                i['Versions'][si['Arn']] = si
+            if 'NextToken' not in so: break
+            sopts['NextToken'] = so['NextToken']
+        return i
+
+    # get a catalog of templates
+    # versions are retrieved on the pool while paging continues, and
+    # collected in page order so the catalog is written the same each run
+    # assets unchanged since the cached catalog keep the details listed then
+    def list_templates(self):
+        self.debug("listing templates")
+        pending = []
+        opts = { 'MaxResults': MAX_RESULTS }
+        while True:
+            o = self.qs.list_templates(AwsAccountId=self.args.account, **opts)
+            for i in o['TemplateSummaryList']:
+                pending.append(self.CachedSummary('templates', i, ['Versions']) or self.pool.submit(self.list_template_versions, i))
+            if 'NextToken' not in o: break
+            opts['NextToken'] = o['NextToken']
+
+        for f in pending:
+            i = f if isinstance(f, dict) else f.result()
+            self.assets['templates'][i['Arn']] = i
+
+    # retrieve the versions of a dashboard
+    def list_dashboard_versions(self, i):
+        self.debug(f"retrieving versions for dashboard {i['DashboardId']}")
+        sopts = { 'MaxResults': MAX_RESULTS, 'DashboardId': i['DashboardId'] }
+        while True:
+            so = self.qs.list_dashboard_versions(AwsAccountId=self.args.account, **sopts)
+            for si in so['DashboardVersionSummaryList']:
+                self.debug(f"retrieved a version for a dashboard {si['Arn']}")
+                if 'Versions' not in i: i['Versions'] = {}
+                i['Versions'][si['Arn']] = si
+            if 'NextToken' not in so: break
+            sopts['NextToken'] = so['NextToken']
+        return i
+
+    # get a catalog of dashboards
+    def list_dashboards(self):
+        self.debug("listing dashboards")
+        pending = []
+        opts = { 'MaxResults': MAX_RESULTS }
+        while True:
+            o = self.qs.list_dashboards(AwsAccountId=self.args.account, **opts)
+            for i in o['DashboardSummaryList']:
+                pending.append(self.CachedSummary('dashboards', i, ['Versions']) or self.pool.submit(self.list_dashboard_versions, i))
+            if 'NextToken' not in o: break
+            opts['NextToken'] = o['NextToken']
+
+        for f in pending:
+            i = f if isinstance(f, dict) else f.result()
+            self.assets['dashboards'][i['Arn']] = i
+            self.dashboards.append(i['DashboardId'])
+
+    # get a catalog of analyses
+    def list_analyses(self):
+        self.debug("listing analyses")
+        opts = { 'MaxResults': MAX_RESULTS }
+        while True:
+            o = self.qs.list_analyses(AwsAccountId=self.args.account, **opts)
+            for i in o['AnalysisSummaryList']:
+                self.assets['analyses'][i['Arn']] = i
+            if 'NextToken' not in o: break
+            opts['NextToken'] = o['NextToken']
+
+    # retrieve the ingestions and refresh schedules of a dataset
+    def list_dataset_details(self, i):
+        self.debug(f"retrieving ingestions for dataset {i['DataSetId']}")
+        sopts = { 'MaxResults': MAX_RESULTS, 'DataSetId': i['DataSetId'] }
+        while True:
+            so = self.qs.list_ingestions(AwsAccountId=self.args.account, **sopts)
+            for si in so['Ingestions']:
+                self.debug(f"retrieved a ingestions for a dataset {si['Arn']}")
+                if 'Ingestions' not in i: i['Ingestions'] = {}
+                i['Ingestions'][si['Arn']] = si
+            if 'NextToken' not in so: break
+            sopts['NextToken'] = so['NextToken']
+
+        self.debug(f"retrieving refresh schedules for dataset {i['DataSetId']}")
+        so = self.qs.list_refresh_schedules(AwsAccountId=self.args.account, DataSetId=i['DataSetId'])
+        if 'RefreshSchedules' in so: i['RefreshSchedules'] = so['RefreshSchedules']
+        return i
+
+    # get a catalog of datasets
+    def list_datasets(self):
+        self.debug("listing datasets")
+        pending = []
+        opts = { 'MaxResults': MAX_RESULTS }
+        while True:
+            o = self.qs.list_data_sets(AwsAccountId=self.args.account, **opts)
+            for i in o['DataSetSummaries']:
+                pending.append(self.CachedSummary('datasets', i, ['Ingestions', 'RefreshSchedules']) or self.pool.submit(self.list_dataset_details, i))
+            if 'NextToken' not in o: break
+            opts['NextToken'] = o['NextToken']
+
+        for f in pending:
+            i = f if isinstance(f, dict) else f.result()
+            self.assets['datasets'][i['Arn']] = i
+
+    # get a catalog of datasources
+    def list_datasources(self):
+        self.debug("retrieving datasource catalog")
+
+        opts = { 'MaxResults': MAX_RESULTS }
+        while True:
+            o = self.qs.list_data_sources(AwsAccountId=self.args.account, **opts)
+            for i in o['DataSources']:
+                self.assets['datasources'][i['Arn']] = i
+            if 'NextToken' not in o: break
+            opts['NextToken'] = o['NextToken']
+
+
+    # get a catalog of groups
+    # bug - should cycle through above and already retreived namespace catalog
+    def list_groups(self):
+        self.debug("retrieving group catalog")
+
+        opts = { 'MaxResults': MAX_RESULTS, 'Namespace':'default' }
+        while True:
+            o = self.qs.list_groups(AwsAccountId=self.args.account, **opts)
+            for i in o['GroupList']:
+                self.assets['groups'][i['Arn']] = i
+            if 'NextToken' not in o: break
+            opts['NextToken'] = o['NextToken']
+
+
+    ###
+    ## describe APIs to retrieve asset descriptions
+    ###
+
+    # last update time of every asset of a type by id, from a single listing per run
+    # that workers describing assets of the type wait on and share
+    def LastUpdated(self, t):
+        def List():
+            api, key, idkey = {
+                'dashboards': ('list_dashboards', 'DashboardSummaryList', 'DashboardId'),
+                'analyses': ('list_analyses', 'AnalysisSummaryList', 'AnalysisId'),
+                'datasets': ('list_data_sets', 'DataSetSummaries', 'DataSetId'),
+                'datasources': ('list_data_sources', 'DataSources', 'DataSourceId')
+            }[t]
+            self.debug(f"listing {t} changed since {self.since.isoformat()}")
+            updated = {}
+            opts = { 'MaxResults': MAX_RESULTS }
+            while True:
+                o = getattr(self.qs, api)(AwsAccountId=self.args.account, **opts)
+                for i in o[key]:
+                    updated[i[idkey]] = i.get('LastUpdatedTime')
+                if 'NextToken' not in o: break
+                opts['NextToken'] = o['NextToken']
+            return updated
+
+        return self.Once(self.updated, t, List)[0]
+
+    # run a call once per key of a run registry, later requests wait on the first
+    # and share its result, returns the result and whether it was shared
+    def Once(self, registry, key, call):
+        with self.memolock:
+            f = registry.get(key)
+            owner = f is None
+            if owner:
+                f = registry[key] = Future()
+        if owner:
+            try:
+                f.set_result(call())
+            except BaseException as e:
+                f.set_exception(e)
+        return f.result(), not owner
+
+    # describe an asset once per run, later requests wait on the first and share its result
+    def Memo(self, t, i, describe):
+        asset, shared = self.Once(self.described, (t, i), lambda: describe(i))
+        if shared:
+            with self.memolock:
+                self.hits += 1
+        return asset
+
+    # describe an asset unless it is already in the bundle and unchanged since --since
+    # groups carry no update time and are always described
+    def Describe(self, t, i, describe):
+        if self.since and i in self.assets.get(t, {}) and t in ['dashboards', 'analyses', 'datasets', 'datasources']:
+            updated = self.LastUpdated(t).get(i)
+            if updated and updated <= self.since:
+                self.debug(f"keeping {t} {i}, unchanged since {self.since.isoformat()}")
+                return self.assets[t][i]
+        return self.Memo(t, i, describe)
+
+    # describe a dashboard
+    def describe_dashboard(self, i):
+        asset = None
+        try:
+            self.debug(f"retrieving dashboard definition {i}")
+            asset = self.qs.describe_dashboard_definition(AwsAccountId=self.args.account, DashboardId=i)
+            perms = self.qs.describe_dashboard_permissions(AwsAccountId=self.args.account, DashboardId=i)
+            asset['Permissions'] = perms['Permissions']
+            asset['Name'] = self.Encapsulate(asset['Name'])
+            asset['DashboardId'] = self.Encapsulate(asset['DashboardId'])
+
+            for perm in perms['Permissions']:
+                rm = re.match(r'(?i)(arn:aws:quicksight:[^:]*:[^:]*:(group)/default/(.+))', perm['Principal'])
+                if rm and rm.group(2) in ['group']:
+                    group = self.Memo('groups', rm.group(3), self.describe_group)
+
+            self.assets["dashboards"][asset["DashboardId"]] = asset
+
+        except Exception as e:
+            err = 0 if self.args.ignore else 255
+            self.debug(f"!! dashboard {e}", err)
+
+        return asset
+
+    # describe an analysis
+    def describe_analysis(self, i):
+        asset = None
+        try:
+            self.debug(f"retrieving analysis definition {i}")
+            asset = self.qs.describe_analysis_definition(AwsAccountId=self.args.account, AnalysisId=i)
+            perms = self.qs.describe_analysis_permissions(AwsAccountId=self.args.account, AnalysisId=i)
+            asset['Permissions'] = perms['Permissions']
+            asset['Name'] = self.Encapsulate(asset['Name'])
+            asset['AnalysisId'] = self.Encapsulate(asset['AnalysisId'])
+
+            for perm in perms['Permissions']:
+                rm = re.match(r'(?i)(arn:aws:quicksight:[^:]*:[^:]*:group/default/(.+))', perm['Principal'])
+                if rm and rm.group(2) in ['TestGroup']:
+                    group = self.Memo('groups', rm.group(2), self.describe_group)
+
+            self.assets["analyses"][asset["AnalysisId"]] = asset
+        except Exception as e:
+            err = 0 if self.args.ignore else 255
+            self.debug(f"!! analysis {e}", err)
+        return asset
+
+    # describe a dataset
+    def describe_dataset(self, i):
+        self.debug(f"retrieving datasets, permissions, and refresh schedule(s) {i}")
+        asset = None
+        try:
+            asset = self.qs.describe_data_set(AwsAccountId=self.args.account, DataSetId=i)['DataSet']
+            perms = self.qs.describe_data_set_permissions(AwsAccountId=self.args.account, DataSetId=i)
+            if 'Permissions' in asset: asset['Permissions'] = perms['Permissions']
+
+            for perm in perms['Permissions']:
+                rm = re.match(r'(?i)(arn:aws:quicksight:[^:]*:[^:]*:group/default/(.+))', perm['Principal'])
+                if rm and rm.group(2) in ['TestGroup']:
+                    group = self.Memo('groups', rm.group(2), self.describe_group)
+
+            ar = []
+            schedules = self.qs.list_refresh_schedules(AwsAccountId=self.args.account, DataSetId=i)
+            for schedule in schedules['RefreshSchedules']:
+                if 'ScheduleId' not in schedule: next
+                rs = self.qs.describe_refresh_schedule(AwsAccountId=self.args.account, DataSetId=i, ScheduleId=schedule['ScheduleId'])
+                if 'RefreshSchedule' in rs: ar.append(rs['RefreshSchedule'])
+            if len(ar): asset['RefreshSchedules'] = ar
+
+            asset['Name'] = self.Encapsulate(asset['Name'])
+            asset['DataSetId'] = self.Encapsulate(asset['DataSetId'])
+
+            self.assets["datasets"][i] = asset
+        except Exception as e:
+            err = 0 if self.args.ignore else 255
+            self.debug(f"!! dataset {e}", err)
+
+        return asset
+
+    # describe a datasource
+    def describe_datasource(self, i):
+        self.debug(f"retrieving datasource and permissions {i}")
+        asset = None
+        try:
+            asset = self.qs.describe_data_source(AwsAccountId=self.args.account, DataSourceId=i)['DataSource']
+            perms = self.qs.describe_data_source_permissions(AwsAccountId=self.args.account, DataSourceId=i)
+            asset['Permissions'] = perms['Permissions']
+            asset['Name'] = self.Encapsulate(asset['Name'])
+            asset['DataSourceId'] = self.Encapsulate(asset['DataSourceId'])
+
+            for perm in perms['Permissions']:
+                rm = re.match(r'(?i)(arn:aws:quicksight:[^:]*:[^:]*:group/default/(.+))', perm['Principal'])
+                if rm and rm.group(2) in ['TestGroup']:
+                    group = self.Memo('groups', rm.group(2), self.describe_group)
+
+            self.assets["datasources"][i] = asset
+        except Exception as e:
+            err = 0 if self.args.ignore else 255
+            self.debug(f"!! datasource {e}", err)
+        return asset
+
+
+    # describe a datasource
+    def describe_group(self, i):
+        self.debug(f"retrieving group {i}")
+        asset = None
+        try:
+            asset = self.qs.describe_group(AwsAccountId=self.args.account, GroupName=i, Namespace='default')['Group']
+            asset['GroupName'] = self.Encapsulate(asset['GroupName'])
+            asset['PrincipalId'] = self.Encapsulate(asset['PrincipalId'])
+
+            self.assets["groups"][i] = asset
+        except Exception as e:
+            err = 0 if self.args.ignore else 255
+            self.debug(f"!! group {e}", err)
+        return asset
+
+
+    ###
+    ## Waiter - status and reporting of tracked assets
+    ###
+
+    # current processing status of an asset
+    def AssetStatus(self, n):
+        t, i = n
+        if t == 'analyses':
+            return self.qs.describe_analysis(AwsAccountId=self.args.account, AnalysisId=i)['Analysis']['Status']
+        if t == 'dashboards':
+            return self.qs.describe_dashboard(AwsAccountId=self.args.account, DashboardId=i)['Dashboard']['Version']['Status']
+        if t == 'datasources':
+            return self.qs.describe_data_source(AwsAccountId=self.args.account, DataSourceId=i)['DataSource']['Status']
+
+    # an asset that already exists may still be processing for another run in
+    # the same process, so assets depending on it wait for it all the same
+    def TrackExisting(self, n, e):
+        if self.args.action not in ['create'] or not isinstance(e, ClientError): return
+        if e.response.get('Error', {}).get('Code') == 'ResourceExistsException':
+            self.waiter.track(n, self.args.action)
+
+    # report the outcome and time to ready of every tracked asset
+    def ReportWaits(self, finished):
+        failed = 0
+        for n, w in finished.items():
+            self.debug(f"{w['action']} {n[0]} {n[1]} {w['status']} after {w['seconds']:.1f}s")
+            self.event('finished', action=w['action'], type=n[0], id=n[1], status=w['status'], seconds=round(w['seconds'], 3))
+            if not WaitSucceeded(w): failed += 1
+        if failed:
+            err = 0 if self.args.ignore else 255
+            self.debug(f"!! {failed} asset(s) did not finish {self.args.action}", err)
+
+
+    ###
+    ## SPICE ingestion of the datasets deployed in a run
+    ###
+
+    # start ingesting a dataset, quicksight already ingests a SPICE dataset when it
+    # is created, that ingestion is followed instead of starting another one
+    def StartIngestion(self, i, started):
+        ingestions = self.qs.list_ingestions(AwsAccountId=self.args.account, DataSetId=i, MaxResults=MAX_RESULTS).get('Ingestions', [])
+        for g in ingestions:
+            if g.get('IngestionStatus') in INGESTION_RUNNING and g.get('CreatedTime', started) >= started:
+                return g['IngestionId']
+        ingestion = f"qstool-{datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%d%H%M%S%f')}"
+        self.qs.create_ingestion(AwsAccountId=self.args.account, DataSetId=i, IngestionId=ingestion, IngestionType='FULL_REFRESH')
+        return ingestion
+
+    # the ingestion of a dataset, None while it cannot be determined
+    def DescribeIngestion(self, i, ingestion):
+        try:
+            return self.qs.describe_ingestion(AwsAccountId=self.args.account, DataSetId=i, IngestionId=ingestion)['Ingestion']
+        except Exception as e:
+            self.debug(f"!! ingestion of dataset {i} {e}")
+        return None
+
+    # ingest the SPICE datasets deployed in this run, at most --ingestions at a time
+    # running ingestions are described together in batches until they finish
+    def Ingest(self):
+        queue = list(self.ingest)
+        running = {}
+        finished = {}
+        interval = WAIT_INTERVAL
+        with ThreadPoolExecutor(max_workers=self.args.workers) as ex:
+            while queue or running:
+                while queue and len(running) < self.args.ingestions:
+                    i, started = queue.pop(0)
+                    try:
+                        running[i] = { 'ingestion': self.StartIngestion(i, started), 'started': time.monotonic() }
+                        self.debug(f"ingesting dataset {i} as {running[i]['ingestion']}")
+                    except Exception as e:
+                        finished[i] = { 'ingestion': None, 'status': 'FAILED', 'seconds': 0.0, 'error': str(e) }
+                if not running: continue
+
+                time.sleep(interval)
+                batch = list(running)
+                ingestions = list(ex.map(lambda i: self.DescribeIngestion(i, running[i]['ingestion']), batch))
+
+                # finished ingestions free their slot for the next dataset and reset the interval
+                interval = min(interval * 1.5, WAIT_MAX_INTERVAL)
+                now = time.monotonic()
+                for i, g in zip(batch, ingestions):
+                    r = running[i]
+                    status = g.get('IngestionStatus') if g else None
+                    if status in INGESTION_RUNNING or status is None:
+                        if now - r['started'] <= self.args.timeout: continue
+                        status = 'TIMEOUT'
+                        try:
+                            self.qs.cancel_ingestion(AwsAccountId=self.args.account, DataSetId=i, IngestionId=r['ingestion'])
+                        except Exception as e:
+                            self.debug(f"!! cancelling ingestion of dataset {i} {e}")
+                    g = g or {}
+                    rows = g.get('RowInfo', {})
+                    error = g.get('ErrorInfo', {})
+                    finished[i] = {
+                        'ingestion': r['ingestion'],
+                        'status': status,
+                        'seconds': g.get('IngestionTimeInSeconds', now - r['started']),
+                        'rows': rows.get('RowsIngested', 0),
+                        'dropped': rows.get('RowsDropped', 0),
+                        'error': f"{error.get('Type')}: {error.get('Message')}" if error else None
+                    }
+                    del running[i]
+                    interval = WAIT_INTERVAL
+        self.ReportIngestions(finished)
+
+    # report rows, time and errors of every ingestion, any failure fails the run
+    def ReportIngestions(self, finished):
+        failed = 0
+        for i, g in finished.items():
+            self.debug(f"ingestion of dataset {i} {g['status']} after {g['seconds']:.1f}s, {g.get('rows', 0)} rows ingested, {g.get('dropped', 0)} dropped" + (f", {g['error']}" if g['error'] else ''))
+            self.event('ingestion', type='datasets', id=i, **g)
+            if g['status'] not in ['COMPLETED']: failed += 1
+        if failed:
+            self.debug(f"!! {failed} of {len(finished)} SPICE ingestion(s) did not complete", 255)
+
+
+    ###
+    ## create/update/delete APIs to provosion assets
+    ###
+
+    # log the outcome of a create, update or delete call
+    def Deployed(self, t, i, start, result=None, error=None):
+        fields = { 'action': self.args.action, 'type': t, 'id': i, 'seconds': round(time.perf_counter() - start, 3) }
+        if error is not None:
+            fields['error'] = str(error)
+        elif isinstance(result, dict):
+            fields['result'] = { k: v for k, v in result.items() if k != 'ResponseMetadata' }
+        self.event('deploy', **fields)
+
+    # deploy a dataset or datasource that other assets depend on once per run, every
+    # dependent shares the first result, None when that deploy failed and was ignored
+    def Dependency(self, t, i):
+        deploy = self.deploy_dataset if t == 'datasets' else self.deploy_datasource
+
+        # hashed before deployment strips and rewrites the asset, like those requested
+        def Deploy():
+            h = AssetHash(self.assets[t][i])
+            result = deploy(self.assets[t][i])
+            if result is not None:
+                with self.memolock:
+                    self.followed[(t, i)] = h
+            return result
+
+        result, shared = self.Once(self.deployed, (t, i), Deploy)
+        if shared:
+            self.debug(f"{t} {i} already {self.args.action}d in this run")
+        return result
+
+    # create/deploy a dashboard
+    def deploy_dashboard(self, obj):
+        if not self.args.nofollow:
+            for d in obj['Definition']['DataSetIdentifierDeclarations']:
+                ds = d['DataSetArn'].split('/')[-1]
+                result = self.Dependency('datasets', ds)
+                if result: d['DataSetArn'] = result['Arn']
+
+        self.debug(f"{self.args.action} dashboard {obj['DashboardId']}")
+        for i in ['ResponseMetadata','Status','ResourceStatus','RequestId']:
+            if i in obj: del obj[i]
+        obj['Name'] = self.Encapsulate(obj['Name'])
+        obj['DashboardId'] = self.Encapsulate(obj['DashboardId'])
+        result = None
+        start = time.perf_counter()
+        try:
+            if self.args.action in ['delete']:
+                result = self.qs.delete_dashboard(AwsAccountId=self.args.account, DashboardId=obj['DashboardId'])
+            elif self.args.action in ['create']:
+                result = self.qs.create_dashboard( AwsAccountId=self.args.account, **obj)
+            elif self.args.action in ['update']:
+                for i in ['Permissions']:
+                    if i in obj: del obj[i]
+                result = self.qs.update_dashboard( AwsAccountId=self.args.account, **obj)
+            self.waiter.track(('dashboards', obj['DashboardId']), self.args.action)
+            self.Deployed('dashboards', obj['DashboardId'], start, result)
+        except Exception as e:
+            self.Deployed('dashboards', obj['DashboardId'], start, error=e)
+            self.TrackExisting(('dashboards', obj['DashboardId']), e)
+            err = 0 if self.args.ignore else 255
+            self.debug(f"!! dashboard {e}", err)
+        return result
+
+    # create/deploy an analysis
+    def deploy_analysis(self, obj):
+        if not self.args.nofollow:
+            for d in obj['Definition']['DataSetIdentifierDeclarations']:
+                ds = d['DataSetArn'].split('/')[-1]
+                result = self.Dependency('datasets', ds)
+                if result: d['DataSetArn'] = result['Arn']
+
+        self.debug(f"{self.args.action} analysis {obj['AnalysisId']}")
+        for i in ['ResponseMetadata','Status','ResourceStatus','RequestId']:
+            if i in obj: del obj[i]
+        obj['Name'] = self.Encapsulate(obj['Name'])
+        obj['AnalysisId'] = self.Encapsulate(obj['AnalysisId'])
+        result = None
+        start = time.perf_counter()
+        try:
+            if self.args.action in ['delete']:
+                result = self.qs.delete_analysis(AwsAccountId=self.args.account, AnalysisId=obj['AnalysisId'])
+            elif self.args.action in ['create']:
+                result = self.qs.create_analysis( AwsAccountId=self.args.account, **obj)
+            elif self.args.action in ['update']:
+                for i in ['Permissions']:
+                    if i in obj: del obj[i]
+                result = self.qs.update_analysis( AwsAccountId=self.args.account, **obj)
+            self.waiter.track(('analyses', obj['AnalysisId']), self.args.action)
+            self.Deployed('analyses', obj['AnalysisId'], start, result)
+        except Exception as e:
+            self.Deployed('analyses', obj['AnalysisId'], start, error=e)
+            self.TrackExisting(('analyses', obj['AnalysisId']), e)
+            err = 0 if self.args.ignore else 255
+            self.debug(f"!! analysis {e}", err)
+        return result
+
+    # create/deploy a dataset
+    def deploy_dataset(self, obj):
+        if not self.args.nofollow:
+            for d in obj['PhysicalTableMap']:
+                ds = obj['PhysicalTableMap'][d]['CustomSql']['DataSourceArn'].split('/')[-1]
+                result = self.Dependency('datasources', ds)
+                self.waiter.wait([('datasources', self.assets['datasources'][ds]['DataSourceId'])])
+                if result: obj['PhysicalTableMap'][d]['CustomSql']['DataSourceArn'] = result['Arn']
+
+        self.debug(f"{self.args.action} dataset {obj['DataSetId']}")
+        for i in ['CreatedTime','LastUpdatedTime','Status','Arn','ConsumedSpiceCapacityInBytes','OutputColumns']:
+            if i in obj: del obj[i]
+        obj['Name'] = self.Encapsulate(obj['Name'])
+        obj['DataSetId'] = self.Encapsulate(obj['DataSetId'])
+        result = None
+        start = time.perf_counter()
+        started = datetime.datetime.now(datetime.timezone.utc)
+        schedules = []
+        refresh = obj.pop('DataSetRefreshProperties', None)
+
+        # the data set response is returned, dependents take its Arn and not a schedule's
+        try:
+            if self.args.action in ['delete']:
+                result = self.qs.delete_data_set(AwsAccountId=self.args.account, DataSetId=obj['DataSetId'])
+            elif self.args.action in ['create']:
+                if 'RefreshSchedules' in obj:
+                    schedules = obj['RefreshSchedules']
+                    del obj['RefreshSchedules']
+                result = self.qs.create_data_set( AwsAccountId=self.args.account, **obj)
+                if refresh:
+                    self.qs.put_data_set_refresh_properties(AwsAccountId=self.args.account, DataSetId=obj['DataSetId'], DataSetRefreshProperties=refresh)
+                for s in schedules:
+                    futuretime = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=5)
+                    s['StartAfterDateTime'] = futuretime.astimezone(datetime.timezone.utc).replace(microsecond=0).isoformat()
+                    self.qs.create_refresh_schedule(AwsAccountId=self.args.account, DataSetId=obj['DataSetId'], Schedule=s)
+            elif self.args.action in ['update']:
+                for i in ['Permissions']:
+                    if i in obj: del obj[i]
+                if 'RefreshSchedules' in obj:
+                    schedules = obj['RefreshSchedules']
+                    del obj['RefreshSchedules']
+                result = self.qs.update_data_set( AwsAccountId=self.args.account, **obj)
+                if obj.get('ImportMode') == 'DIRECT_QUERY':
+                    self.DropRefresh(obj['DataSetId'])
+                if refresh:
+                    self.qs.put_data_set_refresh_properties(AwsAccountId=self.args.account, DataSetId=obj['DataSetId'], DataSetRefreshProperties=refresh)
+                for s in schedules:
+                    futuretime = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=5)
+                    s['StartAfterDateTime'] = futuretime.astimezone(datetime.timezone.utc).replace(microsecond=0).isoformat()
+                    # schedules added since the last deployment, such as incremental ones, are created
+                    try:
+                        self.qs.update_refresh_schedule(AwsAccountId=self.args.account, DataSetId=obj['DataSetId'], Schedule=s)
+                    except ClientError as e:
+                        if e.response.get('Error', {}).get('Code') != 'ResourceNotFoundException': raise
+                        self.qs.create_refresh_schedule(AwsAccountId=self.args.account, DataSetId=obj['DataSetId'], Schedule=s)
+            self.Deployed('datasets', obj['DataSetId'], start, result)
+            if self.args.action in ['create', 'update'] and obj.get('ImportMode') == 'SPICE':
+                self.ingest.append((obj['DataSetId'], started))
+
+        except Exception as e:
+            self.Deployed('datasets', obj['DataSetId'], start, error=e)
+            err = 0 if self.args.ignore else 255
+            self.debug(f"!! dataset {e}", err)
+        return result
+
+    # a dataset moved to DIRECT_QUERY keeps no refresh schedules or refresh
+    # properties from when it was imported into SPICE
+    def DropRefresh(self, i):
+        for s in self.qs.list_refresh_schedules(AwsAccountId=self.args.account, DataSetId=i).get('RefreshSchedules', []):
+            self.debug(f"deleting refresh schedule {s['ScheduleId']} of dataset {i}, now queried directly")
+            self.qs.delete_refresh_schedule(AwsAccountId=self.args.account, DataSetId=i, ScheduleId=s['ScheduleId'])
+        try:
+            self.qs.delete_data_set_refresh_properties(AwsAccountId=self.args.account, DataSetId=i)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'ResourceNotFoundException': raise
+
+    # create/deploy a datasource
+    def deploy_datasource(self, obj):
+        self.debug(f"{self.args.action} datasource {obj['DataSourceId']}")
+        for i in ['CreatedTime','LastUpdatedTime','Status', 'Arn']:
+            if i in obj: del obj[i]
+        obj['Name'] = self.Encapsulate(obj['Name'])
+        obj['DataSourceId'] = self.Encapsulate(obj['DataSourceId'])
+        result = None
+        start = time.perf_counter()
+        try:
+            if self.args.action in ['delete']:
+                result = self.qs.delete_data_source(AwsAccountId=self.args.account, DataSourceId=obj['DataSourceId'])
+            elif self.args.action in ['create']:
+                result = self.qs.create_data_source( AwsAccountId=self.args.account, **obj)
+            elif self.args.action in ['update']:
+                for i in ['Permissions', 'Type']:
+                    if i in obj: del obj[i]
+                result = self.qs.update_data_source( AwsAccountId=self.args.account, **obj)
+            self.waiter.track(('datasources', obj['DataSourceId']), self.args.action)
+            self.Deployed('datasources', obj['DataSourceId'], start, result)
+        except Exception as e:
+            self.Deployed('datasources', obj['DataSourceId'], start, error=e)
+            self.TrackExisting(('datasources', obj['DataSourceId']), e)
+            err = 0 if self.args.ignore else 255
+            self.debug(f"!! datasource {e}", err)
+        return result
+
+
+    # create/deploy a group
+    def deploy_group(self, obj):
+        self.debug(f"{self.args.action} group {obj['GroupName']}")
+        for i in ['CreatedTime','LastUpdatedTime','Status', 'Arn']:
+            if i in obj: del obj[i]
+        obj['GroupName'] = self.Encapsulate(obj['GroupName'])
+        obj['PrincipalId'] = self.Encapsulate(obj['PrincipalId'])
+        obj['Namespace'] = 'default'
+        result = None
+        start = time.perf_counter()
+        try:
+            if self.args.action in ['delete']:
+                result = self.qs.delete_group(AwsAccountId=self.args.account, GroupName=obj['GroupName'], Namespace='default')
+            elif self.args.action in ['create']:
+                result = self.qs.create_group(AwsAccountId=self.args.account, GroupName=obj['GroupName'], Namespace='default')
+            elif self.args.action in ['update']:
+                for i in ['Permissions']:
+                    if i in obj: del obj[i]
+                result = self.qs.delete_group(AwsAccountId=self.args.account, GroupName=obj['GroupName'], Namespace='default')
+            self.Deployed('groups', obj['GroupName'], start, result)
+        except Exception as e:
+            self.Deployed('groups', obj['GroupName'], start, error=e)
+            err = 0 if self.args.ignore else 255
+            self.debug(f"!! group {e}", err)
+        return result
+
+
+    ###
+    ## Deployment scheduling and state
+    ###
+
+    # runs fn on every node of the graph once all of its dependencies finished
+    # (or all of its dependents when reverse, as required for deletion)
+    # independent nodes run concurrently, up to --workers at a time
+    def Schedule(self, graph, fn, reverse=False):
+        needs = {n: set() for n in graph}
+        for n, deps in graph.items():
+            for d in deps:
+                if reverse: needs[d].add(n)
+                else: needs[n].add(d)
+        unblocks = {n: [] for n in graph}
+        for n in needs:
+            for d in needs[n]:
+                unblocks[d].append(n)
+
+        # ready nodes are started in bundle order (reversed for deletion)
+        order = list(reversed(list(graph))) if reverse else list(graph)
+        rank = {n: k for k, n in enumerate(order)}
+        ready = [n for n in order if not needs[n]]
+        running = {}
+        finished = 0
+        with ThreadPoolExecutor(max_workers=self.args.workers) as ex:
+            while ready or running:
+                for n in ready:
+                    running[ex.submit(fn, n)] = n
+                ready = []
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for f in done:
+                    n = running.pop(f)
+                    f.result()
+                    finished += 1
+                    for u in unblocks[n]:
+                        needs[u].discard(n)
+                        if not needs[u]: ready.append(u)
+                ready.sort(key=rank.get)
+
+        if finished < len(graph):
+            self.debug('!! circular dependencies between assets in bundle', 255)
+
+
+    # read the deployment state, { account: { type: { id: hash } } }
+    def LoadState(self):
+        if not os.path.exists(self.args.state): return {}
+        with open(self.args.state, 'r') as file:
+            return json.loads(file.read())
+
+    # merge the changes of this run, { (type, id): hash or None }, into the
+    # deployment state as it is now, so concurrent runs keep each others changes
+    # the file is replaced only once fully written
+    def SaveState(self, changes):
+        self.debug(f"saving deployment state {self.args.state}")
+        with STATE_LOCK:
+            state = self.LoadState()
+            deployed = state.setdefault(self.args.account, {})
+            for n, h in changes.items():
+                if h is None: deployed.get(n[0], {}).pop(n[1], None)
+                else: deployed.setdefault(n[0], {})[n[1]] = h
+            with open(self.args.state + '.tmp', 'w') as file:
+                file.write(json.dumps(state, indent=4, sort_keys=True))
+            os.replace(self.args.state + '.tmp', self.args.state)
+
+
+    ###
+    ## Enumerate assets and write catalog to a file
+    ###
+
+    def action_list(self):
+        if not len(self.args.type):
+            self.args.type = "all"
+
+        # each asset type is listed on its own thread, while per-asset
+        # versions, ingestions and schedules share the bounded pool
+        listers = []
+
+        # retrieve a catalog of namespaces
+        if self.args.type in ['theme', 'all']:
+            listers.append(self.list_themes)
+
+        # retrieve a catalog of namespaces
+        if self.args.type in ['namespace', 'all']:
+            listers.append(self.list_namespaces)
+
+        # retrieve a catalog of templates
+        if self.args.type in ['template', 'all']:
+            listers.append(self.list_templates)
+
+        # retrieve a catalog of dashboards
+        if self.args.type in ['dashboard', 'all']:
+            listers.append(self.list_dashboards)
+
+        # retrieve a catalog of analyses
+        if self.args.type in ['analysis', 'all']:
+            listers.append(self.list_analyses)
+
+        # retrieve a catalog of datasets
+        if self.args.type in ['dataset', 'all']:
+            listers.append(self.list_datasets)
+
+        # retrieve a catalog of datasources
+        if self.args.type in ['datasource', 'all']:
+            listers.append(self.list_datasources)
+
+        # retrieve a catalog of groups
+        if self.args.type in ['group', 'all']:
+            listers.append(self.list_groups)
+
+        # assets deleted since are dropped, as only listed assets are kept
+        if self.args.cached and os.path.exists(self.args.catalog):
+            self.debug(f"reading cached catalog of assets {self.args.catalog}")
+            with open(self.args.catalog, 'r') as file:
+                self.cache = json.loads(file.read())
+
+        with ThreadPoolExecutor(max_workers=self.args.workers) as self.pool:
+            with ThreadPoolExecutor(max_workers=len(listers)) as lpool:
+                for f in [lpool.submit(lister) for lister in listers]:
+                    f.result()
+
+        if self.args.cached: self.debug(f"reused cached details of {self.reused} unchanged assets")
+        self.debug(f"exporting catalog of assets {self.args.catalog}")
+        with open(self.args.catalog, 'w') as file:
+            file.write(json.dumps(self.assets, cls=DateTimeEncoder, indent=4))
+
+    ###
+    ## Describe assets and save an asset bundle
+    ###
+
+    def action_describe(self):
+        if not len(self.args.ids):
+            self.debug('!! you must provide asset IDs to bundle', 255)
+
+        # only assets changed since the last export are described again,
+        # that is since the given time or since the assets file was written
+        if self.args.since is not None and (self.bundle is not None or os.path.exists(self.args.assets)):
+            if self.args.since:
+                try:
+                    self.since = datetime.datetime.fromisoformat(self.args.since).astimezone()
+                except ValueError:
+                    self.debug('!! --since must be an ISO time, such as 2023-05-01T00:00', 255)
+            elif self.bundle is None:
+                self.since = datetime.datetime.fromtimestamp(os.path.getmtime(self.args.assets), datetime.timezone.utc)
+            self.args.preopen = True
+
+        if self.args.preopen:
+            self.debug(f"preopening deployable assets from {self.args.assets}")
+            self.assets = self.ReadAssets(lazy=True)
+
+        # the latch is used to retrieve all dependent objects
+        # the latch is engaged with --follow
+        latch = False
+
+        # used for dependency tracking and lookups when using the latch
+        datasetids = []
+        datasourceids = []
+        groupids = []
+
+        # assets already in the bundle keep their place, new ones follow in the order requested
+        before = { t: list(self.assets[t]) for t in self.assets }
+
+        # describes ids on the pool, each once, the assets come back in the order given
+        def DescribeAll(t, ids, describe):
+            return [a for a in self.pool.map(lambda i: self.Describe(t, i, describe), ids) if a]
+
+        with ThreadPoolExecutor(max_workers=self.args.workers) as self.pool:
+            # exports dashboards
+            if self.args.type in ['dashboard']:
+                for asset in DescribeAll('dashboards', self.args.ids, self.describe_dashboard):
+                    if not self.args.nofollow:
+                        latch = True
+                        for x in asset['Definition']['DataSetIdentifierDeclarations']:
+                            datasetids.append(x['DataSetArn'].split('/')[-1])
+
+            # exports analyses
+            if self.args.type in ['analysis']:
+                # retrieve the analysis
+                for asset in DescribeAll('analyses', self.args.ids, self.describe_analysis):
+                    if not self.args.nofollow:
+                        latch = True
+                        for x in asset['Definition']['DataSetIdentifierDeclarations']:
+                            datasetids.append(x['DataSetArn'].split('/')[-1])
+
+            # exports datasets
+            if self.args.type in ['dataset'] or latch:
+                ids = datasetids if latch else self.args.ids
+                for asset in DescribeAll('datasets', ids, self.describe_dataset):
+                    if not self.args.nofollow:
+                        latch = True
+                        for x in asset['PhysicalTableMap']:
+                            o = asset['PhysicalTableMap'][x]
+                            datasourceids.append(o['CustomSql']['DataSourceArn'].split('/')[-1])
+
+            # exports datasources
+            if self.args.type in ['datasource'] or latch:
+                ids = datasourceids if latch else self.args.ids
+                DescribeAll('datasources', ids, self.describe_datasource)
+
+            # exports groups
+            if self.args.type in ['group'] or latch:
+                ids = groupids if latch else self.args.ids
+                DescribeAll('groups', ids, self.describe_group)
+
+        self.debug(f"described {len(self.described)} assets, {self.hits} cache hits")
+
+        # assets finish in any order on the pool, so the bundle is put back in a stable order
+        requested = self.args.ids + datasetids + datasourceids + groupids
+        for t in self.assets:
+            new = [i for i in dict.fromkeys(requested) if i in self.assets[t] and i not in before.get(t, [])]
+            rest = sorted(i for i in self.assets[t] if i not in before.get(t, []) and i not in new)
+            if isinstance(self.assets, LazyAssets):
+                self.assets[t].Reorder(before.get(t, []) + new + rest)
+            else:
+                self.assets[t] = { i: self.assets[t][i] for i in before.get(t, []) + new + rest if i in self.assets[t] }
+
+        # write collected exports to file
+        self.debug(f"exporting bundle of assets {self.args.assets}")
+        self.WriteAssets()
+
+    ###
+    ## Sanitize the asset bundle for distribution or deployment to another account.
+    ###
+
+    def action_sanitize(self):
+        self.debug(f"sanitizing asset bundle and updating permissions from asset bundle {self.args.assets}")
+
+        self.debug(f"reading asset bundle {self.args.assets}")
+        self.assets = self.ReadAssets()
+
+        # remove unnecessary data points, permissions are rebuilt below
+        self.debug(f"removing unnecessary objects")
+        strip = {
+            'dashboards': ['ResponseMetadata', 'ResourceStatus', 'RequestId', 'Status', 'Permissions'],
+            'analyses': ['ResponseMetadata', 'ResourceStatus', 'RequestId', 'Status', 'Permissions'],
+            'datasets': ['CreatedTime', 'LastModifiedTime', 'Status', 'Permissions'],
+            'datasources': ['CreatedTime', 'LastModifiedTime', 'Status', 'Permissions']
+        }
+        for t in strip:
+            for i in self.assets[t]:
+                for o in strip[t]:
+                    if o in self.assets[t][i]: del self.assets[t][i][o]
+
+        self.debug(f"performing regex replacements on all keys and strings {self.args.assets}")
+        self.assets = SanitizeTree(self.assets, self.Sanitizer())
+
+        # Security Lake queries read only the partitions of the requested days, accounts and regions
+        accounts = [a.strip() for a in self.args.accounts.split(',') if a.strip()] if self.args.accounts else None
+        regions = [r.strip() for r in self.args.regions.split(',') if r.strip()] if self.args.regions else None
+        for i in self.assets['datasets']:
+            for t in self.assets['datasets'][i].get('PhysicalTableMap', {}).values():
+                if 'SqlQuery' not in t.get('CustomSql', {}): continue
+                t['CustomSql']['SqlQuery'], skipped = PrunePartitions(t['CustomSql']['SqlQuery'], self.args.days, accounts, regions)
+                if skipped:
+                    self.debug(f"!! dataset {i} reads {skipped} Security Lake table(s) without a partition predicate that could not be added")
+
+        if self.args.mode_policy:
+            self.ApplyModePolicy()
+
+        if self.args.incremental:
+            for i in self.assets['datasets']:
+                if IncrementalRefresh(self.assets['datasets'][i], self.args.lookback):
+                    self.debug(f"dataset {i} refreshes incrementally, the last {self.args.lookback} day(s) every hour")
+
+        # correct permissions, group arns are sanitized by now
+        self.debug(f"building asset permissions")
+        for t in strip:
+            for i in self.assets[t]:
+                perms = self.BuildPermissions(t)
+                if perms: self.assets[t][i]['Permissions'] = perms
+
+        self.debug("sanitized")
+
+        # write collected exports to file, streamed rather than built in memory
+        self.debug(f"exporting bundle of assets {self.args.assets}")
+        self.WriteAssets()
+
+
+    ###
+    ## Merge asset bundles so assets shared between them are deployed once
+    ###
+
+    def action_merge(self):
+        if self.args.type not in ['all'] or not len(self.args.ids):
+            self.debug('!! merge requires type all and the asset bundle files to merge', 255)
+
+        bundles = []
+        for path in self.args.ids:
+            self.debug(f"reading asset bundle {path}")
+            bundles.append((path, ReadBundle(path)))
+
+        self.assets, sources, conflicts = MergeBundles(bundles)
+        for n, kept, other in conflicts:
+            err = 0 if self.args.ignore else 255
+            self.debug(f"!! {n[0]} {n[1]} in {other} conflicts with {kept}, keeping {kept}", err)
+
+        shared = [n for n in sources if len(sources[n]) > 1]
+        for n in shared: self.debug(f"{n[0]} {n[1]} shared by {len(sources[n])} bundles")
+        print(f"merged {len(bundles)} bundles: {len(sources)} assets, {len(shared)} shared, {len(conflicts)} conflicts")
+
+        self.debug(f"exporting bundle of assets {self.args.assets}")
+        self.WriteAssets()
+
+
+    # rewrite the refresh schedules of the bundle's datasets to run one after
+    # another within --window, timed by the past ingestions in the catalog
+    def action_stagger(self):
+        if self.args.type not in ['all', 'dataset']:
+            self.debug('!! stagger applies to the refresh schedules of datasets, use type all or dataset', 255)
+        if not re.fullmatch(r'([01]\d|2[0-3]):[0-5]\d-([01]\d|2[0-3]):[0-5]\d', self.args.window):
+            self.debug(f"!! --window must be HH:MM-HH:MM, not {self.args.window}", 255)
+
+        ingestions = {}
+        if os.path.exists(self.args.catalog):
+            self.debug(f"reading past ingestions from catalog {self.args.catalog}")
+            with open(self.args.catalog, 'r') as file:
+                catalog = json.loads(file.read())
+            ingestions = { d['DataSetId']: list(d.get('Ingestions', {}).values()) for d in catalog.get('datasets', {}).values() }
+        else:
+            self.debug(f"!! no catalog {self.args.catalog}, assuming {DEF_REFRESH_SECONDS}s for every refresh")
+
+        self.debug(f"reading deployable assets from {self.args.assets}")
+        self.assets = self.ReadAssets()
+
+        # only daily, weekly and monthly schedules run at a time of day
+        refreshes = []
+        for i, obj in self.assets.get('datasets', {}).items():
+            if self.args.ids and i not in self.args.ids: continue
+            for k, sched in enumerate(obj.get('RefreshSchedules', [])):
+                if 'TimeOfTheDay' not in sched.get('ScheduleFrequency', {}): continue
+                refreshes.append(((i, k), RefreshMinutes(ingestions.get(i, []), sched.get('RefreshType'))))
+        refreshes = [(key, minutes or math.ceil(DEF_REFRESH_SECONDS / 60), minutes is None) for key, minutes in refreshes]
+
+        times, left = StaggerRefreshes([(key, minutes) for key, minutes, _ in refreshes], self.args.window)
+        for (i, k), minutes, assumed in refreshes:
+            sched = self.assets['datasets'][i]['RefreshSchedules'][k]
+            print(f"{i} {sched.get('RefreshType')} {sched['ScheduleFrequency']['TimeOfTheDay']} -> {times[(i, k)]} (~{minutes} min{', assumed' if assumed else ''})")
+            sched['ScheduleFrequency']['TimeOfTheDay'] = times[(i, k)]
+        print(f"staggered {len(refreshes)} refreshes in {self.args.window}, {left} minutes to spare")
+        if left < 0:
+            err = 0 if self.args.ignore else 255
+            self.debug(f"!! refreshes overrun the {self.args.window} window by {-left} minutes", err)
+
+        self.debug(f"exporting bundle of assets {self.args.assets}")
+        self.WriteAssets()
+
+
+    # report scan cost risks in the CustomSql of the bundle's datasets, failing
+    # the run on findings at least as severe as --fail-on
+    def action_lint(self):
+        if self.args.type not in ['all', 'dataset']:
+            self.debug('!! lint applies to the CustomSql of datasets, use type all or dataset', 255)
+
+        self.debug(f"reading asset bundle {self.args.assets}")
+        self.assets = self.ReadAssets()
+
+        counts = { s: 0 for s in LINT_SEVERITIES }
+        datasets = self.assets.get('datasets', {})
+        for i in datasets:
+            if self.args.ids and i not in self.args.ids: continue
+            output = DatasetOutput(datasets[i])
+            findings = []
+            for table in datasets[i].get('PhysicalTableMap', {}).values():
+                if 'SqlQuery' not in table.get('CustomSql', {}): continue
+                findings += LintSql(table['CustomSql']['SqlQuery'], table['CustomSql'].get('Columns', []), output)
+            for severity, message in sorted(findings, key=lambda f: LINT_SEVERITIES.index(f[0])):
+                print(f"{severity:7} dataset {i}: {message}")
+                counts[severity] += 1
+        print(f"lint of {self.args.assets}: " + ', '.join(f"{counts[s]} {s}" for s in LINT_SEVERITIES))
+
+        if self.args.fail_on not in ['never']:
+            failing = sum(counts[s] for s in LINT_SEVERITIES[:LINT_SEVERITIES.index(self.args.fail_on) + 1])
+            if failing:
+                self.debug(f"!! {failing} lint finding(s) of severity {self.args.fail_on} or above", 255)
+
+
+    # SPICE use of the account's datasets in the catalog, { id: bytes or None }
+    def CurrentSpice(self):
+        if not os.path.exists(self.args.catalog):
+            self.debug(f"!! no catalog {self.args.catalog}, the SPICE use of datasets already in the account is not known")
+            return {}
+        self.debug(f"reading dataset SPICE use from catalog {self.args.catalog}")
+        with open(self.args.catalog, 'r') as file:
+            catalog = json.loads(file.read())
+
+        # a catalog listed in another account says nothing of this one
+        datasets = list(catalog.get('datasets', {}).values())
+        if self.args.account:
+            mine = [d for d in datasets if d.get('Arn', '').split(':')[4:5] == [self.args.account]]
+            if datasets and not mine:
+                message = f"!! catalog {self.args.catalog} lists no datasets of account {self.args.account}, the SPICE use of datasets already in the account is not known"
+                print(message)
+                self.event('message', message=message)
+            elif len(mine) < len(datasets):
+                self.debug(f"ignoring {len(datasets) - len(mine)} catalog dataset(s) of other accounts")
+            datasets = mine
+        return { d['DataSetId']: CatalogSpice(d) for d in datasets }
+
+    # compare the projected SPICE use with --spice-budget, refusing to continue
+    # when it is exceeded unless only warned
+    def SpiceBudget(self, total):
+        budget = self.args.spice_budget * 1024 ** 3
+        if total <= budget: return
+        message = f"!! projected SPICE use of {total / 1024 ** 3:.2f} GB exceeds the budget of {self.args.spice_budget:g} GB"
+        if self.args.spice_warn:
+            print(message)
+            self.event('message', message=message)
+        else:
+            self.debug(message, 255)
+
+    # report the SPICE use of every dataset in the bundle, current and estimated,
+    # and the projected use of the account once it is deployed
+    def action_capacity(self):
+        self.debug(f"reading asset bundle {self.args.assets}")
+        self.assets = self.ReadAssets()
+
+        rows, others, total = SpiceProjection(self.assets, self.CurrentSpice())
+        mb = lambda b: '-' if b is None else f"{b / 1024 ** 2:.1f}"
+        print(f"{'dataset':32} {'mode':12} {'current MB':>12} {'estimate MB':>12} estimated from")
+        for i, mode, current, estimate, source in rows:
+            print(f"{i:32} {str(mode):12} {mb(current):>12} {mb(estimate):>12} {source}")
+        unknown = [r[0] for r in rows if r[3] is None]
+        print(f"projected SPICE use {total / 1024 ** 3:.2f} GB, {others / 1024 ** 3:.2f} GB by datasets outside the bundle" + (f", {len(unknown)} dataset(s) not estimated" if unknown else ''))
+        if self.args.spice_budget is not None:
+            self.SpiceBudget(total)
+
+    # trim the bundle's datasets to the columns its analyses and dashboards use,
+    # run on a merged bundle so every asset using a dataset is taken into account
+    def action_prune(self):
+        if self.args.type not in ['all', 'dataset']:
+            self.debug('!! prune applies to the columns of datasets, use type all or dataset', 255)
+
+        self.debug(f"reading asset bundle {self.args.assets}")
+        self.assets = self.ReadAssets()
+
+        used = UsedColumns(self.assets)
+        total = 0
+        for i, obj in self.assets.get('datasets', {}).items():
+            if self.args.ids and i not in self.args.ids: continue
+            if i not in used:
+                self.debug(f"keeping every column of dataset {i}, it is not used by an analysis or dashboard definition in the bundle")
+                continue
+            dropped = PruneColumns(obj, used[i])
+            if dropped is None:
+                self.debug(f"!! keeping every column of dataset {i}, its queries or transforms cannot be pruned")
+                continue
+            print(f"dataset {i}: {len(dropped)} unused column(s) dropped" + (f", {', '.join(dropped)}" if dropped else ''))
+            total += len(dropped)
+        print(f"pruned {total} unused column(s) from {self.args.assets}")
+
+        self.debug(f"exporting bundle of assets {self.args.assets}")
+        self.WriteAssets()
+
+
+    ###
+    ## Deploy the asset bundle - create, update, or delete
+    ###
+
+    def action_plan(self):
+        self.debug(f"planning update of {self.args.assets} against deployment state {self.args.state}")
+        self.assets = self.ReadAssets()
+
+        graph = BuildDependencies(self.assets)
+        deployed = self.LoadState().get(self.args.account, {})
+        new, changed, affected = PlanChanges(graph, BundleHashes(self.assets), deployed)
+
+        # limit the report to the requested assets and what they affect
+        if self.args.type not in ['all']:
+            t = TYPE_PLURALS[self.args.type]
+            roots = [n for n in graph if n[0] == t and (not self.args.ids or n[1] in self.args.ids)]
+            scope = Downstream(graph, roots)
+            new, changed, affected = [[n for n in l if n in scope] for l in [new, changed, affected]]
+
+        for n in new: print(f"+ deploy {n[0]} {n[1]} (not yet deployed)")
+        for n in changed: print(f"~ update {n[0]} {n[1]}")
+        for n in affected: print(f"~ update {n[0]} {n[1]} (dependency changed)")
+        for t in DEPLOY_ORDER:
+            for i in deployed.get(t, {}):
+                if (t, i) not in graph: print(f"- untracked {t} {i} (not in bundle)")
+        print(f"plan for account {self.args.account}: {len(new)} new, {len(changed) + len(affected)} to update, {len(graph) - len(new) - len(changed) - len(affected)} unchanged")
+
+    def action_deploy(self):
+
+        if self.args.action in ['delete'] and not self.args.confirm:
+            self.debug('!! verify that you are DEPLOYING into the DESTINATION account')
+            self.debug('!! asset deletion requires confirmation with --confirm', 255)
+
+        # assets deployed by id are parsed only as they and their dependencies are used
+        self.debug(f"reading deployable assets from {self.args.assets}")
+        self.assets = self.ReadAssets(lazy=self.args.type not in ['all'])
+
+        # refuse to start a deployment that would run out of SPICE capacity midway
+        if self.args.spice_budget is not None and self.args.action in ['create', 'update']:
+            rows, others, total = SpiceProjection(self.assets, self.CurrentSpice())
+            self.debug(f"projected SPICE use {total / 1024 ** 3:.2f} GB of a {self.args.spice_budget:g} GB budget")
+            self.SpiceBudget(total)
+
+        # hashes are taken before deployment strips and rewrites the assets
+        if self.args.type in ['all']:
+            hashes = BundleHashes(self.assets)
+        else:
+            t = TYPE_PLURALS[self.args.type]
+            hashes = { (t, i): AssetHash(self.assets[t][i]) for i in self.args.ids if i in self.assets.get(t, {}) }
+        deployed = self.LoadState().get(self.args.account, {})
+        changes = {}
+        statelock = threading.Lock()
+
+        # track the content of a successfully deployed asset, None once deleted
+        def Track(n, result):
+            if result is None: return
+            with statelock:
+                changes[n] = None if self.args.action in ['delete'] else hashes[n]
+
+        try:
+            # deploys assets along with their dependencies
+            if self.args.type in ['dashboard']:
+                for i in self.args.ids:
+                    result = self.deploy_dashboard(self.assets['dashboards'][i])
+                    Track(('dashboards', i), result)
+            elif self.args.type in ['analysis']:
+                for i in self.args.ids:
+                    result = self.deploy_analysis(self.assets['analyses'][i])
+                    Track(('analyses', i), result)
+            elif self.args.type in ['dataset']:
+                for i in self.args.ids:
+                    result = self.deploy_dataset(self.assets['datasets'][i])
+                    Track(('datasets', i), result)
+            elif self.args.type in ['datasource']:
+                for i in self.args.ids:
+                    result = self.deploy_datasource(self.assets['datasources'][i])
+                    Track(('datasources', i), result)
+            elif self.args.type in ['group']:
+                for i in self.args.ids:
+                    result = self.deploy_group(self.assets['groups'][i])
+                    Track(('groups', i), result)
+
+            # deploy everything in the assets file
+            elif self.args.type in ['all']:
+                if not self.args.nofollow: self.args.nofollow = True
+                deployers = {
+                    'groups': self.deploy_group,
+                    'datasources': self.deploy_datasource,
+                    'datasets': self.deploy_dataset,
+                    'analyses': self.deploy_analysis,
+                    'dashboards': self.deploy_dashboard
+                }
+                graph = BuildDependencies(self.assets)
+
+                # update only what changed since the last deployment, and what uses it
+                if self.args.action in ['update'] and not self.args.force:
+                    new, changed, affected = PlanChanges(graph, hashes, deployed)
+                    touch = set(new + changed + affected)
+                    self.debug(f"updating {len(touch)} of {len(graph)} assets, the rest are unchanged")
+                    graph = { n: deps & touch for n, deps in graph.items() if n in touch }
+
+                # each asset waits only on the dependencies it needs to be ready, or
+                # when deleting, on the assets using it to be gone
+                reverse = self.args.action in ['delete']
+                needs = { n: set() for n in graph }
+                for n, deps in graph.items():
+                    for d in deps:
+                        if reverse: needs[d].add(n)
+                        else: needs[n].add(d)
+
+                def Deploy(n):
+                    for d, w in self.waiter.wait(needs[n]).items():
+                        if not WaitSucceeded(w):
+                            err = 0 if self.args.ignore else 255
+                            self.debug(f"!! skipping {n[0]} {n[1]}, {d[0]} {d[1]} is {w['status']}", err)
+                            return
+                    Track(n, deployers[n[0]](self.assets[n[0]][n[1]]))
+                self.Schedule(graph, Deploy, reverse=reverse)
+
+            # dependencies followed from the requested assets are tracked with them
+            for n, h in self.followed.items():
+                with statelock:
+                    changes[n] = None if self.args.action in ['delete'] else h
+
+            # wait for everything deployed in this run to finish, assets
+            # that failed are dropped from the state so they are retried
+            self.debug("waiting for deployed assets to finish processing")
+            finished = self.waiter.wait_all()
+            for n, w in finished.items():
+                if not WaitSucceeded(w) and w['action'] not in ['delete']:
+                    changes[n] = None
+            self.ReportWaits(finished)
+
+            if self.args.ingest and self.args.action in ['create', 'update']:
+                self.debug(f"ingesting {len(self.ingest)} SPICE dataset(s), {self.args.ingestions} at a time")
+                self.Ingest()
+
+        finally:
+            self.SaveState(changes)
+
+    ###
+    ## Perform requested action directives
+    ###
+
+    # runs the action, create, update and delete stream their events to the output log
+    def execute(self):
+        if self.args.action in ['create', 'update', 'delete']:
+            self.log = EventLog(self.args.output, self.label)
+            self.event('start', action=self.args.action, type=self.args.type, ids=self.args.ids, assets=self.args.assets)
+        started = time.perf_counter()
+        status = 255
+        try:
+            # an unexpected error ends the run like any other, with its status
+            try:
+                self.dispatch()
+            except Exception as e:
+                self.debug(f"!! {type(e).__name__}: {e}", 255)
+            status = 0
+        finally:
+            if self.log:
+                self.event('finish', status=status, seconds=round(time.perf_counter() - started, 3))
+                self.log.close()
+        return status
+
+    def dispatch(self):
+        # sanitize prefix/suffix - spaces/tabs/slashes to -
+        self.args.prefix = re.sub(r'([\s\t/]+)', '-', self.args.prefix)
+        self.args.suffix = re.sub(r'([\s\t/]+)', '-', self.args.suffix)
+
+        if self.args.prefix or self.args.suffix:
+            self.debug('!! --prefix and --suffix are only partially implemented and are not ready for use yet', 255)
+
+        if self.args.workers < 1:
+            self.debug('!! --workers must be at least 1', 255)
+
+        if self.args.rate <= 0 or self.args.retries < 0:
+            self.debug('!! --rate must be positive and --retries cannot be negative', 255)
+
+        if self.args.ingestions < 1:
+            self.debug('!! --ingestions must be at least 1', 255)
+
+        if self.args.lookback < 1:
+            self.debug('!! --lookback must be at least 1 day', 255)
+
+        if self.args.spice_budget is not None and self.args.spice_budget <= 0:
+            self.debug('!! --spice-budget must be positive', 255)
+
+        if self.args.days is not None and self.args.days < 1:
+            self.debug('!! --days must be at least 1', 255)
+
+        for a in (self.args.accounts or '').split(','):
+            if a.strip() and not re.fullmatch(r'\d{12}', a.strip()):
+                self.debug(f"!! --accounts takes 12 digit account ids, not {a.strip()}", 255)
+
+        for r in (self.args.regions or '').split(','):
+            if r.strip() and not re.fullmatch(r'[a-z]{2}(-[a-z]+)+-\d+', r.strip()):
+                self.debug(f"!! --regions takes region names such as us-east-1, not {r.strip()}", 255)
+
+        # plan works offline against the state file, so the account must be given
+        if not self.args.account and self.args.action in ['plan']:
+            self.debug('!! plan requires --account to select the deployment state', 255)
+
+        # open up client connection to Amazon Quicksight, unless shared by the caller
+        # or only working on files
+        if self.owned and self.args.action not in OFFLINE_ACTIONS:
+            self.debug("opening Amazon Quicksight connection")
+            self.connection = Connection(workers=self.args.workers, rate=self.args.rate, retries=self.args.retries)
+
+        try:
+            # attempt to get the account id if not supplied - not needed for sanitize
+            if not self.args.account and self.args.action not in OFFLINE_ACTIONS:
+                self.debug("getting account info via sts.get_caller_identity")
+                try:
+                    self.args.account = self.connection.account()
+                except Exception as e:
+                    self.debug("!! cannot call sts:get_caller_identity", 255)
+
+            if self.args.action in ['list']:
+                self.action_list()
+            elif self.args.action in ['describe']:
+                self.action_describe()
+            elif self.args.action in ['sanitize']:
+                self.action_sanitize()
+            elif self.args.action in ['merge']:
+                self.action_merge()
+            elif self.args.action in ['plan']:
+                self.action_plan()
+            elif self.args.action in ['stagger']:
+                self.action_stagger()
+            elif self.args.action in ['lint']:
+                self.action_lint()
+            elif self.args.action in ['prune']:
+                self.action_prune()
+            elif self.args.action in ['capacity']:
+                self.action_capacity()
+            elif self.args.action in ['create', 'update', 'delete']:
+                self.action_deploy()
+
+        # cleanup, a shared connection is left to its owner
+        finally:
+            if self.owned and self.connection:
+                self.ReportCalls(self.connection.metrics)
+                if self.connection.metrics.apis:
+                    self.connection.metrics.write(self.args.metrics, self.args.prometheus)
+                self.connection.close()
+
+# run the tool with command line arguments, returning its exit status
+# runs in the same process may share a connection and are told apart by label
+def main(argv=None, connection=None, label=None, bundle=None):
+    try:
+        return Run(cliparser.parse_args(argv), connection, label, bundle).execute()
+    except SystemExit as e:
+        return e.code
+    except Exception as e:
+        print(f"{label}: !! {type(e).__name__}: {e}" if label else f"!! {type(e).__name__}: {e}")
+        return 255
 
-###
-## Describe assets and save an asset bundle
-###
-
-elif args.action in ['describe']:
-    if not len(args.ids):
-        debug('!! you must provide asset IDs to bundle', 255)
-
-    if args.preopen:
-        debug(f"preopening deployable assets from {args.assets}")
-        with open(args.assets, 'r') as file:
-            assetsFile = file.read()
-        assets = json.loads(assetsFile)
-
-    # the latch is used to retrieve all dependent objects
-    # the latch is engaged with --follow
-    latch = False
-
-    # used for dependency tracking and lookups when using the latch
-    datasetids = []
-    datasourceids = []
-    groupids = []
-
-    # exports dashboards
-    if args.type in ['dashboard']:
-        for i in args.ids:
-            asset = describe_dashboard(i)
-            if not args.nofollow:
-                latch = True
-                for x in asset['Definition']['DataSetIdentifierDeclarations']:
-                    datasetids.append(x['DataSetArn'].split('/')[-1])
-
-    # exports analyses
-    if args.type in ['analysis']:
-        # retrieve the analysis
-        for i in args.ids:
-            asset = describe_analysis(i)
-            if not args.nofollow:
-                latch = True
-                for x in asset['Definition']['DataSetIdentifierDeclarations']:
-                    datasetids.append(x['DataSetArn'].split('/')[-1])
-
-    # exports datasets
-    if args.type in ['dataset'] or latch:
-        ids = datasetids if latch else args.ids
-        for i in ids:
-            asset = describe_dataset(i)
-            if not args.nofollow:
-                latch = True
-                for x in asset['PhysicalTableMap']:
-                    o = asset['PhysicalTableMap'][x]
-                    datasourceids.append(o['CustomSql']['DataSourceArn'].split('/')[-1])
-
-    # exports datasources
-    if args.type in ['datasource'] or latch:
-        ids = datasourceids if latch else args.ids
-        for i in ids:
-            asset = describe_datasource(i)
-
-    # exports groups
-    if args.type in ['group'] or latch:
-        ids = groupids if latch else args.ids
-        for i in ids:
-            asset = describe_group(i)
-
-    # write collected exports to file
-    debug(f"exporting bundle of assets {args.assets}")
-    with open(args.assets, 'w') as file:
-        file.write(json.dumps(assets, cls=DateTimeEncoder, indent=4))
-
-###
-## Sanitize the asset bundle for distribution or deployment to another account.
-###
-
-elif args.action in ['sanitize']:
-    debug(f"sanitizing asset bundle and updating permissions from asset bundle {args.assets}")
-
-    debug(f"performing full string regex replacements {args.assets}")
-    def Sanitize(dirty):
-
-        # sanitize arn regex - updates to current account
-        # (either --account or sts:get-caller-identity)
-        dirty = re.sub(r'(?i)("(arn:aws:quicksight):([^:]*):([^aws:]*):([^"]+))"', '"\\2:<aws-region>:<aws-account>:\\5"', dirty)
-        if args.region: dirty = re.sub( r'(?i)<aws-region>', f'{args.region}', dirty)
-        if args.account: dirty = re.sub( r'(?i)<aws-account>', f'{args.account}', dirty)
-
-        # correct region for Amazon Security Lake
-        # amazon_security_lake_glue_db_us_east_1
-        # amazon_security_lake_table_us_east_1_vpc_flow
-        if args.asl and not args.slregion: args.slregion = args.asl
-        if not args.slregion: args.slregion = args.region # default to single region if not --slregion
-        if args.slregion: args.slregion = re.sub(r'-', '_', args.slregion) # sanity check
-        dirty = re.sub( r'(?i)(amazon_security_lake_glue_db_)([^_]+_[^_]+_\d+)', f'\\1<aws-security-lake-region>', dirty)       # database name
-        dirty = re.sub( r'(?i)(amazon_security_lake_table_)(<aws-security-lake-region>)(_.+)', f'\\1<aws-security-lake-region>\\3', dirty)    # table name
-        if args.slregion:
-            dirty = re.sub( r'(?i)<aws-security-lake-region>', f'{args.slregion}', dirty, count=0)
-
-        return dirty # more clean
-
-    # opens, reads string, full-text-regexes, writes, and closes
-    with open(args.assets, 'r') as file:
-        dirty = file.read()
-    sanitized = Sanitize(dirty)
-    with open(args.assets, 'w') as file:
-        file.write(sanitized)
-
-    # now open and go through each object
-    debug(f"removing specific objects")
-    with open(args.assets, 'r') as file:
-        assetsFile = file.read()
-    assets = json.loads(assetsFile)
-
-    # remove unnecessary data points and correct permissions
-    debug(f"removing unnecessary dashboard objects")
-    for i in assets['dashboards']:
-        for o in ['ResponseMetadata', 'ResourceStatus', 'RequestId', 'Status', 'Permissions']:
-            if o in assets['dashboards'][i]: del assets['dashboards'][i][o]
-        perms = BuildPermissions('dashboards')
-        if perms: assets['dashboards'][i]['Permissions'] = perms
-
-    # remove unnecessary data points
-    debug(f"removing unnecessary analysis objects")
-    for i in assets['analyses']:
-        for o in ['ResponseMetadata', 'ResourceStatus', 'RequestId', 'Status', 'Permissions']:
-            if o in assets['analyses'][i]: del assets['analyses'][i][o]
-        perms = BuildPermissions('analyses')
-        if perms: assets['analyses'][i]['Permissions'] = perms
-
-    # remove unnecessary data points
-    debug(f"removing unnecessary dataset objects")
-    for i in assets['datasets']:
-        for o in ['CreatedTime', 'LastModifiedTime', 'Status', 'Permissions']:
-            if o in assets['datasets'][i]: del assets['datasets'][i][o]
-        perms = BuildPermissions('datasets')
-        if perms: assets['datasets'][i]['Permissions'] = perms
-
-    # remove unnecessary data points
-    debug(f"removing unnecessary datasource objects")
-    for i in assets['datasources']:
-        for o in ['CreatedTime', 'LastModifiedTime', 'Status', 'Permissions']:
-            if o in assets['datasources'][i]: del assets['datasources'][i][o]
-        perms = BuildPermissions('datasources')
-        if perms: assets['datasources'][i]['Permissions'] = perms
-
-    debug("sanitized")
-
-    # write collected exports to file
-    debug(f"exporting bundle of assets {args.assets}")
-    with open(args.assets, 'w') as file:
-        file.write(json.dumps(assets, cls=DateTimeEncoder, indent=4))
-
-
-###
-## Deploy the asset bundle - create, update, or delete
-###
-
-elif args.action in ['create', 'update', 'delete']:
-
-    if args.action in ['delete'] and not args.confirm:
-        debug('!! verify that you are DEPLOYING into the DESTINATION account')
-        debug('!! asset deletion requires confirmation with --confirm', 255)
-
-    debug(f"reading deployable assets from {args.assets}")
-    with open(args.assets, 'r') as file:
-        assetsFile = file.read()
-    assets = json.loads(assetsFile)
-
-    # deploys assets along with their dependencies
-    if args.type in ['dashboard']:
-        for i in args.ids:
-            result = deploy_dataset(assets['dashboards'][i])
-    elif args.type in ['analysis']:
-        for i in args.ids:
-            result = deploy_analysis(assets['analyses'][i])
-    elif args.type in ['dataset']:
-        for i in args.ids:
-            result = deploy_dataset(assets['datasets'][i])
-    elif args.type in ['datasource']:
-        for i in args.ids:
-            result = deploy_datasource(assets['datasources'][i])
-    elif args.type in ['group']:
-        for i in args.ids:
-            result = deploy_group(assets['groups'][i])
-
-    # deploy everything in the assets file
-    elif args.type in ['all']:
-        if not args.nofollow: args.nofollow = True
-        if 'groups' in assets:
-            for i in assets['groups']:
-                result = deploy_group(assets['groups'][i])
-        if 'datasources' in assets:
-            for i in assets['datasources']:
-                result = deploy_datasource(assets['datasources'][i])
-        if 'datasets' in assets:
-            for i in assets['datasets']:
-                result = deploy_dataset(assets['datasets'][i])
-        if 'analyses' in assets:
-            for i in assets['analyses']:
-                result = deploy_analysis(assets['analyses'][i])
-        if 'dashboards' in assets:
-            for i in assets['dashboards']:
-                result = deploy_dashboard(assets['dashboards'][i])
-
-    # append collected results to file
-    debug(f"appending output to {args.output}")
-    with open(args.output, 'a') as file:
-        file.write(json.dumps(results, cls=DateTimeEncoder, indent=4))
-
-
-# cleanup
-qs.close()
-exit(0)
+if __name__ == '__main__':
+    sys.exit(main())
 
 # eof
@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+#
+# Tests of the asset bundle file formats of qstool.py
+#
+#   python3 -m unittest discover tests
+#
+
+import os
+import sys
+import json
+import glob
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import qstool
+
+TEMPLATES = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'asset-templates', '*.json')))
+
+class TestPackedBundle(unittest.TestCase):
+    def test_templates(self):
+        for path in TEMPLATES:
+            with open(path, 'r') as file:
+                assets = json.loads(file.read())
+            self.assertEqual(qstool.UnpackBundle(qstool.PackBundle(assets)), assets)
+
+    def test_deterministic(self):
+        assets = { 'datasets': { 'd': { 'Name': 'x' * qstool.PACK_FRAGMENT } } }
+        self.assertEqual(qstool.PackBundle(assets), qstool.PackBundle(json.loads(json.dumps(assets))))
+
+    def test_shared_subtrees_stored_once(self):
+        visual = { 'VisualId': 'v', 'Title': 'x' * qstool.PACK_FRAGMENT }
+        one = qstool.PackBundle({ 'dashboards': { 'a': { 'Visuals': [visual] } } })
+        two = qstool.PackBundle({ 'dashboards': { 'a': { 'Visuals': [visual] }, 'b': { 'Visuals': [visual] } } })
+        self.assertLess(len(two) - len(one), len(visual['Title']) // 4)
+
+    def test_literal_ref_keys(self):
+        assets = {
+            'datasets': { 'd': { 'x': { '$ref': 'abc' }, 'y': { '$$ref': '0f' * 16 }, 'z': [{ '$ref': '0f' * 16 }] }, '$ref': {} },
+            '$ref': {}
+        }
+        self.assertEqual(qstool.UnpackBundle(qstool.PackBundle(assets)), assets)
+
+class TestMerge(unittest.TestCase):
+    def test_templates_without_conflicts(self):
+        bundles = []
+        for path in TEMPLATES:
+            with open(path, 'r') as file:
+                bundles.append((os.path.basename(path), json.loads(file.read())))
+        _, sources, conflicts = qstool.MergeBundles(bundles)
+        self.assertEqual(conflicts, [])
+        self.assertTrue(any(len(s) > 1 for s in sources.values()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+#
+# Tests of qstool.py runs against the local stand-in for Amazon Quicksight
+# of qsbench.py, in the same process with a shared connection
+#
+#   python3 -m unittest discover tests
+#
+
+import os
+import sys
+import json
+import time
+import datetime
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import qstool
+import qsbench
+
+# the stand-in, recording the arguments of every call by api
+class Recorder(qsbench.FakeQuickSight):
+    def __init__(self, size=4, latency=0):
+        self.requests = {}
+        super().__init__(size, latency, 0, 0)
+
+    def __getattr__(self, op):
+        call = super().__getattr__(op)
+        def record(**kw):
+            with self.lock:
+                self.requests.setdefault(op, []).append(kw)
+            return call(**kw)
+        return record
+
+class RunTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.fake = Recorder()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_fake(self, argv, bundle=None, workers=qstool.DEF_WORKERS):
+        files = []
+        for f in ['assets', 'catalog', 'output', 'state', 'metrics']:
+            files += [f"--{f}", os.path.join(self.tmp.name, f"{f}.json")]
+        connection = qstool.Connection(session=qsbench.FakeSession(self.fake), workers=workers)
+        return qstool.main(argv + ['--account', qsbench.FAKE_ACCOUNT, '-w', str(workers)] + files, connection, bundle=bundle)
+
+class TestFollow(RunTest):
+    def test_followed_dataset_arn(self):
+        text = (qsbench.TEMPLATES_DIR / 'executive-config.json').read_text()
+        text = text.replace('<aws-region>', qsbench.FAKE_REGION).replace('<aws-account>', qsbench.FAKE_ACCOUNT).replace('<aws-security-lake-region>', 'us_east_1')
+        bundle = qstool.Bundle(json.loads(text))
+        self.assertTrue(all(d.get('RefreshSchedules') for d in bundle.assets['datasets'].values()))
+
+        self.assertEqual(self.run_fake(['create', 'dashboard', 'SecurityExecutiveDashboard'], bundle), 0)
+        self.assertIn('create_refresh_schedule', self.fake.requests)
+        created = self.fake.requests['create_dashboard'][0]
+        for d in created['Definition']['DataSetIdentifierDeclarations']:
+            self.assertRegex(d['DataSetArn'], r':dataset/[^/]+$')
+            self.assertIn(d['DataSetArn'].split('/')[-1], bundle.assets['datasets'])
+
+class TestDescribe(RunTest):
+    def test_since_lists_once(self):
+        self.fake = Recorder(size=16, latency=0.02)
+        datasets = [f"ds-{k:05d}" for k in range(16)]
+        self.assertEqual(self.run_fake(['describe', 'dataset'] + datasets, workers=8), 0)
+        self.fake.requests = {}
+        self.assertEqual(self.run_fake(['describe', 'dataset'] + datasets + ['--since', '2024-01-01T00:00:00+00:00'], workers=8), 0)
+        self.assertEqual(len(self.fake.requests['list_data_sets']), 1)
+        self.assertNotIn('describe_data_set', self.fake.requests)
+
+# base session whose sts client takes latency seconds to assume a role
+class SlowSts:
+    profile_name = None
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.assumed = []
+        self.lock = threading.Lock()
+
+    def client(self, name, region_name=None):
+        return self
+
+    def assume_role(self, RoleArn, RoleSessionName):
+        with self.lock:
+            self.assumed.append(RoleArn)
+        time.sleep(self.latency)
+        expiry = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+        return { 'Credentials': { 'AccessKeyId': 'a', 'SecretAccessKey': 's', 'SessionToken': 't', 'Expiration': expiry } }
+
+class TestSessions(unittest.TestCase):
+    def test_assumed_once_per_role_and_in_parallel(self):
+        base = SlowSts(0.2)
+        sessions = qstool.Sessions(base)
+        roles = [f"arn:aws:iam::{a}:role/qs" for a in ['111122223333', '444455556666']] * 4
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(roles)) as pool:
+            got = list(pool.map(lambda r: sessions.get('us-east-1', r), roles))
+        self.assertLess(time.perf_counter() - start, 0.35)
+        self.assertEqual(sorted(base.assumed), sorted(set(roles)))
+        self.assertIs(got[0], got[2])
+        self.assertEqual(sessions.metrics.summary()['apis']['sts.assume_role']['calls'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+#
+# Tests of the CustomSql rewriters and lint of qstool.py, which work on
+# query text alone
+#
+#   python3 -m unittest discover tests
+#
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import qstool
+
+TABLE = 'amazon_security_lake_table_us_east_1_vpc_flow_1_0'
+PREDICATE = "eventDay >= cast(date_format(current_timestamp - INTERVAL '{}' day, '%Y%m%d%H') as varchar)"
+
+class TestPrunePartitions(unittest.TestCase):
+    def test_adds_where(self):
+        sql, skipped = qstool.PrunePartitions(f"select a from {TABLE} order by a")
+        self.assertEqual(sql, f"select a from {TABLE} WHERE {PREDICATE.format(qstool.DEF_DAYS)} order by a")
+        self.assertEqual(skipped, 0)
+
+    def test_prepends_to_where(self):
+        sql, _ = qstool.PrunePartitions(f"select a from {TABLE} v where x=1 and y=2", days=3)
+        self.assertEqual(sql, f"select a from {TABLE} v where {PREDICATE.format(3)} and x=1 and y=2")
+
+    def test_wraps_where_with_or(self):
+        sql, _ = qstool.PrunePartitions(f"select a from {TABLE} where x=1 or y=2 group by a", days=3)
+        self.assertEqual(sql, f"select a from {TABLE} where {PREDICATE.format(3)} and (x=1 or y=2) group by a")
+
+    def test_or_inside_parentheses_or_strings(self):
+        sql, _ = qstool.PrunePartitions(f"select a from {TABLE} where (x=1 or y=2) and z='or'", days=3)
+        self.assertEqual(sql, f"select a from {TABLE} where {PREDICATE.format(3)} and (x=1 or y=2) and z='or'")
+
+    def test_subquery_where_with_or(self):
+        sql, _ = qstool.PrunePartitions(f"select * from (select a from {TABLE} where x=1 or y=2) t where q=1 or r=2", days=3)
+        self.assertEqual(sql, f"select * from (select a from {TABLE} where {PREDICATE.format(3)} and (x=1 or y=2)) t where q=1 or r=2")
+
+    def test_rewrites_existing(self):
+        sql, _ = qstool.PrunePartitions(f"select a from {TABLE} where {PREDICATE.format(30)} and accountid IN ('111122223333')", days=3, regions=['us-east-1'])
+        self.assertEqual(sql, f"select a from {TABLE} where {PREDICATE.format(3)} and accountid IN ('111122223333') and region IN ('us-east-1')")
+
+    def test_existing_kept_without_options(self):
+        original = f"select a from {TABLE} where {PREDICATE.format(30)}"
+        self.assertEqual(qstool.PrunePartitions(original), (original, 0))
+
+    def test_idempotent(self):
+        for original in [f"select a from {TABLE}", f"select a from {TABLE} where x=1 or y=2", f"select a from {TABLE} v where x=1"]:
+            sql, _ = qstool.PrunePartitions(original, days=3, accounts=['111122223333'])
+            self.assertEqual(qstool.PrunePartitions(sql, days=3, accounts=['111122223333']), (sql, 0))
+
+    def test_skips_join(self):
+        original = f"select a from {TABLE} v join b on v.a = b.a"
+        self.assertEqual(qstool.PrunePartitions(original), (original, 1))
+
+class TestPruneSelect(unittest.TestCase):
+    def test_select_span(self):
+        sql = "select distinct a, (select 1 from z) as b from t"
+        start, end = qstool.SelectSpan(sql)
+        self.assertEqual(sql[start:end].strip(), "a, (select 1 from z) as b")
+
+    def test_select_span_refuses_union(self):
+        self.assertIsNone(qstool.SelectSpan("select a from t union select a from u"))
+
+    def test_removes_unused(self):
+        sql, removed = qstool.PruneSelect('select a, b as c, "d", f(x, y) as e from t', ['a', 'E'])
+        self.assertEqual(sql, "select a, f(x, y) as e from t")
+        self.assertEqual(removed, {'c', 'd'})
+
+    def test_keeps_star(self):
+        self.assertIsNone(qstool.PruneSelect("select * from t", ['a']))
+        self.assertIsNone(qstool.PruneSelect("select t.*, a from t", ['a']))
+
+class TestLintSql(unittest.TestCase):
+    def test_findings(self):
+        findings = qstool.LintSql(f"select * from {TABLE} order by a", [{ 'Name': 'a' }, { 'Name': 'b' }], {'a'})
+        self.assertEqual([s for s, _ in findings], ['error', 'warning', 'warning', 'warning'])
+        self.assertIn('without an eventDay partition predicate', findings[0][1])
+
+    def test_clean_after_prune(self):
+        sql, _ = qstool.PrunePartitions(f"select a from {TABLE} order by a limit 5")
+        self.assertEqual(qstool.LintSql(sql, [{ 'Name': 'a' }], {'a'}), [])
+
+if __name__ == '__main__':
+    unittest.main()